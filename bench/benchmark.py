@@ -0,0 +1,344 @@
+#!/usr/bin/env python2
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Times the UI's hot paths against the synthetic vboxapi in this directory,
+# reporting wall clock time and the number of (fake) COM calls made.
+#
+#   python2 bench/benchmark.py --machines 10000 --groups 500 --latency 0.00005
+#   python2 bench/benchmark.py --machines 10000 --groups 500 --depth 4 search
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import gettext
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(1, os.path.dirname(BENCH_DIR))
+
+import vboxapi
+import urwid
+
+SCREEN_SIZE = (120, 50)
+
+
+class Context(object):
+    def __init__(self, loop, ui):
+        self.loop = loop
+        self.ui = ui
+
+    @property
+    def mach_list(self):
+        return self.ui.mach_list
+
+    @property
+    def mach_info(self):
+        return self.ui.mach_info
+
+    def render(self):
+        self.ui.render(SCREEN_SIZE, focus=True)
+
+    def pump(self, until, timeout=30.0):
+        # Run main loop iterations (posted callbacks, alarms) until until()
+        # is true.  This pokes at urwid's SelectEventLoop internals, since
+        # there's no public single-step API.
+        event_loop = self.loop.event_loop
+        event_loop._did_something = False
+        deadline = time.time() + timeout
+        while not until():
+            if time.time() > deadline:
+                raise RuntimeError('Timed out waiting for the main loop')
+            event_loop._loop()
+
+
+def count_widgets(widget):
+    # The widget and everything inside it that urwid has to lay out
+    count = 1
+    if hasattr(widget, 'original_widget'):
+        count += count_widgets(widget.original_widget)
+    if hasattr(widget, 'contents'):
+        count += sum(count_widgets(child) for child, options in widget.contents)
+    return count
+
+def machine_nodes(ctx):
+    from vbcui.machine_list import MachineNode
+    return [node for node in ctx.mach_list.loaded_nodes() if isinstance(node, MachineNode)]
+
+def expand_all(ctx):
+    # Expand every group, then step through every row as if scrolling
+    from vbcui.machine_list import MachineGroupNode
+    pending = [ctx.mach_list.root]
+    while len(pending) > 0:
+        node = pending.pop()
+        if isinstance(node, MachineGroupNode):
+            node.expanded = True
+            pending.extend(node.child_nodes())
+    walker = ctx.mach_list.walker
+    walker.refresh()
+    node = ctx.mach_list.root
+    while node is not None:
+        widget, node = walker.get_next(node)
+
+
+def bench_construct(ctx):
+    from vbcui.machine_list import MachineList
+    from vbifc import VBoxWrapper
+    VBoxWrapper().drop_cache()
+    mach_list = MachineList()
+    mach_list.render((SCREEN_SIZE[0] // 3, SCREEN_SIZE[1]), focus=True)
+
+def reload(ctx):
+    # Each host's part of the tree is rebuilt as its result is posted back
+    ctx.mach_list.reload()
+    ctx.pump(lambda: len(ctx.mach_list.refreshing) == 0)
+
+def bench_reload(ctx):
+    reload(ctx)
+    ctx.render()
+
+def bench_expand(ctx):
+    reload(ctx)
+    expand_all(ctx)
+
+def show_machines(ctx, count):
+    # Without a main loop, show_machine() fetches and renders synchronously
+    from vbcui import VBCUIEventLoop
+    machines = [node.machine for node in machine_nodes(ctx)[:count]]
+    instance = VBCUIEventLoop.instance
+    VBCUIEventLoop.instance = None
+    try:
+        for machine in machines:
+            ctx.mach_info.show_machine(machine)
+            ctx.mach_info.render((SCREEN_SIZE[0] * 2 // 3, SCREEN_SIZE[1]))
+    finally:
+        VBCUIEventLoop.instance = instance
+    return len(machines)
+
+def bench_show_machine(ctx, count=50):
+    from vbifc import vb_details, vb_text
+    vb_details.invalidate_machine_details()
+    vb_text.invalidate_medium_info()
+    return show_machines(ctx, count)
+
+def bench_show_machine_rebuilt(ctx, count=50):
+    # As after machine state changes: the details are collected again,
+    # but the media they refer to haven't changed
+    from vbifc import vb_details
+    vb_details.invalidate_machine_details()
+    return show_machines(ctx, count)
+
+def bench_show_machine_cached(ctx, count=50):
+    return show_machines(ctx, count)
+
+def bench_refresh_details(ctx, count=50):
+    # Refreshing the machine that's already shown, as 'r' and machine
+    # events do, with its details already fetched
+    from vbcui import VBCUIEventLoop
+    machine = machine_nodes(ctx)[0].machine
+    instance = VBCUIEventLoop.instance
+    VBCUIEventLoop.instance = None
+    try:
+        ctx.mach_info.show_machine(machine)
+        for idx in range(count):
+            ctx.mach_info.show_machine(machine)
+            # The screen holds on to the last canvas, which is what keeps
+            # urwid's canvas cache alive between redraws
+            canvas = ctx.mach_info.render((SCREEN_SIZE[0] * 2 // 3, SCREEN_SIZE[1]))
+    finally:
+        VBCUIEventLoop.instance = instance
+    return count
+
+def bench_resize_details(ctx, count=50):
+    # Laying the same details out again at a different width each time
+    from vbcui import VBCUIEventLoop
+    machine = machine_nodes(ctx)[0].machine
+    instance = VBCUIEventLoop.instance
+    VBCUIEventLoop.instance = None
+    try:
+        ctx.mach_info.show_machine(machine)
+        for idx in range(count):
+            canvas = ctx.mach_info.render((SCREEN_SIZE[0] * 2 // 3 - idx % 20, SCREEN_SIZE[1]))
+    finally:
+        VBCUIEventLoop.instance = instance
+    return count
+
+def bench_keystroke(ctx, count=50):
+    # Time from a cursor key until the moved selection is drawn
+    reload(ctx)
+    ctx.render()
+    for idx in range(count):
+        ctx.ui.keypress(SCREEN_SIZE, 'down')
+        ctx.render()
+    return count
+
+def bench_keystroke_details(ctx, count=50):
+    # Time from a cursor key until the details pane has caught up
+    from vbifc import vb_details, vb_text
+    vb_details.invalidate_machine_details()
+    vb_text.invalidate_medium_info()
+    reload(ctx)
+    ctx.render()
+    for idx in range(count):
+        ctx.ui.keypress(SCREEN_SIZE, 'down')
+        ctx.pump(lambda: ctx.mach_info.pending is None)
+        ctx.render()
+    return count
+
+def setup_search(ctx):
+    # A freshly rebuilt list, with the index built on the search worker
+    ctx.mach_list.clear_filter()
+    ctx.mach_list.rebuild()
+    ctx.mach_list.prepare_search()
+    ctx.pump(lambda: not ctx.mach_list.indexing)
+    ctx.render()
+
+def bench_search(ctx, queries=(u'vm0001', u'os:ubu run')):
+    # Time from each typed or deleted character until the filtered list is
+    # drawn.  With --machines 10000, this is the case to keep well under a
+    # frame per keystroke.
+    keys = 0
+    for query in queries:
+        for idx in range(len(query)):
+            ctx.mach_list.set_filter(query[:idx + 1])
+            ctx.render()
+        for idx in reversed(range(len(query))):
+            ctx.mach_list.set_filter(query[:idx])
+            ctx.render()
+        keys += len(query) * 2
+    return keys
+
+def bench_search_index(ctx):
+    # What the search worker does on the first search
+    from vbifc import vb_search
+    vb_search.build_index()
+
+
+BENCHMARKS = [
+    ('construct', u'MachineList construction + first render', bench_construct),
+    ('reload', u'MachineList.reload() + render', bench_reload),
+    ('expand', u'Full tree expansion', bench_expand),
+    ('show_machine', u'MachineInfo.show_machine (cold)', bench_show_machine),
+    ('show_machine_rebuilt', u'MachineInfo.show_machine (media cached)',
+     bench_show_machine_rebuilt),
+    ('show_machine_cached', u'MachineInfo.show_machine (cached)', bench_show_machine_cached),
+    ('refresh_details', u'MachineInfo.show_machine (same machine)', bench_refresh_details),
+    ('resize_details', u'MachineInfo render at a new width', bench_resize_details),
+    ('keystroke', u'Keystroke to list render', bench_keystroke),
+    ('keystroke_details', u'Keystroke to details render', bench_keystroke_details),
+    ('search', u'Search keystroke to list render', bench_search),
+    ('search_index', u'Search index build', bench_search_index),
+]
+
+# Run before each repetition of these, without being timed
+SETUP = {
+    bench_search: setup_search,
+}
+
+
+def run_benchmark(ctx, func, repeat):
+    best = None
+    calls = None
+    top = []
+    per = 1
+    for idx in range(repeat):
+        if func in SETUP:
+            SETUP[func](ctx)
+        vboxapi.stats.reset()
+        start = time.time()
+        result = func(ctx)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+            calls = vboxapi.stats.total
+            top = vboxapi.stats.top(5)
+        if isinstance(result, int) and result > 0:
+            per = result
+    return best, calls, per, top
+
+def main(argv):
+    gettext.install('vboxcli', unicode=True)
+
+    parser = argparse.ArgumentParser(description=_(u'Benchmark vboxcli against a synthetic VirtualBox'))
+    parser.add_argument('--machines', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--attachments', type=int, default=2,
+                        help=_(u'Hard disk slots per machine'))
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help=_(u'Seconds added to every fake COM call'))
+    parser.add_argument('--hosts', type=int, default=0,
+                        help=_(u'Number of fake webservice hosts to add, each with '
+                               u'its own machines'))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--calls', action='store_true',
+                        help=_(u'Show the most frequent COM calls for each benchmark'))
+    parser.add_argument('benchmarks', nargs='*', metavar='name',
+                        help=_(u'Only run these (default: all of {})').format(
+                             u', '.join(name for name, desc, func in BENCHMARKS)))
+    args = parser.parse_args(argv[1:])
+
+    vboxapi.configure(machines=args.machines, groups=args.groups, depth=args.depth,
+                      attachments=args.attachments, latency=args.latency)
+
+    # Keep the fake machines out of the real metrics history
+    cache_dir = tempfile.mkdtemp(prefix='vboxcli-bench')
+    os.environ['XDG_CACHE_HOME'] = cache_dir
+
+    from vbifc import LOCAL_HOST, add_host
+    if args.hosts > 0:
+        add_host(LOCAL_HOST)
+        for idx in range(args.hosts):
+            add_host(u'host{}'.format(idx + 1), 'WEBSERVICE',
+                     {'url': u'http://host{}:18083/'.format(idx + 1)})
+
+    from vbcui import top_ui, VBCUIEventLoop
+    ui = top_ui.TopUI()
+    loop = VBCUIEventLoop(urwid.AttrMap(ui, 'default'))
+    ui.connect(loop)
+    ctx = Context(loop, ui)
+    ctx.pump(lambda: ui.connected)
+
+    print(u'{} machines, {} groups (depth {}), {} disk slots, {:g} s/call latency, '
+          u'{} extra hosts'.format(args.machines, args.groups, args.depth, args.attachments,
+                                   args.latency, args.hosts))
+    print(u'{:<42} {:>11} {:>11} {:>10}'.format(u'Benchmark', u'Total ms',
+                                              u'ms/op', u'COM calls'))
+    try:
+        for name, description, func in BENCHMARKS:
+            if args.benchmarks and name not in args.benchmarks:
+                continue
+            elapsed, calls, per, top = run_benchmark(ctx, func, args.repeat)
+            print(u'{:<42} {:11.1f} {:11.2f} {:10d}'.format(
+                  description, elapsed * 1000, elapsed * 1000 / per, calls))
+            if args.calls:
+                for call, count in top:
+                    print(u'    {:<38} {:10d}'.format(call, count))
+        print(u'{:<42} {:>11d}'.format(u'Row widgets alive', len(ctx.mach_list.walker._widgets)))
+        print(u'{:<42} {:>11d}'.format(u'Details pane widgets',
+                                        sum(count_widgets(widget) for widget in ctx.mach_info.info)))
+    finally:
+        for worker in loop.workers:
+            worker.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,934 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Synthetic stand-in for the VirtualBox SDK's vboxapi module.  This lets the
+# UI be exercised (and benchmarked) against very large inventories without a
+# real VirtualBox installation.  Put the directory containing this file first
+# on sys.path (or PYTHONPATH) so it shadows the real vboxapi.
+#
+# The inventory is controlled by the FAKEVBOX_* environment variables or by
+# calling configure() before the first VirtualBoxManager is created.  Every
+# property read and method call on a fake object counts as one "COM call",
+# and may optionally be slowed down by a fixed latency to mimic VBoxSVC
+# round-trips.
+
+import os
+import random
+import threading
+import time
+import uuid
+import zlib
+
+_enums = {
+    'AudioControllerType': ['AC97', 'SB16', 'HDA'],
+    'AudioDriverType': ['Null', 'WinMM', 'OSS', 'ALSA', 'DirectSound',
+                        'CoreAudio', 'MMPM', 'Pulse', 'SolAudio'],
+    'CleanupMode': ['UnregisterOnly', 'DetachAllReturnNone',
+                    'DetachAllReturnHardDisksOnly', 'Full'],
+    'CloneMode': ['MachineState', 'MachineAndChildStates', 'AllStates'],
+    'CloneOptions': ['Link', 'KeepAllMACs', 'KeepNATMACs', 'KeepDiskNames'],
+    'CPUPropertyType': ['Null', 'PAE', 'LongMode', 'TripleFaultReset'],
+    'DeviceType': ['Null', 'Floppy', 'DVD', 'HardDisk', 'Network', 'USB',
+                   'SharedFolder', 'Graphics3D'],
+    'HWVirtExPropertyType': ['Null', 'Enabled', 'VPID', 'NestedPaging',
+                             'UnrestrictedExecution', 'LargePages', 'Force'],
+    'LockType': ['Null', 'Shared', 'Write', 'VM'],
+    'MachineState': ['Null', 'PoweredOff', 'Saved', 'Teleported', 'Aborted',
+                     'Running', 'Paused', 'Stuck', 'Teleporting',
+                     'LiveSnapshotting', 'Starting', 'Stopping', 'Saving',
+                     'Restoring', 'TeleportingPausedVM', 'TeleportingIn',
+                     'FaultTolerantSyncing', 'DeletingSnapshotOnline',
+                     'DeletingSnapshotPaused', 'OnlineSnapshotting',
+                     'RestoringSnapshot', 'DeletingSnapshot', 'SettingUp',
+                     'Snapshotting'],
+    'MediumState': ['NotCreated', 'Created', 'LockedRead', 'LockedWrite',
+                    'Inaccessible', 'Creating', 'Deleting'],
+    'MediumType': ['Normal', 'Immutable', 'Writethrough', 'Shareable',
+                   'Readonly', 'MultiAttach'],
+    'MediumVariant': ['Standard', 'Diff'],
+    'NetworkAdapterType': ['Null', 'Am79C970A', 'Am79C973', 'I82540EM',
+                           'I82543GC', 'I82545EM', 'Virtio'],
+    'NetworkAttachmentType': ['Null', 'NAT', 'Bridged', 'Internal',
+                              'HostOnly', 'Generic', 'NATNetwork'],
+    'ParavirtProvider': ['None', 'Default', 'Legacy', 'Minimal', 'HyperV',
+                         'KVM'],
+    'PortMode': ['Disconnected', 'HostPipe', 'HostDevice', 'RawFile', 'TCP'],
+    'ProcessorFeature': ['HWVirtEx', 'PAE', 'LongMode', 'NestedPaging'],
+    'SessionState': ['Null', 'Unlocked', 'Locked', 'Spawning', 'Unlocking'],
+    'StorageBus': ['Null', 'IDE', 'SATA', 'SCSI', 'Floppy', 'SAS', 'USB',
+                   'PCIe'],
+    'VBoxEventType': ['Invalid', 'Any', 'Vetoable', 'MachineEvent',
+                      'SnapshotEvent', 'InputEvent', 'LastWildcard',
+                      'OnMachineStateChanged', 'OnMachineDataChanged',
+                      'OnExtraDataChanged', 'OnExtraDataCanChange',
+                      'OnMediumRegistered', 'OnMachineRegistered',
+                      'OnSessionStateChanged', 'OnSnapshotTaken',
+                      'OnSnapshotDeleted', 'OnSnapshotChanged',
+                      'OnGuestPropertyChanged', 'OnMousePointerShapeChanged',
+                      'OnMouseCapabilityChanged',
+                      'OnKeyboardLedsChanged', 'OnStateChanged',
+                      'OnAdditionsStateChanged', 'OnNetworkAdapterChanged',
+                      'OnSerialPortChanged', 'OnParallelPortChanged',
+                      'OnStorageControllerChanged', 'OnMediumChanged'],
+}
+
+
+class FakeConstants(object):
+    def __init__(self):
+        self._Values = {}
+        for enum, names in _enums.items():
+            self._Values[enum] = dict((name, idx) for idx, name in enumerate(names))
+        # As in the real SDK, CloneOptions counts from 1 (there's no
+        # option 0), and MediumVariant values are bit flags
+        self._Values['CloneOptions'] = {'Link': 1, 'KeepAllMACs': 2,
+                                        'KeepNATMACs': 3, 'KeepDiskNames': 4}
+        self._Values['MediumVariant'] = {'Standard': 0, 'Diff': 0x20000}
+
+    def __getattr__(self, attr):
+        enum, _, name = attr.partition('_')
+        try:
+            return self._Values[enum][name]
+        except KeyError:
+            raise AttributeError(attr)
+
+    def all_values(self, enum_name):
+        return dict(self._Values.get(enum_name, {}))
+
+
+class CallStats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = 0.0
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.total = 0
+            self.by_name = {}
+
+    def record(self, name):
+        with self.lock:
+            self.total += 1
+            self.by_name[name] = self.by_name.get(name, 0) + 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def top(self, count=10):
+        with self.lock:
+            items = sorted(self.by_name.items(), key=lambda kv: -kv[1])
+        return items[:count]
+
+
+stats = CallStats()
+const = FakeConstants()
+
+
+def _new_uuid():
+    # Drawn from the (seeded) module RNG, so inventories are reproducible
+    return unicode(uuid.UUID(int=random.getrandbits(128)))
+
+
+class FakeError(Exception):
+    pass
+
+
+class _FakeObject(object):
+    # Every public attribute access (property read or method lookup) is
+    # counted as one remote call.
+    def __getattribute__(self, name):
+        if not name.startswith('_'):
+            stats.record('{}.{}'.format(object.__getattribute__(self, '_iface'), name))
+        return object.__getattribute__(self, name)
+
+
+class FakeProgress(_FakeObject):
+    _iface = 'IProgress'
+
+    def __init__(self, duration=1.0, on_complete=None, fail=None, cancelable=True):
+        self._start = time.time()
+        self._duration = duration
+        self._on_complete = on_complete
+        self._fail = fail
+        self._done = False
+        self._canceled = False
+        self.cancelable = cancelable
+
+    def _update(self):
+        if not self._done and time.time() - self._start >= self._duration:
+            self._done = True
+            if self._on_complete is not None and self._fail is None:
+                self._on_complete()
+
+    @property
+    def completed(self):
+        self._update()
+        return self._done or self._canceled
+
+    @property
+    def percent(self):
+        if self._duration <= 0:
+            return 100
+        return min(100, int(100 * (time.time() - self._start) / self._duration))
+
+    @property
+    def resultCode(self):
+        return 1 if (self._fail is not None or self._canceled) else 0
+
+    @property
+    def errorInfo(self):
+        return FakeErrorInfo(self._fail or u'Operation canceled')
+
+    def waitForCompletion(self, timeout):
+        end = time.time() + (timeout / 1000.0 if timeout >= 0 else 1e9)
+        while not self.completed and time.time() < end:
+            time.sleep(0.01)
+
+    def cancel(self):
+        self._canceled = True
+
+
+class FakeErrorInfo(_FakeObject):
+    _iface = 'IVirtualBoxErrorInfo'
+
+    def __init__(self, text):
+        self.component = u'FakeVBox'
+        self.text = text
+
+
+class FakeVRDEServer(_FakeObject):
+    _iface = 'IVRDEServer'
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+
+    def getVRDEProperty(self, key):
+        return u'3389'
+
+
+class FakeAudioAdapter(_FakeObject):
+    _iface = 'IAudioAdapter'
+
+    def __init__(self):
+        self.enabled = True
+        self.audioDriver = const.AudioDriverType_Pulse
+        self.audioController = const.AudioControllerType_HDA
+
+
+class FakeNetworkAdapter(_FakeObject):
+    _iface = 'INetworkAdapter'
+
+    def __init__(self, slot, enabled):
+        self.slot = slot
+        self.enabled = enabled
+        self.adapterType = const.NetworkAdapterType_I82540EM
+        self.attachmentType = const.NetworkAttachmentType_NAT
+        self.bridgedInterface = u'eth0'
+        self.internalNetwork = u'intnet'
+        self.hostOnlyInterface = u'vboxnet0'
+        self.genericDriver = u''
+        self.NATNetwork = u''
+        self.MACAddress = u'080027{:06X}'.format(random.randint(0, 0xffffff))
+
+    def getProperties(self, names):
+        return [], []
+
+
+class FakePort(_FakeObject):
+    _iface = 'ISerialPort'
+
+    def __init__(self, slot, irq, iobase):
+        self.slot = slot
+        self.enabled = slot == 0
+        self.IRQ = irq
+        self.IOBase = iobase
+        self.hostMode = const.PortMode_Disconnected
+        self.path = u''
+
+
+class FakeStorageController(_FakeObject):
+    _iface = 'IStorageController'
+
+    def __init__(self, name, bus):
+        self.name = name
+        self.bus = bus
+
+
+class FakeMedium(_FakeObject):
+    _iface = 'IMedium'
+
+    def __init__(self, name, device_type, size, parent=None):
+        self.id = _new_uuid()
+        self.name = name
+        self.description = u''
+        self.location = u'/vms/' + name
+        self.hostDrive = False
+        self.deviceType = device_type
+        self.type = const.MediumType_Normal
+        self.state = const.MediumState_Created
+        self.size = size // 4
+        self.logicalSize = size
+        self.parent = parent
+        self.children = []
+        self.machineIds = []
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def base(self):
+        medium = self
+        while medium.parent is not None:
+            medium = medium.parent
+        return medium
+
+    def getEncryptionSettings(self):
+        raise FakeError(u'Medium is not encrypted')
+
+    def getProperties(self, names):
+        return [], []
+
+    def refreshState(self):
+        return self.state
+
+
+class FakeMediumAttachment(_FakeObject):
+    _iface = 'IMediumAttachment'
+
+    def __init__(self, machine, controller, port, device, medium, device_type):
+        self.machine = machine
+        self.controller = controller
+        self.port = port
+        self.device = device
+        self.medium = medium
+        self.type = device_type
+
+
+class FakeUSBFilters(_FakeObject):
+    _iface = 'IUSBDeviceFilters'
+
+    def __init__(self):
+        self.deviceFilters = []
+
+
+class FakeSharedFolder(_FakeObject):
+    _iface = 'ISharedFolder'
+
+    def __init__(self, name):
+        self.name = name
+        self.hostPath = u'/srv/' + name
+        self.writable = True
+        self.autoMount = False
+
+
+class FakeSnapshot(_FakeObject):
+    _iface = 'ISnapshot'
+
+    def __init__(self, machine, name, parent=None):
+        self.id = _new_uuid()
+        self.name = name
+        self.description = u''
+        self.timeStamp = int(time.time() * 1000)
+        self.online = False
+        self.machine = machine
+        self.parent = parent
+        self.children = []
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def childrenCount(self):
+        return len(self.children)
+
+    def getChildrenCount(self):
+        return len(object.__getattribute__(self, 'children'))
+
+
+class FakeConsole(_FakeObject):
+    _iface = 'IConsole'
+
+    def __init__(self, machine):
+        self._machine = machine
+
+    def pause(self):
+        self._machine._set_state(const.MachineState_Paused)
+
+    def resume(self):
+        self._machine._set_state(const.MachineState_Running)
+
+    def powerButton(self):
+        self._machine._set_state(const.MachineState_PoweredOff)
+
+    def powerDown(self):
+        machine = self._machine
+        return FakeProgress(0.2, lambda: machine._set_state(const.MachineState_PoweredOff))
+
+
+class FakeSession(_FakeObject):
+    _iface = 'ISession'
+
+    def __init__(self):
+        self.state = const.SessionState_Unlocked
+        self.machine = None
+        self.console = None
+
+    def unlockMachine(self):
+        if self.state != const.SessionState_Locked:
+            raise FakeError(u'Session is not locked')
+        self.state = const.SessionState_Unlocked
+        self.machine = None
+        self.console = None
+
+
+class FakeMachine(_FakeObject):
+    _iface = 'IMachine'
+
+    def __init__(self, vbox, name, groups):
+        self._vbox = vbox
+        self.id = _new_uuid()
+        self.name = name
+        self.groups = groups
+        self.accessible = True
+        self.description = u''
+        self.OSTypeId = u'Ubuntu_64'
+        self.memorySize = 1024
+        self.CPUCount = 1
+        self.CPUExecutionCap = 100
+        self.VRAMSize = 16
+        self.monitorCount = 1
+        self.VRDEServer = FakeVRDEServer(False)
+        self.videoCaptureEnabled = False
+        self.videoCaptureFile = u''
+        self.audioAdapter = FakeAudioAdapter()
+        self.chipsetType = 1
+        self.USBDeviceFilters = FakeUSBFilters()
+        self.USBProxyAvailable = True
+        self.USBControllers = []
+        self.sharedFolders = []
+        self.settingsFilePath = u'/vms/{0}/{0}.vbox'.format(name)
+        self.sessionState = const.SessionState_Unlocked
+        self.state = const.MachineState_PoweredOff
+        self.lastStateChange = int(time.time() * 1000)
+        self.storageControllers = []
+        self.currentSnapshot = None
+        self.snapshotCount = 0
+        self._attachments = {}
+        self._adapters = [FakeNetworkAdapter(slot, slot == 0) for slot in range(8)]
+        self._serial = [FakePort(0, 4, 0x3f8), FakePort(1, 3, 0x2f8)]
+        self._parallel = [FakePort(0, 7, 0x378), FakePort(1, 5, 0x278)]
+        self._extra = {}
+        self._log = []
+
+    def _set_state(self, state):
+        object.__setattr__(self, 'state', state)
+        object.__setattr__(self, 'lastStateChange', int(time.time() * 1000))
+        self._vbox._fire('OnMachineStateChanged', machineId=self.id, state=state)
+
+    def _add_controller(self, name, bus):
+        controller = FakeStorageController(name, bus)
+        self.storageControllers.append(controller)
+        self._attachments[name] = []
+        return controller
+
+    def _attach(self, controller, port, device, medium, device_type):
+        self._attachments[controller.name].append(
+            FakeMediumAttachment(self, controller.name, port, device, medium, device_type))
+        if medium is not None:
+            medium.machineIds.append(self.id)
+
+    def getMediumAttachmentsOfController(self, name):
+        return list(self._attachments.get(name, []))
+
+    @property
+    def mediumAttachments(self):
+        result = []
+        for name in self._attachments:
+            result.extend(self._attachments[name])
+        return result
+
+    def getBootOrder(self, position):
+        return [const.DeviceType_Floppy, const.DeviceType_DVD,
+                const.DeviceType_HardDisk, const.DeviceType_Null][position - 1]
+
+    def getHWVirtExProperty(self, prop):
+        return True
+
+    def getCPUProperty(self, prop):
+        return prop == const.CPUPropertyType_PAE
+
+    def getEffectiveParavirtProvider(self):
+        return const.ParavirtProvider_KVM
+
+    def getNetworkAdapter(self, slot):
+        return self._adapters[slot]
+
+    def getSerialPort(self, slot):
+        return self._serial[slot]
+
+    def getParallelPort(self, slot):
+        return self._parallel[slot]
+
+    def getExtraData(self, key):
+        return self._extra.get(key, u'')
+
+    def setExtraData(self, key, value):
+        self._extra[key] = value
+        self._vbox._fire('OnExtraDataChanged', machineId=self.id, key=key, value=value)
+
+    @property
+    def settingsModified(self):
+        # Like the real SDK, only a session's machine is mutable enough to
+        # be asked; the registered IMachine refuses
+        raise FakeError(u'The machine is not mutable (state {})'.format(self.state))
+
+    def lockMachine(self, session, lock_type):
+        if session.state == const.SessionState_Locked:
+            raise FakeError(u'Session is already locked')
+        object.__setattr__(session, 'state', const.SessionState_Locked)
+        object.__setattr__(session, 'machine', self)
+        object.__setattr__(session, 'console', FakeConsole(self))
+
+    def launchVMProcess(self, session, vmtype, env):
+        if self.state not in {const.MachineState_PoweredOff,
+                              const.MachineState_Saved,
+                              const.MachineState_Aborted}:
+            raise FakeError(u'Machine is already running')
+        object.__setattr__(session, 'state', const.SessionState_Locked)
+        object.__setattr__(session, 'machine', self)
+        object.__setattr__(session, 'console', FakeConsole(self))
+        self._set_state(const.MachineState_Starting)
+        return FakeProgress(_config['launch_time'],
+                            lambda: self._set_state(const.MachineState_Running))
+
+    def saveState(self):
+        self._set_state(const.MachineState_Saving)
+        return FakeProgress(_config['launch_time'],
+                            lambda: self._set_state(const.MachineState_Saved))
+
+    def takeSnapshot(self, name, description, pause):
+        snap = FakeSnapshot(self, name, self.currentSnapshot)
+        snap.description = description
+        snap.online = self.state in {const.MachineState_Running, const.MachineState_Paused}
+        object.__setattr__(self, 'currentSnapshot', snap)
+        object.__setattr__(self, 'snapshotCount', self.snapshotCount + 1)
+        return (FakeProgress(0.3), snap.id)
+
+    def findSnapshot(self, name_or_id):
+        # The search happens inside VBoxSVC, so it isn't counted as calls
+        get = object.__getattribute__
+        root = get(self, 'currentSnapshot')
+        if root is None:
+            raise FakeError(u'No snapshots')
+        while get(root, 'parent') is not None:
+            root = get(root, 'parent')
+        if name_or_id in {None, u''}:
+            return root
+        todo = [root]
+        while todo:
+            snap = todo.pop()
+            if name_or_id in {get(snap, 'id'), get(snap, 'name')}:
+                return snap
+            todo.extend(get(snap, 'children'))
+        raise FakeError(u'Snapshot not found')
+
+    def restoreSnapshot(self, snapshot):
+        object.__setattr__(self, 'currentSnapshot', snapshot)
+        return FakeProgress(0.3)
+
+    def deleteSnapshot(self, snap_id):
+        snap = self.findSnapshot(snap_id)
+        if snap.parent is not None:
+            snap.parent.children.remove(snap)
+            snap.parent.children.extend(snap.children)
+        for child in snap.children:
+            object.__setattr__(child, 'parent', snap.parent)
+        if self.currentSnapshot is snap:
+            object.__setattr__(self, 'currentSnapshot', snap.parent)
+        object.__setattr__(self, 'snapshotCount', self.snapshotCount - 1)
+        return FakeProgress(0.3)
+
+    def cloneTo(self, target, mode, options):
+        def copy_disks():
+            # Each hard disk is copied, so there's something to clean up
+            sata = target._add_controller(u'SATA', const.StorageBus_SATA)
+            for att in self.mediumAttachments:
+                if att.medium is not None and att.type == const.DeviceType_HardDisk:
+                    disk = FakeMedium(u'{}-disk{}.vdi'.format(target.name, att.port),
+                                      const.DeviceType_HardDisk, att.medium.logicalSize)
+                    target._attach(sata, att.port, att.device, disk, const.DeviceType_HardDisk)
+        return FakeProgress(_config['launch_time'], on_complete=copy_disks)
+
+    def unregister(self, cleanup_mode):
+        if self not in self._vbox.machines:
+            raise FakeError(u'The machine is not registered')
+        self._vbox.machines.remove(self)
+        self._vbox._fire('OnMachineRegistered', machineId=self.id, registered=False)
+        media = [att.medium for att in self.mediumAttachments
+                 if att.medium is not None and att.type == const.DeviceType_HardDisk]
+        if cleanup_mode != const.CleanupMode_UnregisterOnly:
+            for name in self._attachments:
+                self._attachments[name] = []
+        if cleanup_mode == const.CleanupMode_DetachAllReturnHardDisksOnly:
+            return media
+        return []
+
+    def deleteConfig(self, media):
+        return FakeProgress(0)
+
+    def saveSettings(self):
+        pass
+
+    def queryLogFilename(self, idx):
+        if idx != 0:
+            return u''
+        return u'/vms/{0}/Logs/VBox.log'.format(self.name)
+
+    def readLog(self, idx, offset, size):
+        if not self._log:
+            lines = [u'{:02d}:{:02d}:{:02d}.{:06d} Line {} of the log for {}\n'.format(
+                        i // 3600 % 24, i // 60 % 60, i % 60, i, i, self.name)
+                     for i in range(_config['log_lines'])]
+            self._log.append(u''.join(lines).encode('utf-8'))
+        data = self._log[0]
+        return bytearray(data[offset:offset + size])
+
+    def _append_log(self, text):
+        self.readLog(0, 0, 0)
+        self._log[0] += text.encode('utf-8')
+
+
+class FakeGuestOSType(_FakeObject):
+    _iface = 'IGuestOSType'
+
+    def __init__(self, type_id, description):
+        self.id = type_id
+        self.description = description
+        self.familyId = u'Linux'
+
+
+class FakeHost(_FakeObject):
+    _iface = 'IHost'
+
+    def getProcessorFeature(self, feature):
+        return True
+
+
+class FakeSystemProperties(_FakeObject):
+    _iface = 'ISystemProperties'
+
+    def __init__(self):
+        self.maxBootPosition = 4
+        self.serialPortCount = 2
+        self.parallelPortCount = 2
+        self.defaultMachineFolder = u'/vms'
+
+    def getMaxNetworkAdapters(self, chipset):
+        return 8
+
+
+class FakeEvent(_FakeObject):
+    _iface = 'IEvent'
+
+    def __init__(self, event_type, **kwargs):
+        self.type = const._Values['VBoxEventType'][event_type]
+        for key in kwargs:
+            object.__setattr__(self, key, kwargs[key])
+
+
+class FakeEventListener(_FakeObject):
+    _iface = 'IEventListener'
+
+    def __init__(self):
+        self._queue = []
+
+
+class FakeEventSource(_FakeObject):
+    _iface = 'IEventSource'
+
+    def __init__(self):
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def createListener(self):
+        return FakeEventListener()
+
+    def registerListener(self, listener, interesting, active):
+        self._listeners.append(listener)
+
+    def unregisterListener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def getEvent(self, listener, timeout):
+        with self._lock:
+            if listener._queue:
+                return listener._queue.pop(0)
+        return None
+
+    def eventProcessed(self, listener, event):
+        pass
+
+    def _fire(self, event):
+        with self._lock:
+            for listener in self._listeners:
+                listener._queue.append(event)
+
+
+class FakePerformanceMetric(_FakeObject):
+    _iface = 'IPerformanceMetric'
+
+    def __init__(self, name):
+        self.metricName = name
+
+
+class FakePerformanceCollector(_FakeObject):
+    _iface = 'IPerformanceCollector'
+
+    def setupMetrics(self, names, objects, period, count):
+        return []
+
+    def queryMetricsData(self, names, objects):
+        out_names, out_objects, units, scales, seqs, idxs, lens, data = \
+                [], [], [], [], [], [], [], []
+        for obj in objects:
+            for name in names:
+                base = name.rstrip(':')
+                out_names.append(base)
+                out_objects.append(obj)
+                if 'CPU/' in base:
+                    units.append(u'%')
+                    scales.append(1000)
+                    value = random.randint(0, 50000)
+                elif base.startswith('Net'):
+                    units.append(u'B/s')
+                    scales.append(1)
+                    value = random.randint(0, 10 * 1024 * 1024)
+                elif base.endswith('RAM/Usage/Total'):
+                    units.append(u'kB')
+                    scales.append(1)
+                    value = obj.memorySize * 1024
+                elif base.endswith('RAM/Usage/Free'):
+                    units.append(u'kB')
+                    scales.append(1)
+                    value = random.randint(0, obj.memorySize * 1024)
+                else:
+                    units.append(u'kB')
+                    scales.append(1)
+                    value = random.randint(0, 4 * 1024 * 1024)
+                seqs.append(0)
+                idxs.append(len(data))
+                lens.append(1)
+                data.append(value)
+        return (data, out_names, out_objects, units, scales, seqs, idxs, lens)
+
+
+class FakeVirtualBox(_FakeObject):
+    _iface = 'IVirtualBox'
+
+    def __init__(self):
+        self.version = u'5.1.99_FAKE'
+        self.revision = 0
+        self.host = FakeHost()
+        self.systemProperties = FakeSystemProperties()
+        self.eventSource = FakeEventSource()
+        self.performanceCollector = FakePerformanceCollector()
+        self.machines = []
+        self.machineGroups = []
+        self.hardDisks = []
+        self.DVDImages = []
+        self.floppyImages = []
+        self.guestOSTypes = [FakeGuestOSType(u'Ubuntu_64', u'Ubuntu (64-bit)'),
+                             FakeGuestOSType(u'Windows10_64', u'Windows 10 (64-bit)'),
+                             FakeGuestOSType(u'Other', u'Other/Unknown')]
+        self._extra = {}
+
+    def _fire(self, event_type, **kwargs):
+        self.eventSource._fire(FakeEvent(event_type, **kwargs))
+
+    def getGuestOSType(self, type_id):
+        for os_type in self.guestOSTypes:
+            if os_type.id == type_id:
+                return os_type
+        return None
+
+    def getExtraData(self, key):
+        return self._extra.get(key, u'')
+
+    def getExtraDataKeys(self):
+        return list(self._extra.keys())
+
+    def setExtraData(self, key, value):
+        self._extra[key] = value
+        self._fire('OnExtraDataChanged', machineId=u'', key=key, value=value)
+
+    def findMachine(self, name_or_id):
+        for mach in self.machines:
+            if name_or_id in {mach.id, mach.name}:
+                return mach
+        raise FakeError(u'Could not find a registered machine named {}'.format(name_or_id))
+
+    def createMachine(self, settings_file, name, groups, os_type, flags):
+        return FakeMachine(self, name, list(groups) or [u'/'])
+
+    def registerMachine(self, machine):
+        self.machines.append(machine)
+        for group in machine.groups:
+            if group not in self.machineGroups:
+                self.machineGroups.append(group)
+        self._fire('OnMachineRegistered', machineId=machine.id, registered=True)
+
+
+_config = {
+    'machines': 200,
+    'groups': 20,
+    'depth': 3,
+    'attachments': 2,
+    'running': 0.25,
+    'latency': 0.0,
+    'launch_time': 1.0,
+    'log_lines': 20000,
+    'snapshots': 0,
+    'seed': 42,
+}
+
+
+def configure(**kwargs):
+    for key in kwargs:
+        if key not in _config:
+            raise KeyError(key)
+        _config[key] = kwargs[key]
+    stats.latency = _config['latency']
+
+
+def _config_from_env():
+    for key in _config:
+        value = os.environ.get('FAKEVBOX_' + key.upper())
+        if value is not None:
+            _config[key] = type(_config[key])(value)
+    stats.latency = _config['latency']
+
+_config_from_env()
+
+
+def _build_inventory(vbox, seed):
+    # Populate without counting calls or paying latency
+    latency = stats.latency
+    stats.latency = 0.0
+    rng = random.Random(seed)
+    random.seed(seed)
+
+    # A hierarchy of groups, spread across the requested depth
+    groups = [u'/']
+    for idx in range(_config['groups']):
+        depth = 1 + idx % max(1, _config['depth'])
+        parents = [g for g in groups if g.count(u'/') == depth - 1 or
+                   (depth == 1 and g == u'/')]
+        parent = rng.choice(parents) if parents else u'/'
+        path = (u'' if parent == u'/' else parent) + u'/group{:03d}'.format(idx)
+        groups.append(path)
+
+    base_disk = FakeMedium(u'base.vdi', const.DeviceType_HardDisk, 20 * 1024**3)
+    vbox.hardDisks.append(base_disk)
+    iso = FakeMedium(u'install.iso', const.DeviceType_DVD, 700 * 1024**2)
+    vbox.DVDImages.append(iso)
+
+    definitions = {}
+    for idx in range(_config['machines']):
+        group = rng.choice(groups)
+        mach = FakeMachine(vbox, u'vm{:05d}'.format(idx), [group])
+        if rng.random() < _config['running']:
+            mach.state = const.MachineState_Running
+        sata = mach._add_controller(u'SATA', const.StorageBus_SATA)
+        for port in range(_config['attachments']):
+            if port == 0 or rng.random() < 0.5:
+                disk = FakeMedium(u'{}-disk{}.vdi'.format(mach.name, port),
+                                  const.DeviceType_HardDisk,
+                                  rng.randint(1, 100) * 1024**3)
+                vbox.hardDisks.append(disk)
+                if rng.random() < 0.3:
+                    FakeMedium(u'{}-disk{}-diff.vdi'.format(mach.name, port),
+                               const.DeviceType_HardDisk, disk.logicalSize,
+                               parent=disk)
+            else:
+                disk = None
+            mach._attach(sata, port, 0, disk, const.DeviceType_HardDisk)
+        ide = mach._add_controller(u'IDE', const.StorageBus_IDE)
+        mach._attach(ide, 1, 0, iso, const.DeviceType_DVD)
+        snap = None
+        for sidx in range(_config['snapshots']):
+            snap = FakeSnapshot(mach, u'Snapshot {}'.format(sidx + 1), snap)
+        mach.currentSnapshot = snap
+        mach.snapshotCount = _config['snapshots']
+        vbox.machines.append(mach)
+        definitions.setdefault(group, []).append(u'm=' + mach.id)
+
+    vbox.machineGroups = groups[1:] if len(groups) > 1 else [u'/']
+    if u'/' not in vbox.machineGroups:
+        vbox.machineGroups.insert(0, u'/')
+
+    # Mimic the Qt GUI's ordering data for a good chunk of the groups
+    for group in groups:
+        entries = list(definitions.get(group, []))
+        prefix = u'' if group == u'/' else group
+        for sub in groups:
+            if sub != group and sub.startswith(prefix + u'/') and \
+                    u'/' not in sub[len(prefix) + 1:]:
+                entries.insert(0, u'go=' + sub[len(prefix) + 1:])
+        rng.shuffle(entries)
+        if entries:
+            vbox._extra[u'GUI/GroupDefinitions' + group] = u','.join(entries)
+
+    stats.latency = latency
+
+
+class VirtualBoxManager(object):
+    def __init__(self, style=None, params=None):
+        self.constants = const
+        self.type = style or 'XPCOM'
+        self.params = params
+        self.vbox = FakeVirtualBox()
+        # Each (fake) webservice URL gets its own machines
+        seed = _config['seed']
+        if params is not None and 'url' in params:
+            seed += zlib.crc32(params['url'].encode('utf-8'))
+        _build_inventory(self.vbox, seed)
+        stats.reset()
+
+    def getVirtualBox(self):
+        return self.vbox
+
+    def getSessionObject(self, vbox=None):
+        return FakeSession()
+
+    def getArray(self, obj, field):
+        return list(getattr(obj, field))
+
+    def queryInterface(self, obj, iface):
+        return obj
+
+    def waitForEvents(self, timeout):
+        return 0
+
+    def initPerThread(self):
+        pass
+
+    def deinitPerThread(self):
+        pass
+
+    def errIsOurXcptKind(self, ex):
+        return isinstance(ex, FakeError)
+
+    def xcptGetMessage(self, ex):
+        return unicode(ex)
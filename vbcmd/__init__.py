@@ -0,0 +1,314 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Non-interactive batch commands.  Nothing in here may import urwid, so
+# that scripts can use vboxcli on hosts without it.
+
+import sys
+import json
+import time
+import argparse
+
+from vbifc import VBoxWrapper, VBoxConstants, vb_enum, vb_details, vb_jobs, \
+                  vb_progress, vb_registry, vb_session
+
+COMMANDS = ['list', 'show', 'state', 'start', 'stop']
+
+def write_line(text):
+    sys.stdout.write(text.encode('utf-8') + b'\n')
+
+def write_json(data):
+    sys.stdout.write(json.dumps(data, indent=2, sort_keys=True) + '\n')
+
+def find_machines(names, group=None):
+    """Resolve machine names/UUIDs and an optional group path to a list of
+    machines.  Unknown names or groups, or selecting no machines at all,
+    raise a LookupError."""
+    vbox = VBoxWrapper()
+    machines = []
+    seen = set()
+    if group is not None:
+        if group not in vbox.group_members and group not in vbox.group_children:
+            raise LookupError(_(u'Group {} not found').format(group))
+        group_ids = vbox.group_machine_ids(group)
+        for machine in vbox.machines:
+            mach_id = machine.id
+            if mach_id in group_ids:
+                machines.append(machine)
+                seen.add(mach_id)
+    for name in names:
+        try:
+            machine = vbox.vbox.findMachine(name)
+        except Exception as ex:
+            raise LookupError(vbox.exceptMessage(ex))
+        mach_id = machine.id
+        if mach_id not in seen:
+            machines.append(machine)
+            seen.add(mach_id)
+    if len(machines) == 0:
+        raise LookupError(_(u'No machines selected'))
+    return machines
+
+def machine_summary(machine, groups=None):
+    vbox = VBoxWrapper()
+    mach_id = machine.id
+    if groups is None:
+        # Only this machine's groups, rather than indexing every machine
+        groups = vbox.mgr.getArray(machine, 'groups')
+    if not machine.accessible:
+        return {'id': mach_id, 'name': None, 'state': None,
+                'groups': list(groups), 'accessible': False}
+    state = machine.state
+    return {
+        'id': mach_id,
+        'name': machine.name,
+        'state': vb_enum.MachineState_text(state),
+        'groups': list(groups),
+        'accessible': True
+    }
+
+def details_dict(details):
+    if not details.accessible:
+        return {'accessible': False}
+    return {
+        'accessible': True,
+        'name': details.name,
+        'id': details.id,
+        'state': vb_enum.MachineState_text(details.state),
+        'os': details.os_type,
+        'memory_mb': details.memory_size,
+        'cpus': details.cpu_count,
+        'cpu_cap': details.cpu_cap,
+        'boot_order': details.boot_order,
+        'acceleration': details.accel,
+        'vram_mb': details.vram_size,
+        'monitors': details.monitor_count,
+        'rdp_ports': details.vrde_ports,
+        'video_capture_file': details.video_capture_file,
+        'storage': [{'controller': name,
+                     'attachments': [{'slot': slot, 'medium': desc}
+                                     for slot, desc in attachments]}
+                    for name, attachments in details.storage],
+        'audio': None if details.audio is None else {
+            'driver': vb_enum.AudioDriverType_text(details.audio[0]),
+            'controller': vb_enum.AudioControllerType_text(details.audio[1])
+        },
+        'network': [{'adapter': slot + 1, 'description': desc}
+                    for slot, desc in details.network],
+        'serial_ports': [{'port': slot + 1, 'name': name,
+                          'mode': vb_enum.PortMode_text(mode), 'path': path}
+                         for slot, name, mode, path in details.serial_ports],
+        'parallel_ports': [{'port': slot + 1, 'name': name, 'path': path}
+                           for slot, name, mode, path in details.parallel_ports],
+        'usb': None if details.usb is None else {
+            'controllers': details.usb[0],
+            'filters': details.usb[1],
+            'active_filters': details.usb[2]
+        },
+        'shared_folders': [{'name': name, 'host_path': path,
+                            'writable': writable, 'auto_mount': auto_mount}
+                           for name, path, writable, auto_mount in details.shared_folders],
+        'description': details.description
+    }
+
+def wait_for_operations(tracker, poll_interval=0.1):
+    vbox = VBoxWrapper()
+    while tracker.busy:
+        tracker.poll()
+        vbox.mgr.waitForEvents(0)
+        if tracker.busy:
+            time.sleep(poll_interval)
+
+def run_bulk(args, machines, command, vmtype=u'headless'):
+    tracker = vb_progress.ProgressTracker()
+    op = tracker.track(vb_jobs.BulkOperation(machines, command, vmtype,
+                                             max_jobs=args.jobs))
+    wait_for_operations(tracker)
+    return op
+
+def report_bulk(args, op):
+    if args.json:
+        write_json({
+            'succeeded': op.succeeded,
+            'skipped': op.skipped,
+            'errors': [{'name': name, 'error': message} for name, message in op.errors]
+        })
+    else:
+        for line in op.summary():
+            write_line(line)
+    return 1 if len(op.errors) > 0 else 0
+
+
+def cmd_list(args):
+    vbox = VBoxWrapper()
+    if args.group is not None:
+        machines = find_machines([], args.group)
+    else:
+        machines = vbox.machines
+    groups_by_id = vbox.groups_by_id
+    summaries = [machine_summary(mach, groups_by_id.get(mach.id)) for mach in machines]
+    if args.json:
+        write_json(summaries)
+    else:
+        for info in summaries:
+            write_line(u'{:<32} {:<20} {}  {}'.format(
+                       info['name'] or _(u'<inaccessible>'), info['state'] or u'',
+                       info['id'], u','.join(info['groups'])))
+    return 0
+
+def cmd_show(args):
+    machines = find_machines(args.machines)
+    details = [vb_details.MachineDetails(mach) for mach in machines]
+    if args.json:
+        write_json([details_dict(item) for item in details])
+        return 0
+
+    for item in details:
+        info = details_dict(item)
+        if not info['accessible']:
+            write_line(_(u'Machine details inaccessible'))
+            continue
+        for key in sorted(info.keys()):
+            value = info[key]
+            if isinstance(value, (list, dict)):
+                value = json.dumps(value, sort_keys=True)
+            write_line(u'{}: {}'.format(key, value))
+        write_line(u'')
+    return 0
+
+def cmd_state(args):
+    if len(args.machines) == 0 and args.group is None:
+        machines = VBoxWrapper().machines
+    else:
+        machines = find_machines(args.machines, args.group)
+    # (id, name, state), with None for the name and state of inaccessible
+    # machines
+    states = []
+    for machine in machines:
+        if machine.accessible:
+            states.append((machine.id, machine.name, machine.state))
+        else:
+            states.append((machine.id, None, None))
+    if args.json:
+        # A list rather than a dict keyed by name, since names needn't be
+        # unique.  States are the SDK's names, which scripts can rely on.
+        registry = vb_registry.get_registry()
+        write_json([{'id': mach_id, 'name': name,
+                     'state': registry.value_name('MachineState', state)
+                              if state is not None else None}
+                    for mach_id, name, state in states])
+    else:
+        for mach_id, name, state in states:
+            write_line(u'{}: {}'.format(name or mach_id,
+                                        vb_enum.MachineState_text(state)
+                                        if state is not None else _(u'<inaccessible>')))
+    return 0
+
+def cmd_start(args):
+    machines = find_machines(args.machines, args.group)
+    op = run_bulk(args, machines, 'start', args.type.decode('utf-8'))
+    return report_bulk(args, op)
+
+def cmd_stop(args):
+    vbconst = VBoxConstants()
+    machines = find_machines(args.machines, args.group)
+    if args.save:
+        command = 'save_state'
+    elif args.acpi:
+        command = 'acpi_button'
+    else:
+        command = 'power_down'
+    op = run_bulk(args, machines, command)
+
+    if command == 'acpi_button' and args.timeout > 0:
+        # ACPI shutdown only asks the guest to shut down, so wait and see
+        # which machines actually do
+        stopped = {vbconst.MachineState_PoweredOff, vbconst.MachineState_Saved,
+                   vbconst.MachineState_Aborted}
+        deadline = time.time() + args.timeout
+        waiting = list(machines)
+        while len(waiting) > 0 and time.time() < deadline:
+            VBoxWrapper().mgr.waitForEvents(0)
+            waiting = [mach for mach in waiting if mach.state not in stopped]
+            if len(waiting) > 0:
+                time.sleep(0.5)
+        if len(waiting) > 0 and args.force:
+            forced = run_bulk(args, waiting, 'power_down')
+            op.errors.extend(forced.errors)
+        elif len(waiting) > 0:
+            for mach in waiting:
+                op.errors.append((mach.name, _(u'Timed out waiting for ACPI shutdown')))
+    return report_bulk(args, op)
+
+
+def main(argv):
+    # Common options go on each subcommand, since the subcommand name has
+    # to come first for vboxcli.py to dispatch it here
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-j', '--jobs', type=int, default=4,
+                        help=_(u'Number of machines to act on at once'))
+    common.add_argument('--json', action='store_true',
+                        help=_(u'Produce JSON output'))
+
+    parser = argparse.ArgumentParser(prog='vboxcli.py',
+                                     description=_(u'Batch commands for VirtualBox'))
+    subparsers = parser.add_subparsers(dest='command')
+
+    cmd = subparsers.add_parser('list', parents=[common], help=_(u'List machines'))
+    cmd.add_argument('--group', help=_(u'Only list machines in this group'))
+    cmd.set_defaults(func=cmd_list)
+
+    cmd = subparsers.add_parser('show', parents=[common], help=_(u'Show machine details'))
+    cmd.add_argument('machines', nargs='+', metavar='vm')
+    cmd.set_defaults(func=cmd_show)
+
+    cmd = subparsers.add_parser('state', parents=[common], help=_(u'Show machine states'))
+    cmd.add_argument('machines', nargs='*', metavar='vm')
+    cmd.add_argument('--group')
+    cmd.set_defaults(func=cmd_state)
+
+    cmd = subparsers.add_parser('start', parents=[common], help=_(u'Start machines'))
+    cmd.add_argument('machines', nargs='*', metavar='vm')
+    cmd.add_argument('--group')
+    cmd.add_argument('--type', default='headless', choices=['headless', 'gui', 'sdl'])
+    cmd.set_defaults(func=cmd_start)
+
+    cmd = subparsers.add_parser('stop', parents=[common], help=_(u'Stop machines'))
+    cmd.add_argument('machines', nargs='*', metavar='vm')
+    cmd.add_argument('--group')
+    mode = cmd.add_mutually_exclusive_group()
+    mode.add_argument('--acpi', action='store_true', help=_(u'Send an ACPI shutdown'))
+    mode.add_argument('--save', action='store_true', help=_(u'Save machine state'))
+    mode.add_argument('--poweroff', action='store_true', help=_(u'Power off (default)'))
+    cmd.add_argument('--timeout', type=float, default=0,
+                     help=_(u'Seconds to wait for an ACPI shutdown to finish'))
+    cmd.add_argument('--force', action='store_true',
+                     help=_(u'Power off machines still running after --timeout'))
+    cmd.set_defaults(func=cmd_stop)
+
+    args = parser.parse_args(argv)
+    group = getattr(args, 'group', None)
+    args.group = group.decode('utf-8') if group is not None else None
+    args.machines = [name.decode('utf-8') for name in getattr(args, 'machines', [])]
+
+    try:
+        return args.func(args)
+    except LookupError as ex:
+        sys.stderr.write((unicode(ex) + u'\n').encode('utf-8'))
+        return 2
+    finally:
+        vb_session.release_all_sessions()
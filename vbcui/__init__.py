@@ -15,8 +15,13 @@
 # along with vboxcli; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import os
+import time
+import threading
 import urwid
 
+from vbifc import VBoxWrapper, get_host, host_names, vb_events, vb_session, vb_worker
+
 VBOXCLI_VERSION = u'1.0'
 
 palette = [
@@ -34,6 +39,7 @@ palette = [
     ('state error', 'dark red,bold',    'black',        'bold'),
     ('state pause', 'brown',            'black',        'bold'),
     ('state off',   'dark gray',        'black',        'bold'),
+    ('marked',      'yellow,bold',      'black',        'bold'),
     ('popup',       'black',            'light gray',   'standout'),
     ('popup focus', 'light gray',       'black',        ''),
     ('popup shortcut', 'black,underline',    'light gray',   'bold'),
@@ -54,9 +60,157 @@ menu_palette_map = {
     'shortcut': 'menu shortcut'
 }
 
+class StartupTimings(object):
+    """Wall clock time spent in each startup phase, for --startup-timings"""
+
+    def __init__(self, start=None):
+        self.start = time.time() if start is None else start
+        self.last = self.start
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.time()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        lines = [u'{:<24} {:8.1f} ms'.format(phase, elapsed * 1000)
+                 for phase, elapsed in self.phases]
+        lines.append(u'{:<24} {:8.1f} ms'.format(_(u'Total'), (self.last - self.start) * 1000))
+        return lines
+
+
 class VBCUIEventLoop(urwid.MainLoop):
     instance = None
 
+    # Seconds between checks of the VirtualBox event queue
+    event_interval = 0.25
+
+    # Machine states read directly per check, in case events are missed
+    state_poll_budget = 8
+
     def __init__(self, widget):
         VBCUIEventLoop.instance = self
         super(VBCUIEventLoop, self).__init__(widget, palette=palette, pop_ups=True)
+        self.event_listener = None
+        # The host event_listener listens to
+        self.local_host = None
+        self.event_pollers = []
+        # Host name -> vb_events.StatePoller
+        self.state_pollers = {}
+        self.event_handlers = []
+        self.workers = []
+        # metrics.MetricsMonitor instances, stopped when the loop exits
+        self.metrics_monitors = []
+        self._posted = []
+        self._posted_lock = threading.Lock()
+        self._post_fd = self.watch_pipe(self._run_posted)
+        self.timings = None
+        self._painted = False
+        self._after_paint = []
+
+    def after_first_paint(self, callback):
+        # Run callback(loop) once the first screen has been drawn, so slow
+        # setup work doesn't leave the terminal blank
+        if self._painted:
+            self.set_alarm_in(0, lambda loop, data: callback(loop))
+        else:
+            self._after_paint.append(callback)
+
+    def draw_screen(self):
+        super(VBCUIEventLoop, self).draw_screen()
+        if not self._painted:
+            self._painted = True
+            if self.timings is not None:
+                self.timings.mark(_(u'First paint'))
+            for callback in self._after_paint:
+                self.set_alarm_in(0, lambda loop, data, callback=callback: callback(loop))
+            self._after_paint = []
+
+    def post(self, callback, *args):
+        # Schedule callback(*args) to run on the main loop.  This is safe to
+        # call from any thread.
+        with self._posted_lock:
+            self._posted.append((callback, args))
+        os.write(self._post_fd, b'.')
+
+    def _run_posted(self, data):
+        with self._posted_lock:
+            posted = self._posted
+            self._posted = []
+        for callback, args in posted:
+            callback(*args)
+        return True
+
+    def start_worker(self, name=None):
+        worker = vb_worker.Worker(self.post, name)
+        self.workers.append(worker)
+        worker.start()
+        return worker
+
+    def add_event_handler(self, handler):
+        # Handlers are called with a list of (kind, machine_id, value)
+        # tuples from vb_events.MachineEventListener (or a StatePoller), and
+        # the name of the host they came from.
+        for name in host_names():
+            self.watch_host(name)
+        self.event_handlers.append(handler)
+
+    def watch_host(self, name):
+        # Start listening to a host's events, if it's connected and isn't
+        # already being listened to.  The local host is polled here, since
+        # XPCOM only delivers its events to the thread which connected it.
+        # Each remote host has a poller thread, so a slow network round trip
+        # never stalls the UI.
+        host = get_host(name)
+        if name in self.state_pollers or not VBoxWrapper.connected(name) \
+                or host.error is not None:
+            return
+        state_poller = vb_events.StatePoller(name, self.state_poll_budget)
+        self.state_pollers[name] = state_poller
+        if host.is_local:
+            self.local_host = name
+            self.event_listener = vb_events.MachineEventListener(name)
+            self.set_alarm_in(self.event_interval, self._pump_events)
+        else:
+            poller = vb_events.EventPoller(name, self.post, self._dispatch_events,
+                                           state_poller=state_poller)
+            self.event_pollers.append(poller)
+            poller.start()
+
+    def _dispatch_events(self, events, host_name):
+        for handler in self.event_handlers:
+            handler(events, host_name)
+
+    def poll_states_soon(self, machine_ids):
+        # Have the state pollers read these machines on their next check,
+        # e.g. because they were just asked to start or stop
+        for machine_id in machine_ids:
+            state_poller = self.state_pollers.get(VBoxWrapper.machine_host(machine_id))
+            if state_poller is not None:
+                state_poller.wake(machine_id)
+
+    def _pump_events(self, loop=None, user_data=None):
+        vbox = VBoxWrapper(self.local_host)
+        vbox.mgr.waitForEvents(0)
+        events = self.event_listener.poll()
+        state_poller = self.state_pollers[self.local_host]
+        state_poller.note_events(events)
+        events.extend(state_poller.poll())
+        if len(events) > 0:
+            self._dispatch_events(events, self.local_host)
+        self.set_alarm_in(self.event_interval, self._pump_events)
+
+    def run(self):
+        try:
+            super(VBCUIEventLoop, self).run()
+        finally:
+            for monitor in self.metrics_monitors:
+                monitor.stop()
+            for worker in self.workers:
+                worker.stop()
+            for poller in self.event_pollers:
+                poller.stop()
+            vb_session.release_all_sessions()
+            if self.event_listener is not None:
+                self.event_listener.close()
@@ -0,0 +1,127 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import urwid
+
+from vbifc import VBoxWrapper, vb_clone
+from popups import PopupButton
+
+class CloneDialog(urwid.LineBox):
+    """Asks how to clone a machine: the new name, how many clones to make
+    and how many of those may run at once, the group to put them in,
+    full or linked, and the snapshot (if any) to clone from"""
+
+    spacer = (urwid.WEIGHT, 1, urwid.Text(u''))
+    label_cols = 16
+
+    signals = ['accepted', 'rejected']
+
+    def __init__(self, machine, max_jobs=4):
+        self.machine = machine
+        vbox = VBoxWrapper.for_machine(machine.id)
+        groups = vbox.groups_by_id.get(machine.id) or [u'/']
+        self.name_edit = urwid.Edit(u'', _(u'{} Clone').format(machine.name))
+        self.count_edit = urwid.IntEdit(u'', 1)
+        self.jobs_edit = urwid.IntEdit(u'', max_jobs)
+        self.group_edit = urwid.Edit(u'', groups[0])
+        self.snapshot_edit = urwid.Edit(u'', u'')
+        clone_type = []
+        self.full_button = urwid.RadioButton(clone_type, _(u'Full'))
+        self.linked_button = urwid.RadioButton(clone_type, _(u'Linked'))
+        self.message = urwid.Text(u'')
+        # Filled in once accepted
+        self.names = None
+        self.snapshot_id = None
+
+        ok_button = PopupButton(_(u'OK'))
+        urwid.connect_signal(ok_button, 'click', self._accept)
+        cancel_button = PopupButton(_(u'Cancel'))
+        urwid.connect_signal(cancel_button, 'click', self._reject)
+        content = urwid.Pile([
+            self.field(_(u'Name:'), self.name_edit),
+            self.field(_(u'Clones:'), self.count_edit),
+            self.field(_(u'At once:'), self.jobs_edit),
+            self.field(_(u'Group:'), self.group_edit),
+            self.field(_(u'Type:'), urwid.Columns([
+                urwid.AttrMap(self.full_button, None, 'focus'),
+                urwid.AttrMap(self.linked_button, None, 'focus')
+            ], dividechars=2)),
+            self.field(_(u'From snapshot:'), self.snapshot_edit),
+            self.field(u'', urwid.Text(_(u'Name or UUID; leave empty to clone the '
+                                         u'current state'))),
+            self.message,
+            urwid.Divider(),
+            urwid.Columns([
+                self.spacer,
+                (urwid.FIXED, ok_button.min_width, ok_button),
+                self.spacer,
+                (urwid.FIXED, cancel_button.min_width, cancel_button),
+                self.spacer
+            ], dividechars=0)
+        ])
+        super(CloneDialog, self).__init__(content, title=_(u'Clone {}').format(machine.name))
+
+    def field(self, label, widget):
+        if isinstance(widget, urwid.Edit):
+            widget = urwid.AttrMap(widget, None, 'focus')
+        return urwid.Columns([(urwid.FIXED, self.label_cols, urwid.Text(label)), widget])
+
+    @property
+    def group(self):
+        return self.group_edit.edit_text.strip() or u'/'
+
+    @property
+    def linked(self):
+        return self.linked_button.state
+
+    @property
+    def max_jobs(self):
+        return max(1, self.jobs_edit.value())
+
+    def keypress(self, size, key):
+        key = super(CloneDialog, self).keypress(size, key)
+        if key == 'esc':
+            self._reject()
+        else:
+            return key
+
+    def _accept(self, sender=None):
+        name = self.name_edit.edit_text.strip()
+        count = self.count_edit.value()
+        if name == u'':
+            self.message.set_text(_(u'A name is required'))
+            return
+        if count < 1:
+            self.message.set_text(_(u'Make at least one clone'))
+            return
+        if not self.group.startswith(u'/'):
+            self.message.set_text(_(u'Groups start with "/"'))
+            return
+        snapshot = self.snapshot_edit.edit_text.strip()
+        self.snapshot_id = None
+        if snapshot != u'':
+            try:
+                self.snapshot_id = self.machine.findSnapshot(snapshot).id
+            except Exception as ex:
+                vbox = VBoxWrapper.for_machine(self.machine.id)
+                self.message.set_text(vbox.exceptMessage(ex))
+                return
+        self.names = vb_clone.clone_names(name, count)
+        urwid.emit_signal(self, 'accepted')
+
+    def _reject(self, sender=None):
+        urwid.emit_signal(self, 'rejected')
@@ -0,0 +1,223 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import urwid
+from collections import OrderedDict
+
+from vbifc import VBoxWrapper, vb_log
+from . import VBCUIEventLoop
+
+class LogLine(urwid.WidgetWrap):
+    def __init__(self, text):
+        super(LogLine, self).__init__(urwid.AttrMap(urwid.Text(text), None, 'focus'))
+
+    def selectable(self):
+        return True
+
+    def keypress(self, size, key):
+        return key
+
+
+class LogWalker(urwid.ListWalker):
+    """Walks the lines of a vb_log.LogReader.  Positions are the byte
+    offsets lines start at, so nothing needs to be known about the lines
+    that aren't on screen."""
+
+    # Line widgets kept around for redrawing
+    cache_lines = 256
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.focus = 0
+        self._widgets = OrderedDict()
+
+    def _widget(self, offset):
+        widget = self._widgets.pop(offset, None)
+        if widget is None:
+            text, next_offset = self.reader.line_at(offset)
+            widget = LogLine(text)
+        self._widgets[offset] = widget
+        if len(self._widgets) > self.cache_lines:
+            self._widgets.popitem(last=False)
+        return widget
+
+    def reset(self):
+        # Line widgets may be stale -- e.g. a partially written last line
+        self._widgets.clear()
+        self._modified()
+
+    def get_focus(self):
+        if self.reader.size == 0:
+            return None, None
+        return self._widget(self.focus), self.focus
+
+    def set_focus(self, focus):
+        self.focus = focus
+        self._modified()
+
+    def get_next(self, start_from):
+        text, next_offset = self.reader.line_at(start_from)
+        if next_offset >= self.reader.size or next_offset == start_from:
+            return None, None
+        return self._widget(next_offset), next_offset
+
+    def get_prev(self, start_from):
+        offset = self.reader.prev_line(start_from)
+        if offset is None:
+            return None, None
+        return self._widget(offset), offset
+
+
+class LogViewer(urwid.LineBox):
+    signals = ['close']
+
+    # Seconds between checks for new output while following
+    follow_interval = 1.0
+
+    def __init__(self, machine):
+        self.reader = vb_log.LogReader(machine)
+        self.walker = LogWalker(self.reader)
+        self.list_box = urwid.ListBox(self.walker)
+        self.status = urwid.Text(u'')
+        self.search_edit = None
+        self.search_text = u''
+        self.search_job = None
+        self._search_gen = 0
+        self.following = False
+        self._alarm = None
+        self.worker = VBCUIEventLoop.instance.start_worker('log')
+        self.frame = urwid.Frame(self.list_box, footer=urwid.AttrMap(self.status, 'statusbar'))
+        title = _(u'Log: {} ({})').format(machine.name, self.reader.filename)
+        super(LogViewer, self).__init__(self.frame, title=title)
+        self.update_status()
+
+    def update_status(self, message=None):
+        if message is None:
+            message = _(u'{} bytes  f: Follow{}  /: Search  n: Next match  Esc: Close').format(
+                    self.reader.size, _(u' (on)') if self.following else u'')
+        self.status.set_text(message)
+
+    def keypress(self, size, key):
+        if self.search_edit is not None:
+            return self.search_keypress(size, key)
+        key = super(LogViewer, self).keypress(size, key)
+        if key in {'esc', 'q'}:
+            self.close()
+        elif key in {'home', 'g'}:
+            if self.reader.size > 0:
+                self.list_box.set_focus(0, 'below')
+        elif key in {'end', 'G'}:
+            self.refresh()
+            self.go_to_end()
+        elif key == 'f':
+            self.set_following(not self.following)
+        elif key == '/':
+            self.search_edit = urwid.Edit(u'/', self.search_text)
+            self.frame.footer = urwid.AttrMap(self.search_edit, 'statusbar')
+        elif key == 'n':
+            self.search(self.search_text)
+        else:
+            return key
+
+    def search_keypress(self, size, key):
+        if key == 'enter':
+            self.search_text = self.search_edit.edit_text
+            self.search_edit = None
+            self.frame.footer = urwid.AttrMap(self.status, 'statusbar')
+            self.search(self.search_text)
+        elif key == 'esc':
+            self.search_edit = None
+            self.frame.footer = urwid.AttrMap(self.status, 'statusbar')
+        else:
+            self.search_edit.keypress((size[0],), key)
+        return None
+
+    def go_to_end(self):
+        last = self.reader.last_line()
+        if last is not None:
+            self.list_box.set_focus(last, 'above')
+
+    def set_following(self, following):
+        self.following = following
+        if following:
+            self.go_to_end()
+            if self._alarm is None:
+                self._alarm = VBCUIEventLoop.instance.set_alarm_in(self.follow_interval,
+                                                                   self._follow)
+        elif self._alarm is not None:
+            VBCUIEventLoop.instance.remove_alarm(self._alarm)
+            self._alarm = None
+        self.update_status()
+
+    def refresh(self):
+        # Returns None if the log couldn't be read
+        try:
+            changed = self.reader.refresh()
+        except Exception as ex:
+            self.update_status(VBoxWrapper().exceptMessage(ex))
+            return None
+        if changed:
+            self.walker.reset()
+            self.update_status()
+        return changed
+
+    def _follow(self, loop=None, user_data=None):
+        self._alarm = None
+        changed = self.refresh()
+        if changed is None:
+            self.following = False
+            return
+        if changed:
+            self.go_to_end()
+        self._alarm = VBCUIEventLoop.instance.set_alarm_in(self.follow_interval, self._follow)
+
+    def search(self, text):
+        # Scanning a big log can take a while, so it's done on a worker,
+        # starting after the focused line.  Starting another search (or
+        # closing the viewer) stops the scan.
+        if text == u'' or self.reader.size == 0:
+            return
+        start = self.reader.line_at(self.walker.focus)[1]
+        self._search_gen += 1
+        gen = self._search_gen
+        cancelled = lambda: gen != self._search_gen
+        self.search_job = self.worker.submit(self.reader.search,
+                                             (text, start, self.reader.size, cancelled),
+                                             self._on_search)
+        self.update_status(_(u'Searching for "{}"...').format(text))
+
+    def _on_search(self, job, offset, error):
+        if job is not self.search_job:
+            return
+        self.search_job = None
+        if error is not None:
+            self.update_status(VBoxWrapper().exceptMessage(error))
+        elif offset is None:
+            self.update_status(_(u'"{}" not found').format(self.search_text))
+        else:
+            self.set_following(False)
+            self.list_box.set_focus(self.reader.line_start(offset), 'below')
+            self.update_status()
+
+    def close(self):
+        if self._alarm is not None:
+            VBCUIEventLoop.instance.remove_alarm(self._alarm)
+            self._alarm = None
+        self._search_gen += 1
+        self.worker.stop()
+        VBCUIEventLoop.instance.workers.remove(self.worker)
+        urwid.emit_signal(self, 'close')
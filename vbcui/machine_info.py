@@ -15,34 +15,133 @@
 # along with vboxcli; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-import os
 import urwid
+import difflib
+from urwid.text_layout import trim_line
+
+from vbifc import VBoxWrapper, vb_enum, vb_details, vb_metrics, vb_text
+from . import VBCUIEventLoop
+from metrics import sparkline, format_rate, format_percent
+
+class HangingLayout(urwid.StandardTextLayout):
+    """Lays out text where each line may start with a head (e.g. "Name:  ")
+    that the rest of the line wraps under, as if the head and the value
+    were separate columns.  indents gives the length of each line's head."""
+
+    def __init__(self, indents):
+        urwid.StandardTextLayout.__init__(self)
+        self.indents = indents
+
+    def layout(self, text, width, align, wrap):
+        result = []
+        start = 0
+        for indent in self.indents:
+            end = text.find('\n', start)
+            if end < 0:
+                end = len(text)
+            head_cols = urwid.calc_width(text, start, start + indent)
+            if head_cols >= width:
+                # No room to indent anything
+                indent = head_cols = 0
+            base = start + indent
+            value = text[base:end]
+            lines = urwid.StandardTextLayout.layout(self, value, width - head_cols,
+                                                    align, wrap)
+            for idx, line in enumerate(lines):
+                if wrap == 'clip':
+                    # urwid's own clipping only works when the line is a
+                    # single segment, which ours aren't once the head is added
+                    line = trim_line(line, value, 0, width - head_cols)
+                shifted = [_shift_segment(seg, base) for seg in line]
+                if head_cols == 0:
+                    result.append(shifted)
+                elif idx == 0:
+                    result.append([(head_cols, start, base)] + shifted)
+                else:
+                    result.append([(head_cols, None)] + shifted)
+            start = end + 1
+        return result
+
+def _shift_segment(seg, base):
+    # Layout segments for a substring, moved to where it starts in the text
+    if len(seg) == 3:
+        if isinstance(seg[2], int):
+            return (seg[0], seg[1] + base, seg[2] + base)
+        return (seg[0], seg[1] + base, seg[2])
+    if seg[1] is None:
+        return seg
+    return (seg[0], seg[1] + base)
+
+
+class SectionText(urwid.Text):
+    def __init__(self, markup, indents, wrap='space'):
+        super(SectionText, self).__init__(markup, wrap=wrap, layout=HangingLayout(indents))
 
-from vbifc import VBoxWrapper, vb_enum, vb_text
 
 class MachineInfo(urwid.LineBox):
+    """The details pane.  Its contents are described as a list of rows --
+    plain tuples built by the add_* methods -- and each new list is diffed
+    against the one on screen, so refreshing a machine only touches the
+    widgets whose rows changed, and the scroll position is kept.
+
+    Each section (its header and all of its lines) is a single Text, rather
+    than a Columns per line, so there are only a handful of widgets for
+    urwid to lay out."""
+
     def __init__(self):
         self.info = urwid.SimpleFocusListWalker([])
         super(MachineInfo, self).__init__(urwid.ListBox(self.info), _(u'Details'))
+        self.worker = None
+        self.pending = None
+        # MetricsMonitor for the live performance section, if any
+        self.metrics = None
+        # Rows currently shown, one per widget in self.info
+        self.shown_rows = []
+        # Rows being built by show_details(), and the markup and line
+        # indents of the section being added to
+        self._new_rows = None
+        self._section = None
+        self.details = None
         self.show_machine(None)
 
-    def add_header(self, label, space_before=True):
+    def add_row(self, *row):
+        self.end_section()
+        self._new_rows.append(row)
+
+    def end_section(self):
+        if self._section is not None:
+            markup, indents, wrap = self._section
+            self._section = None
+            self._new_rows.append(('section', tuple(markup), tuple(indents), wrap))
+
+    def add_line(self, indent, *markup):
+        if self._section is None:
+            self._section = ([], [], 'space')
+        section_markup, indents, wrap = self._section
+        if len(indents) > 0:
+            section_markup.append(u'\n')
+        section_markup.extend(markup)
+        indents.append(indent)
+
+    def add_header(self, label, space_before=True, wrap='space'):
+        self.end_section()
+        self._section = ([], [], wrap)
         if space_before:
-            self.info.append(urwid.Divider())
-        self.info.append(urwid.Text(('info header', label)))
+            self.add_line(0, u'')
+        self.add_line(0, ('info header', label))
 
     def add_info(self, label, value, head_width, left_pad=2):
-        head = urwid.Padding(urwid.Text(('info key', u'{}:'.format(label))),
-                             left=left_pad)
-        content = urwid.Text(('info', u'{}'.format(value)))
-        columns = urwid.Columns([(head_width + 2 + left_pad, head), content], 1)
-        self.info.append(columns)
+        head = u'{}{}:'.format(u' ' * left_pad, label).ljust(head_width + 3 + left_pad)
+        lines = u'{}'.format(value).split(u'\n')
+        self.add_line(len(head), ('info key', head), ('info', lines[0]))
+        for ln in lines[1:]:
+            self.add_line(len(head), u' ' * len(head), ('info', ln))
 
-    def add_info_group(self, header, lines, left_pad=2):
+    def add_info_group(self, header, lines, left_pad=2, wrap='space'):
         if len(lines) == 0:
             return
         if header is not None:
-            self.add_header(header)
+            self.add_header(header, wrap=wrap)
         head_width = 0
         for ln in lines:
             ln_width = len(ln[0])
@@ -52,145 +151,245 @@ class MachineInfo(urwid.LineBox):
             self.add_info(ln[0], ln[1], head_width, left_pad)
 
     def add_text(self, value, left_pad=2):
-        self.info.append(urwid.Padding(urwid.Text(value), left=left_pad))
+        attr, text = value if isinstance(value, tuple) else (None, value)
+        for ln in text.split(u'\n'):
+            self.add_line(left_pad, u' ' * left_pad, (attr, ln))
+
+    def add_markup(self, markup, wrap='space'):
+        # Lists aren't hashable, so markup is kept as a tuple of segments
+        if not isinstance(markup, list):
+            markup = [markup]
+        self.add_row('markup', tuple(markup), wrap)
+
+    @staticmethod
+    def make_widget(row):
+        kind = row[0]
+        if kind == 'section':
+            markup, indents, wrap = row[1:]
+            return SectionText(list(markup), indents, wrap)
+        elif kind == 'markup':
+            return urwid.Text(list(row[1]), wrap=row[2])
+        raise ValueError(kind)
+
+    @staticmethod
+    def update_widget(widget, old_row, row):
+        # Updates the widget made for old_row to show row instead, if that
+        # only means changing its text.  Returns False if it has to be
+        # replaced.
+        if row[0] != old_row[0] or row[2:] != old_row[2:]:
+            return False
+        widget.set_text(list(row[1]))
+        return True
+
+    def set_rows(self, rows):
+        matcher = difflib.SequenceMatcher(None, self.shown_rows, rows, autojunk=False)
+        # Applied from the bottom up, so the earlier positions stay valid
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag == 'equal':
+                continue
+            old_rows = self.shown_rows[i1:i2]
+            widgets = []
+            replaced = len(old_rows) != j2 - j1
+            for idx, row in enumerate(rows[j1:j2]):
+                if idx < len(old_rows) \
+                        and self.update_widget(self.info[i1 + idx], old_rows[idx], row):
+                    widgets.append(self.info[i1 + idx])
+                else:
+                    widgets.append(self.make_widget(row))
+                    replaced = True
+            if replaced:
+                self.info[i1:i2] = widgets
+        self.shown_rows = rows
 
     def show_machine(self, machine):
-        del self.info[:]
-        if machine is None:
-            self.info.append(urwid.Text(_(u'No machine selected')))
+        # Details are fetched on a background worker so that moving quickly
+        # through the machine list doesn't stall the UI.  Only the most
+        # recent request is ever rendered.
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+
+        if machine is None or VBCUIEventLoop.instance is None:
+            details = vb_details.get_machine_details(machine) if machine else None
+            self.show_details(details)
+            return
+
+        if self.worker is None:
+            self.worker = VBCUIEventLoop.instance.start_worker('details')
+        self.pending = self.worker.submit(vb_details.get_machine_details, (machine,),
+                                          self._on_details, tag='details')
+        self.set_title(_(u'Details (loading...)'))
+
+    def _on_details(self, job, details, error):
+        if job is not self.pending:
             return
+        self.pending = None
+        self.set_title(_(u'Details'))
+        if error is not None:
+            self.details = None
+            self._new_rows = []
+            self.add_markup(('info error', VBoxWrapper().exceptMessage(error)))
+            self.set_rows(self._new_rows)
+        else:
+            self.show_details(details)
 
-        if not machine.accessible:
-            self.info.append(urwid.Text(('info error', _(u'Machine details inaccessible'))))
+    def show_details(self, details):
+        if self.details is None or details is None or not self.details.accessible \
+                or not details.accessible or self.details.id != details.id:
+            # A different machine starts out scrolled to the top
+            if len(self.info) > 0:
+                self.info.set_focus(0)
+        self.details = details
+        self._new_rows = []
+        self.build_rows(details)
+        self.end_section()
+        self.set_rows(self._new_rows)
+        self._new_rows = None
+
+    def build_rows(self, details):
+        if details is None:
+            self.add_markup(_(u'No machine selected'))
+            return
+
+        if not details.accessible:
+            self.add_markup(('info error', _(u'Machine details inaccessible')))
             return
 
-        vbox = VBoxWrapper()
-        self.info.append(urwid.Text([
+        host_name = details.host_name
+        self.add_markup([
             ('info key', _(u'Current State:  ')),
-            vb_enum.MachineState_icon(machine.state),
-            ('info', u' ' + vb_enum.MachineState_text(machine.state))]))
+            vb_enum.MachineState_icon(details.state, host_name),
+            ('info', u' ' + vb_enum.MachineState_text(details.state, host_name))])
+
+        # The performance section is only there while the machine is running
+        self.add_info_group(_(u'Performance'), self.metrics_lines(details.id), wrap='clip')
 
         self.add_info_group(_(u'General'), [
-            (_(u'Name'), machine.name),
-            (_(u'ID'), machine.id),
-            (_(u'OS'), vb_text.get_os_type(machine))
+            (_(u'Name'), details.name),
+            (_(u'ID'), details.id),
+            (_(u'OS'), details.os_type)
         ])
 
         system_group = [
-            (_(u'Base Memory'), u'{} MiB'.format(machine.memorySize))
+            (_(u'Base Memory'), u'{} MiB'.format(details.memory_size))
         ]
-        if machine.CPUCount != 1:
-            system_group.append((_(u'Processors'), machine.CPUCount))
-        if machine.CPUExecutionCap != 100:
-            system_group.append((_(u'Execution Cap'), u'{}%'.format(machine.CPUExecutionCap)))
-        system_group.append((_(u'Boot Order'), vb_text.get_boot_order(machine)))
-        accel = vb_text.get_accel_summary(machine)
-        if accel != u'':
-            system_group.append((_(u'Acceleration'), accel))
+        if details.cpu_count != 1:
+            system_group.append((_(u'Processors'), details.cpu_count))
+        if details.cpu_cap != 100:
+            system_group.append((_(u'Execution Cap'), u'{}%'.format(details.cpu_cap)))
+        system_group.append((_(u'Boot Order'), details.boot_order))
+        if details.accel != u'':
+            system_group.append((_(u'Acceleration'), details.accel))
         self.add_info_group(_(u'System'), system_group)
 
         display_group = [
-            (_(u'Video Memory'), u'{} MiB'.format(machine.VRAMSize))
+            (_(u'Video Memory'), u'{} MiB'.format(details.vram_size))
         ]
-        if machine.monitorCount != 1:
-            display_group.append((_(u'Screens'), machine.monitorCount))
-        if machine.VRDEServer.enabled:
-            display_group.append((_(u'RDP Server Port'),
-                                  machine.VRDEServer.getVRDEProperty(u'TCP/Ports')))
-        if machine.videoCaptureEnabled:
-            display_group.append((_(u'Video Capture File'),
-                                  os.path.basename(machine.videoCaptureFile)))
+        if details.monitor_count != 1:
+            display_group.append((_(u'Screens'), details.monitor_count))
+        if details.vrde_ports is not None:
+            display_group.append((_(u'RDP Server Port'), details.vrde_ports))
+        if details.video_capture_file is not None:
+            display_group.append((_(u'Video Capture File'), details.video_capture_file))
         self.add_info_group(_(u'Display'), display_group)
 
-        storageControllers = vbox.mgr.getArray(machine, 'storageControllers')
-        if len(storageControllers) > 0:
+        if len(details.storage) > 0:
             self.add_header(_(u'Storage'))
-        for scon in storageControllers:
-            self.add_text(_(u'Controller: {}').format(scon.name))
-            attachments = machine.getMediumAttachmentsOfController(scon.name)
-            slot_names = [vb_text.get_storage_slot_name(scon.bus, att.port, att.device)
-                          for att in attachments]
-            self.add_info_group(None, [
-                (slot_names[slot], vb_text.get_attachment_desc(attachments[slot]))
-                    for slot in range(len(attachments))], left_pad=4)
-
-        if machine.audioAdapter.enabled:
-            audio = machine.audioAdapter
+        for scon_name, attachments in details.storage:
+            self.add_text(_(u'Controller: {}').format(scon_name))
+            self.add_info_group(None, attachments, left_pad=4)
+
+        if details.audio is not None:
+            audio_driver, audio_controller = details.audio
             self.add_info_group(_(u'Audio'), [
-                (_(u'Host Driver'), vb_enum.AudioDriverType_text(audio.audioDriver)),
-                (_(u'Controller'), vb_enum.AudioControllerType_text(audio.audioController))
+                (_(u'Host Driver'), vb_enum.AudioDriverType_text(audio_driver, host_name)),
+                (_(u'Controller'), vb_enum.AudioControllerType_text(audio_controller, host_name))
             ])
 
-        maxAdapters = vbox.systemProperties.getMaxNetworkAdapters(machine.chipsetType)
-        adapter_group = []
-        for ad in range(maxAdapters):
-            adapter = machine.getNetworkAdapter(ad)
-            if not adapter.enabled:
-                continue
-            desc = vb_text.get_network_adapter_desc(adapter)
-            if desc != u'':
-                adapter_group.append((_(u'Adapter {}').format(adapter.slot + 1), desc))
-        self.add_info_group(_(u'Network'), adapter_group)
+        self.add_info_group(_(u'Network'), [
+            (_(u'Adapter {}').format(slot + 1), desc)
+            for slot, desc in details.network])
 
-        maxSerialPorts = vbox.systemProperties.serialPortCount
         serial_group = []
-        for sp in range(maxSerialPorts):
-            port = machine.getSerialPort(sp)
-            if not port.enabled:
-                continue
-            port_text = u'{}: {}'.format(vb_text.serial_port_name(port),
-                                         vb_enum.PortMode_text(port.hostMode))
-            if port.hostMode in {vbox.constants.PortMode_HostPipe,
-                                 vbox.constants.PortMode_HostDevice,
-                                 vbox.constants.PortMode_RawFile,
-                                 vbox.constants.PortMode_TCP}:
-                port_text += u' ({})'.format(port.path)
-            serial_group.append((_(u'Port {}').format(port.slot + 1), port_text))
+        for slot, name, host_mode, path in details.serial_ports:
+            port_text = u'{}: {}'.format(name, vb_enum.PortMode_text(host_mode, host_name))
+            if path is not None:
+                port_text += u' ({})'.format(path)
+            serial_group.append((_(u'Port {}').format(slot + 1), port_text))
         self.add_info_group(_(u'Serial Ports'), serial_group)
 
-        maxParallelPorts = vbox.systemProperties.parallelPortCount
-        parallel_group = []
-        for pp in range(maxParallelPorts):
-            port = machine.getParallelPort(pp)
-            if not port.enabled:
-                continue
-            port_text = u'{} ({})'.format(vb_text.parallel_port_name(port), port.path)
-            parallel_group.append((_(u'Port {}').format(port.slot + 1), port_text))
-        self.add_info_group(_(u'Parallel Ports'), parallel_group)
+        self.add_info_group(_(u'Parallel Ports'), [
+            (_(u'Port {}').format(slot + 1), u'{} ({})'.format(name, path))
+            for slot, name, host_mode, path in details.parallel_ports])
 
-        usb_filters = machine.USBDeviceFilters
-        if usb_filters is not None and machine.USBProxyAvailable:
+        if details.usb is not None:
+            controllers, filt_count, filt_active = details.usb
             usb_group = []
-            controllers = vbox.mgr.getArray(machine, 'USBControllers')
-            clist = []
-            for c in controllers:
-                clist.append(c.name)
-            if len(clist) > 0:
-                usb_group.append((_(u'USB Controller'), u', '.join(clist)))
+            if len(controllers) > 0:
+                usb_group.append((_(u'USB Controller'), u', '.join(controllers)))
             else:
                 usb_group.append((_(u'USB Controller'), _(u'Disabled')))
-            filt_active = 0
-            filters = vbox.mgr.getArray(usb_filters, 'deviceFilters')
-            for df in filters:
-                if df.active:
-                    filt_active += 1
-            usb_group.append((_(u'Device Filters'), _(u'{} ({} active)').format(len(filters), filt_active)))
+            usb_group.append((_(u'Device Filters'), _(u'{} ({} active)').format(filt_count, filt_active)))
             self.add_info_group(_(u'USB'), usb_group)
 
-        sharedFolders = vbox.mgr.getArray(machine, 'sharedFolders')
         sf_group = []
-        for sf in sharedFolders:
-            details = []
-            if not sf.writable:
-                details.append(_(u'Read-Only'))
-            if sf.autoMount:
-                details.append(_(u'Auto-Mount'))
-            if len(details) > 0:
-                sf_group.append((sf.name, u'{} ({})'.format(sf.hostPath, u', '.join(details))))
+        for name, host_path, writable, auto_mount in details.shared_folders:
+            sf_details = []
+            if not writable:
+                sf_details.append(_(u'Read-Only'))
+            if auto_mount:
+                sf_details.append(_(u'Auto-Mount'))
+            if len(sf_details) > 0:
+                sf_group.append((name, u'{} ({})'.format(host_path, u', '.join(sf_details))))
             else:
-                sf_group.append((sf.name, sf.hostPath))
+                sf_group.append((name, host_path))
         self.add_info_group(_(u'Shared Folders'), sf_group)
 
-        if len(machine.description) > 0:
+        if len(details.description) > 0:
             self.add_header(_(u'Description'))
-            self.add_text(('info', machine.description))
+            self.add_text(('info', details.description))
+
+    def metrics_lines(self, machine_id, width=30):
+        if self.metrics is None:
+            return []
+        lines = self.live_metrics(machine_id, width)
+        for name, label in [('cpu', _(u'CPU, last hour')), ('ram_used', _(u'RAM, last hour'))]:
+            values = self.metrics.saved_history(machine_id, name, 3600, width)
+            if values is not None:
+                maximum = 100 if name == 'cpu' else None
+                lines.append((label, sparkline(values, width, maximum), u''))
+        return [(label, u'{} {}'.format(spark, text)) for label, spark, text in lines]
+
+    def live_metrics(self, machine_id, width):
+        get = lambda name: self.metrics.get(machine_id, name)
+        cpu = get('cpu')
+        if cpu is None or len(cpu) == 0:
+            return []
+
+        lines = []
+        lines.append((_(u'CPU'), sparkline(cpu.values(), width, 100),
+                      format_percent(cpu.last())))
+        ram_used = get('ram_used')
+        ram_total = get('ram_total').last()
+        if vb_metrics.has_value(ram_used.last()) and vb_metrics.has_value(ram_total):
+            ram_text = u'{} / {}'.format(vb_text.format_size(int(ram_used.last()) * 1024),
+                                         vb_text.format_size(int(ram_total) * 1024))
+        else:
+            ram_text = _(u'n/a')
+        lines.append((_(u'RAM'), sparkline(ram_used.values(), width,
+                      ram_total if vb_metrics.has_value(ram_total) else None), ram_text))
+        rx = get('net_rx')
+        tx = get('net_tx')
+        if vb_metrics.has_value(rx.last()) and vb_metrics.has_value(tx.last()):
+            net_text = _(u'Rx {}, Tx {}').format(format_rate(rx.last()), format_rate(tx.last()))
+        else:
+            net_text = _(u'n/a')
+        lines.append((_(u'Network'), sparkline([r + t for r, t in zip(rx.values(), tx.values())],
+                      width), net_text))
+        return lines
+
+    def update_metrics(self):
+        # Rebuilding the rows is cheap, and only the performance section's
+        # widgets will differ
+        if self.details is not None and self.details.accessible:
+            self.show_details(self.details)
@@ -16,21 +16,48 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import urwid
+from collections import OrderedDict
+from itertools import compress, izip
 
-from vbifc import VBoxWrapper, vb_enum
+from vbifc import VBoxWrapper, get_host, host_names, vb_enum, vb_events, vb_hosts, vb_search
+from metrics import sparkline, format_percent
+from . import VBCUIEventLoop
 
 class MachineNodeKey(object):
-    def __init__(self, machine):
-        self.machine = machine
+    def __init__(self, machine_id, host_name=None):
+        self.machine_id = machine_id
+        self.host_name = host_name
 
-    def get_display_text(self):
-        return [vb_enum.MachineState_icon(self.machine.state), u' ' + self.machine.name]
+    # Keys compare by identity of what they refer to, so reloading a group's
+    # children keeps the existing nodes for unchanged entries
+    def __eq__(self, other):
+        return isinstance(other, MachineNodeKey) and self.machine_id == other.machine_id \
+               and self.host_name == other.host_name
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.machine_id)
 
 
 class MachineGroupNodeKey(object):
-    def __init__(self, path, default_expanded=True):
+    # With more than one host, the root's key has no host_name, and each
+    # host's tree hangs off a '/' key of its own
+    def __init__(self, path, default_expanded=True, host_name=None):
         self.path = path
         self.default_expanded = default_expanded
+        self.host_name = host_name
+
+    def __eq__(self, other):
+        return isinstance(other, MachineGroupNodeKey) and self.path == other.path \
+               and self.host_name == other.host_name
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.path)
 
     def get_display_text(self):
         if self.path == u'/':
@@ -38,140 +65,199 @@ class MachineGroupNodeKey(object):
         return self.path[self.path.rfind(u'/')+1:]
 
 
-class MachineNodeWidget(urwid.TreeWidget):
+class MachineRowWidget(urwid.WidgetWrap):
+    """Displays one row of the machine list.  These are only created for
+    the rows on screen, and are re-pointed at other nodes as the list
+    scrolls (see MachineListWalker)."""
+
+    indent_cols = 3
+
+    # Width of the optional CPU column: a sparkline and the latest value
+    metrics_spark_cols = 8
+    metrics_cols = metrics_spark_cols + 5
+
     def __init__(self, node):
-        super(MachineNodeWidget, self).__init__(node)
-        self._w = urwid.AttrWrap(self._w, None)
-        self._w.focus_attr = 'focus'
+        self._text = urwid.Text(u'', wrap='clip')
+        self._metrics = urwid.Text(u'', align='right', wrap='clip')
+        self._columns = urwid.Columns([self._text])
+        super(MachineRowWidget, self).__init__(urwid.AttrMap(self._columns, None, 'focus'))
+        self.set_node(node)
 
     def selectable(self):
         return True
 
     def keypress(self, size, key):
-        # Make the Left and Right keys behave somewhat consistently with
-        # each other, which is apparently not the default
-        key = super(MachineNodeWidget, self).keypress(size, key)
-        if key in {'left', 'h'}:
-            if not self.is_leaf:
-                self.expanded = False
-                self.update_expanded_icon()
-        elif key == 'l':
-            if not self.is_leaf:
-                self.expanded = True
-                self.update_expanded_icon()
-        else:
-            return key
+        return key
 
-    def get_display_text(self):
-        return self.get_node().get_key().get_display_text()
-
-    def reload_text(self):
-        iw = self.get_inner_widget()
-        iw.set_text(self.get_display_text())
+    def get_node(self):
+        return self._node
 
+    def set_node(self, node):
+        self._node = node
+        indent = u' ' * (self.indent_cols * node.get_depth())
+        if isinstance(node, MachineGroupNode):
+            icon = u'-' if node.expanded else u'+'
+            self._text.set_text([indent, icon, u' ', node.get_display_text()])
+        else:
+            icon, name = node.get_display_text()
+            if node.is_marked():
+                name = ('marked', name + u' *')
+            self._text.set_text([indent, icon, u' ', name])
+        self.set_metrics(node)
+
+    def set_metrics(self, node):
+        metrics = node.get_root().metrics
+        cpu = None
+        if metrics is not None and isinstance(node, MachineNode):
+            cpu = metrics.get(node.selection_id, 'cpu')
+        if cpu is None or len(cpu) == 0:
+            if len(self._columns.contents) > 1:
+                del self._columns.contents[1:]
+            return
+        self._metrics.set_text(u'{} {:>4}'.format(
+                sparkline(cpu.values(), self.metrics_spark_cols, 100),
+                format_percent(cpu.last())))
+        if len(self._columns.contents) == 1:
+            self._columns.contents.append((self._metrics,
+                    self._columns.options(urwid.GIVEN, self.metrics_cols)))
 
-class MachineGroupWidget(MachineNodeWidget):
-    def __init__(self, node):
-        super(MachineGroupWidget, self).__init__(node)
-        self.expanded = node.get_key().default_expanded
-        self.update_expanded_icon()
+    def reload_text(self):
+        if isinstance(self._node, MachineNode):
+            self._node.refresh()
+        self.set_node(self._node)
 
 
 class MachineNode(urwid.TreeNode):
+    # Only the machine's id is kept, along with the little bit of data
+    # needed to draw its row.  The IMachine itself is looked up on demand.
     def __init__(self, node, parent=None):
         if parent is None:
             depth = 0
         else:
             depth = parent.get_depth() + 1
         urwid.TreeNode.__init__(self, node, key=node, parent=parent, depth=depth)
+        self.name = None
+        self.state = None
 
     @property
     def machine(self):
-        return self.get_value().machine
+        return VBoxWrapper(self.host_name).machines_by_id.get(self.selection_id)
+
+    @property
+    def host_name(self):
+        return self.get_value().host_name
 
     @property
     def selection_id(self):
-        return self.machine.id
+        return self.get_value().machine_id
+
+    def is_marked(self):
+        return self.selection_id in self.get_root().marked
+
+    def refresh(self):
+        machine = self.machine
+        if machine is None:
+            # Unregistered, and the tree hasn't caught up yet
+            self.name = self.selection_id
+            self.state = None
+            return
+        self.name = machine.name
+        self.state = machine.state
 
-    def load_widget(self):
-        return MachineNodeWidget(self)
+    def get_display_text(self):
+        if self.name is None:
+            self.refresh()
+        return (vb_enum.MachineState_icon(self.state, self.host_name), self.name)
 
 
 class MachineGroupNode(urwid.ParentNode):
     def __init__(self, node, parent=None):
-        if isinstance(node, unicode):
-            # Mostly a shortcut for the initial node creation
-            node = MachineGroupNodeKey(node)
-
-        if node.path == u'/':
+        if parent is None:
             depth = 0
         else:
-            depth = node.path.count(u'/')
+            depth = parent.get_depth() + 1
         super(MachineGroupNode, self).__init__(node, key=node, parent=parent, depth=depth)
-        self._machines = None
+        self.expanded = node.default_expanded
         self._group_count = None
+        # Set of marked machine ids -- only used on the root node
+        self.marked = set()
+        # MetricsMonitor while the CPU column is shown -- root node only
+        self.metrics = None
 
     @property
     def path(self):
         return self.get_value().path
 
     @property
-    def selection_id(self):
-        return self.path
+    def host_name(self):
+        return self.get_value().host_name
 
     @property
-    def machines(self):
-        if self._machines is None:
-            self._machines = []
-            vbox = VBoxWrapper()
-            for mach in vbox.machines:
-                mgroups = vbox.mgr.getArray(mach, 'groups')
-                if self.path in mgroups:
-                    self._machines.append(mach)
-        return self._machines
+    def selection_id(self):
+        return (self.host_name, self.path)
+
+    def is_marked(self):
+        return False
+
+    def get_display_text(self):
+        if self.path == u'/' and self.host_name is not None and not self.is_root():
+            host = get_host(self.host_name)
+            if host.error is not None:
+                return _(u'{} (not connected)').format(host.name)
+            if not VBoxWrapper.connected(host.name):
+                return _(u'{} (connecting...)').format(host.name)
+            return host.name
+        return self.get_value().get_display_text()
+
+    def all_machine_ids(self):
+        if self.host_name is None:
+            ids = set()
+            for node in self.child_nodes():
+                ids |= node.all_machine_ids()
+            return ids
+        if get_host(self.host_name).error is not None:
+            return set()
+        return VBoxWrapper(self.host_name).group_machine_ids(self.path)
 
     def load_child_keys(self):
-        subgroups = []
-        vbox = VBoxWrapper()
-        for group in vbox.machine_groups:
-            if self.path == group:
-                continue
-            if group.startswith(self.path):
-                groupname = group[len(self.path):]
-                if u'/' in groupname:
-                    continue
-                subgroups.append(group)
+        if self.host_name is None:
+            return [MachineGroupNodeKey(u'/', host_name=name) for name in host_names()]
+        if not VBoxWrapper.connected(self.host_name) \
+                or get_host(self.host_name).error is not None:
+            # The tree is rebuilt by reload() once the connection is up
+            return []
+
+        vbox = VBoxWrapper(self.host_name)
+        subgroups = vbox.group_children.get(self.path, [])
+        machine_ids = vbox.group_members.get(self.path, [])
         self._group_count = len(subgroups)
 
         # Try to sort these to match the VirtualBox GUI's sorting
         # TODO: Allow this to be modified and saved as well
-        order = vbox.vbox.getExtraData(u'GUI/GroupDefinitions' + self.path)
         children = []
-        machines = self.machines[:]
-        if order is not None:
-            order = order.split(u',')
-            for ob in order:
-                if ob.startswith(u'go=') or ob.startswith(u'gc='):
-                    group = self.path + ob[3:]
-                    children.append(MachineGroupNodeKey(group, ob.startswith(u'go=')))
-                    try:
-                        subgroups.remove(group)
-                    except ValueError:
-                        pass
-                elif ob.startswith(u'm='):
-                    for mach in machines:
-                        if mach.id == ob[2:]:
-                            children.append(MachineNodeKey(mach))
-                            try:
-                                machines.remove(mach)
-                            except ValueError:
-                                pass
+        unsorted_groups = set(subgroups)
+        unsorted_machines = set(machine_ids)
+        prefix = u'' if self.path == u'/' else self.path
+        for ob in vbox.group_definitions.get(self.path, []):
+            if ob.startswith(u'go=') or ob.startswith(u'gc='):
+                group = prefix + u'/' + ob[3:]
+                if group in unsorted_groups:
+                    children.append(MachineGroupNodeKey(group, ob.startswith(u'go='),
+                                                        self.host_name))
+                    unsorted_groups.discard(group)
+            elif ob.startswith(u'm='):
+                mach_id = ob[2:]
+                if mach_id in unsorted_machines:
+                    children.append(MachineNodeKey(mach_id, self.host_name))
+                    unsorted_machines.discard(mach_id)
 
         # Ensure any unsorted groups and machines get added as well
         for group in subgroups:
-            children.append(MachineGroupNodeKey(group))
-        for mach in machines:
-            children.append(MachineNodeKey(mach))
+            if group in unsorted_groups:
+                children.append(MachineGroupNodeKey(group, host_name=self.host_name))
+        for mach_id in machine_ids:
+            if mach_id in unsorted_machines:
+                children.append(MachineNodeKey(mach_id, self.host_name))
         return children
 
     def load_child_node(self, key):
@@ -180,15 +266,191 @@ class MachineGroupNode(urwid.ParentNode):
         else:
             return MachineNode(key, parent=self)
 
-    def load_widget(self):
-        return MachineGroupWidget(self)
-
-
-class MachineList(urwid.TreeListBox):
-    signals = ['selection_changed']
+    def child_nodes(self):
+        return [self.get_child_node(key) for key in self.get_child_keys()]
+
+    def loaded_children(self):
+        # Only the child nodes which have actually been created so far
+        if self._child_keys is None:
+            return []
+        return [self._children[key] for key in self._child_keys
+                if key in self._children]
+
+    def reload_children(self):
+        keys = set(self.get_child_keys(reload=True))
+        for key in list(self._children.keys()):
+            if key not in keys:
+                del self._children[key]
+
+
+class MachineListWalker(urwid.ListWalker):
+    """Walks the visible (expanded) rows of the machine tree.  Positions
+    are tree nodes, kept in a flat list so moving through the list doesn't
+    depend on the size of the tree.  Row widgets are only built for the
+    rows being displayed, and are recycled once they scroll out of view,
+    so their number depends on the screen size.  The nodes themselves are
+    still built for every row of every expanded group, so their memory
+    (an id, name and state per machine) grows with the inventory."""
+
+    def __init__(self, root):
+        self.pool_size = 128
+        self._widgets = OrderedDict()
+        # Set of machine ids to show, or None to show everything
+        self.matches = None
+        # Every node in tree order, as though all groups were expanded,
+        # with their selection ids -- filtering just picks rows out of these
+        self._tree_rows = None
+        self._tree_ids = None
+        # Machine id -> (host name, path) of every group leading to it
+        self._ancestors = {}
+        self.set_root(root)
+
+    def set_root(self, root):
+        self.root = root
+        self.focus = root
+        self._widgets.clear()
+        self.tree_changed()
+        self.refresh()
+        self._modified()
+
+    def tree_changed(self):
+        # Machines or groups were added, removed or moved
+        self._tree_rows = None
+        self._tree_ids = None
+        self._ancestors.clear()
+
+    def refresh(self):
+        # Rebuild the flat row list after groups were expanded, collapsed
+        # or reloaded.  The owner is responsible for redrawing.
+        if self.matches is None:
+            rows = []
+            pending = [self.root]
+            while len(pending) > 0:
+                node = pending.pop()
+                rows.append(node)
+                if isinstance(node, MachineGroupNode) and node.expanded:
+                    pending.extend(reversed(node.child_nodes()))
+        else:
+            # Show every match, along with the groups leading to it.  Machine
+            # ids and the (host name, path) of groups never compare equal.
+            if self._tree_rows is None:
+                self._load_tree()
+            shown = self._match_groups(self.matches)
+            shown |= self.matches
+            rows = [self.root]
+            rows.extend(compress(self._tree_rows, map(shown.__contains__, self._tree_ids)))
+        self.rows = rows
+        self._index = dict(izip(rows, xrange(len(rows))))
+        for node in list(self._widgets.keys()):
+            if node not in self._index:
+                del self._widgets[node]
+        if self.focus not in self._index:
+            self.set_focus(self.root)
+
+    def _load_tree(self):
+        rows = []
+        pending = list(reversed(self.root.child_nodes()))
+        while len(pending) > 0:
+            node = pending.pop()
+            rows.append(node)
+            if isinstance(node, MachineGroupNode):
+                pending.extend(reversed(node.child_nodes()))
+        self._tree_rows = rows
+        self._tree_ids = [node.selection_id for node in rows]
+
+    def _match_groups(self, matches):
+        # (host name, path) of every group leading to a match
+        ancestors = self._ancestors
+        try:
+            return set().union(*map(ancestors.__getitem__, matches))
+        except KeyError:
+            self._find_ancestors([mach_id for mach_id in matches if mach_id not in ancestors])
+            return set().union(*map(ancestors.__getitem__, matches))
+
+    def _find_ancestors(self, machine_ids):
+        hosts = [(name, VBoxWrapper(name).groups_by_id) for name in host_names()
+                 if VBoxWrapper.connected(name) and get_host(name).error is None]
+        for mach_id in machine_ids:
+            paths = set()
+            for host_name, groups_by_id in hosts:
+                if mach_id in groups_by_id:
+                    paths.add((host_name, u'/'))
+                    for path in groups_by_id[mach_id]:
+                        while (host_name, path) not in paths:
+                            paths.add((host_name, path))
+                            path = path[:path.rfind(u'/')] or u'/'
+                    break
+            self._ancestors[mach_id] = frozenset(paths)
+
+    def reserve(self, count):
+        # Make sure there are enough widgets to cover count rows without
+        # recycling any that are still on screen
+        self.pool_size = max(self.pool_size, count)
+
+    def get_widget(self, node):
+        widget = self._widgets.pop(node, None)
+        if widget is None:
+            if len(self._widgets) >= self.pool_size:
+                old_node, widget = self._widgets.popitem(last=False)
+                widget.set_node(node)
+            else:
+                widget = MachineRowWidget(node)
+        self._widgets[node] = widget
+        return widget
+
+    def update_node(self, node):
+        # Redraw node's row, if it currently has a widget
+        widget = self._widgets.get(node)
+        if widget is not None:
+            widget.set_node(node)
+
+    def update_metrics(self):
+        for node, widget in self._widgets.items():
+            widget.set_metrics(node)
+
+    def index(self, node):
+        return self._index.get(node)
+
+    def get_focus(self):
+        return self.get_widget(self.focus), self.focus
+
+    def set_focus(self, focus):
+        self.focus = focus
+        self._modified()
+
+    def get_next(self, start_from):
+        idx = self._index.get(start_from)
+        if idx is None or idx + 1 >= len(self.rows):
+            return None, None
+        node = self.rows[idx + 1]
+        return self.get_widget(node), node
+
+    def get_prev(self, start_from):
+        idx = self._index.get(start_from)
+        if idx is None or idx == 0:
+            return None, None
+        node = self.rows[idx - 1]
+        return self.get_widget(node), node
+
+
+class MachineList(urwid.ListBox):
+    signals = ['selection_changed', 'filter_changed', 'host_refreshed']
 
     def __init__(self):
-        self.walker = urwid.TreeWalker(MachineGroupNode(u'/'))
+        self.marked = set()
+        self.metrics = None
+        self.filter_text = u''
+        self._search_index = None
+        # Job building the search index on the search worker, and the ids of
+        # machines that changed while it was being built
+        self._index_job = None
+        self._index_stale = set()
+        self._search_worker = None
+        # Hosts which are being re-fetched by reload()
+        self.refreshing = set()
+        self.root = self.make_root()
+        self.root.marked = self.marked
+        self.walker = MachineListWalker(self.root)
         super(MachineList, self).__init__(self.walker)
 
         urwid.connect_signal(self.walker, 'modified', self.walker_modified)
@@ -199,6 +461,57 @@ class MachineList(urwid.TreeListBox):
         self._command_map['ctrl f'] = urwid.CURSOR_PAGE_DOWN
         self._command_map['ctrl b'] = urwid.CURSOR_PAGE_UP
 
+    def render(self, size, focus=False):
+        # Enough row widgets for the whole screen, plus the rows ListBox
+        # looks at just beyond it
+        self.walker.reserve(size[1] * 2 + 8)
+        return super(MachineList, self).render(size, focus)
+
+    def keypress(self, size, key):
+        key = super(MachineList, self).keypress(size, key)
+        node = self.walker.focus
+        if key == ' ':
+            self.toggle_mark()
+        elif key == 'esc':
+            if self.filter_text:
+                self.clear_filter()
+            else:
+                self.clear_marks()
+        elif key in {'+', 'right', 'l'}:
+            if isinstance(node, MachineGroupNode):
+                self.set_expanded(node, True)
+        elif key in {'-', 'left', 'h'}:
+            # Collapse the focused group, or move up to the parent group
+            if isinstance(node, MachineGroupNode) and node.expanded:
+                self.set_expanded(node, False)
+            elif not node.is_root():
+                self.change_focus(size, node.get_parent())
+                if key == '-':
+                    self.set_expanded(node.get_parent(), False)
+        elif key == 'home':
+            self.change_focus(size, self.walker.rows[0])
+        elif key == 'end':
+            self.change_focus(size, self.walker.rows[-1], size[1] - 1)
+        else:
+            return key
+
+    def mouse_event(self, size, event, button, col, row, focus):
+        handled = super(MachineList, self).mouse_event(size, event, button, col, row, focus)
+        node = self.walker.focus
+        if event == 'mouse press' and button == 1 and isinstance(node, MachineGroupNode):
+            # Clicking the +/- icon toggles the group
+            if col == MachineRowWidget.indent_cols * node.get_depth():
+                self.set_expanded(node, not node.expanded)
+                return True
+        return handled
+
+    def set_expanded(self, node, expanded):
+        if node.expanded != expanded:
+            node.expanded = expanded
+            self.walker.update_node(node)
+            self.walker.refresh()
+            self._invalidate()
+
     def walker_modified(self):
         if self.focus:
             sel_node = self.focus.get_node()
@@ -209,18 +522,315 @@ class MachineList(urwid.TreeListBox):
         urwid.emit_signal(self, 'selection_changed', sel_node)
 
     def reload(self):
-        selection = None
+        # This should force the whole tree to be re-generated.  Every host
+        # is fetched at once, and with a main loop to post back to, each
+        # host's part of the tree is rebuilt as soon as it arrives, so a
+        # slow host holds up neither the rest nor the UI.
+        loop = VBCUIEventLoop.instance
+        if loop is None:
+            vb_hosts.refresh_hosts()
+            self.rebuild()
+            return
+        names = host_names()
+        self.refreshing.update(names)
+        vb_hosts.refresh_hosts(names, lambda name: loop.post(self.host_refreshed, name))
+
+    def host_refreshed(self, host_name):
+        self.refreshing.discard(host_name)
+        self.rebuild_host(host_name)
+        urwid.emit_signal(self, 'host_refreshed', host_name)
+
+    def rebuild(self):
+        # Rebuilds the tree from what the hosts already have fetched
+        selection = self._selection()
+        self._sync_search()
+        self.root = self.make_root()
+        self.root.marked = self.marked
+        self.root.metrics = self.metrics
+        self.walker.set_root(self.root)
+        self._restore_selection(selection)
+
+    def rebuild_host(self, host_name):
+        # Rebuilds only host_name's part of the tree, keeping the rest
+        if self.root.host_name is not None:
+            # The only host is the whole tree
+            self.rebuild()
+            return
+        selection = self._selection()
+        self._sync_search()
+        self.root.get_child_node(MachineGroupNodeKey(u'/', host_name=host_name), reload=True)
+        self.walker.tree_changed()
+        self.walker.refresh()
+        self._restore_selection(selection)
+        self._invalidate()
+
+    def _selection(self):
         if self.focus:
-            sel_node = self.focus.get_node()
-            selection = sel_node.selection_id
+            return self.focus.get_node().selection_id
+        return None
 
-        # This should force the whole tree to be re-generated
-        VBoxWrapper().drop_cache()
-        self.walker.set_focus(MachineGroupNode(u'/'))
-
-        node = self.walker.focus
-        while node is not None:
+    def _restore_selection(self, selection):
+        if self.walker.focus.selection_id == selection:
+            return
+        for node in self.walker.rows:
             if node.selection_id == selection:
                 self.walker.set_focus(node)
                 break
-            widget, node = self.walker.get_next(node)
+
+    def _sync_search(self):
+        # Catch the search index up with a re-fetched host
+        if self._search_index is not None:
+            self._search_index.sync()
+            if self.filter_text:
+                self.walker.matches = self._search_index.search(self.filter_text)
+
+    @staticmethod
+    def make_root():
+        # With a single host, its groups are shown directly at the top
+        names = host_names()
+        if len(names) == 1:
+            return MachineGroupNode(MachineGroupNodeKey(u'/', host_name=names[0]))
+        return MachineGroupNode(MachineGroupNodeKey(u'/'))
+
+    def prepare_search(self):
+        """Start building the search index on a worker, if it isn't built
+        yet.  Searches made before it's ready are applied once it is."""
+        if self._search_index is not None or self._index_job is not None:
+            return
+        if VBCUIEventLoop.instance is None:
+            self._search_index = vb_search.build_index()
+            return
+        if self._search_worker is None:
+            self._search_worker = VBCUIEventLoop.instance.start_worker('search')
+        self._index_stale.clear()
+        self._index_job = self._search_worker.submit(vb_search.build_index, (),
+                                                     self._on_index_built)
+
+    def _on_index_built(self, job, result, error):
+        if job is not self._index_job:
+            return
+        self._index_job = None
+        if error is not None:
+            self.filter_text = u''
+            urwid.emit_signal(self, 'filter_changed')
+            return
+
+        # Catch up with anything that changed while it was being built
+        index = result
+        index.sync()
+        for mach_id in self._index_stale:
+            index.update(mach_id)
+        self._index_stale.clear()
+        self._search_index = index
+        if self.filter_text:
+            self.set_filter(self.filter_text)
+
+    @property
+    def indexing(self):
+        return self._index_job is not None
+
+    @property
+    def match_count(self):
+        if self.walker.matches is None:
+            return None
+        return len(self.walker.matches)
+
+    def set_filter(self, query):
+        """Only show machines matching query (see vb_search), moving the
+        focus to the first match if it isn't already on one"""
+        self.filter_text = query
+        if query.strip() == u'':
+            matches = None
+        elif self._search_index is None:
+            self.prepare_search()
+            if self._search_index is None:
+                urwid.emit_signal(self, 'filter_changed')
+                return
+            matches = self._search_index.search(query)
+        else:
+            matches = self._search_index.search(query)
+        if matches == self.walker.matches:
+            # Typing often doesn't change the result (yet)
+            urwid.emit_signal(self, 'filter_changed')
+            return
+        self.walker.matches = matches
+        self.walker.refresh()
+        focus = self.walker.focus
+        if self.walker.matches is not None and not isinstance(focus, MachineNode):
+            self.focus_match()
+        self._invalidate()
+        urwid.emit_signal(self, 'filter_changed')
+
+    def clear_filter(self):
+        # Keep the focus where it was, expanding its groups if necessary
+        self.filter_text = u''
+        self.walker.matches = None
+        node = self.walker.focus
+        while not node.is_root():
+            node = node.get_parent()
+            node.expanded = True
+        self.walker.refresh()
+        self._invalidate()
+        urwid.emit_signal(self, 'filter_changed')
+
+    def focus_match(self, forward=True):
+        # Move to the next (or previous) visible machine
+        node = self.walker.focus
+        while True:
+            if forward:
+                widget, node = self.walker.get_next(node)
+            else:
+                widget, node = self.walker.get_prev(node)
+            if node is None:
+                return
+            if isinstance(node, MachineNode):
+                self.walker.set_focus(node)
+                return
+
+    def toggle_mark(self):
+        if self.focus is None:
+            return
+        sel_node = self.focus.get_node()
+        if isinstance(sel_node, MachineGroupNode):
+            ids = sel_node.all_machine_ids()
+        else:
+            ids = {sel_node.selection_id}
+        if ids <= self.marked:
+            self.marked -= ids
+        else:
+            self.marked |= ids
+        self.reload_machine_text(ids)
+
+        # Move on to the next entry, to make marking a run of machines easy
+        widget, next_node = self.walker.get_next(sel_node)
+        if next_node is not None:
+            self.walker.set_focus(next_node)
+
+    def clear_marks(self):
+        ids = set(self.marked)
+        self.marked.clear()
+        self.reload_machine_text(ids)
+
+    def marked_machines(self):
+        machines = []
+        for mach_id in self.marked:
+            machine = VBoxWrapper.for_machine(mach_id).machines_by_id.get(mach_id)
+            if machine is not None:
+                machines.append(machine)
+        return machines
+
+    def reload_machine_text(self, machine_ids):
+        for node in self.loaded_nodes():
+            if isinstance(node, MachineNode) and node.selection_id in machine_ids:
+                self.walker.update_node(node)
+        self._invalidate()
+
+    def set_metrics(self, metrics):
+        """Show a CPU column for running machines from metrics (a
+        MetricsMonitor), or hide it if metrics is None"""
+        self.metrics = metrics
+        self.root.metrics = metrics
+        self.walker.update_metrics()
+        self._invalidate()
+
+    def update_metrics(self):
+        # Only the rows with widgets need to be redrawn
+        if self.metrics is not None:
+            self.walker.update_metrics()
+            self._invalidate()
+
+    def loaded_nodes(self):
+        nodes = []
+        pending = [self.root]
+        while len(pending) > 0:
+            node = pending.pop()
+            nodes.append(node)
+            if isinstance(node, MachineGroupNode):
+                pending.extend(node.loaded_children())
+        return nodes
+
+    def _update_index(self, machine_id):
+        if self._search_index is not None:
+            self._search_index.update(machine_id)
+        elif self._index_job is not None:
+            # Caught up with once the index is built
+            self._index_stale.add(machine_id)
+
+    def apply_events(self, events, host_name=None):
+        """Patch only the affected nodes of the tree for a batch of events
+        from host_name's vb_events.MachineEventListener"""
+        vbox = VBoxWrapper(host_name)
+        changed_machines = set()
+        changed_groups = set()
+        index = self._search_index
+        for kind, machine_id, value in events:
+            if kind == vb_events.MACHINE_REGISTERED:
+                changed_groups |= vbox.update_machine(machine_id, value)
+                if not value:
+                    self.marked.discard(machine_id)
+                self._update_index(machine_id)
+            elif kind == vb_events.MACHINE_DATA:
+                changed_groups |= vbox.update_machine(machine_id)
+                changed_machines.add(machine_id)
+                self._update_index(machine_id)
+            elif kind in vb_events.MEDIUM_KINDS or kind == vb_events.MACHINE_EXTRA_DATA:
+                # Only the details pane shows media and extra data
+                if machine_id is not None:
+                    changed_machines.add(machine_id)
+            else:
+                changed_machines.add(machine_id)
+                if kind == vb_events.MACHINE_STATE:
+                    if index is not None:
+                        index.update_state(machine_id, value)
+                    else:
+                        self._update_index(machine_id)
+
+        # Matches may have come or gone from the filtered view
+        refresh = len(changed_groups) > 0
+        if refresh:
+            self.walker.tree_changed()
+        if self.filter_text and index is not None and (len(changed_machines) > 0 or refresh):
+            matches = index.search(self.filter_text)
+            refresh = refresh or matches != self.walker.matches
+            self.walker.matches = matches
+
+        # Parent groups also need to pick up any added or removed subgroups
+        for path in list(changed_groups):
+            while path.rfind(u'/') > 0:
+                path = path[:path.rfind(u'/')]
+                changed_groups.add(path)
+        if len(changed_groups) > 0:
+            changed_groups.add(u'/')
+
+        focus_node = self.walker.focus
+        focus_changed = False
+        for node in self.loaded_nodes():
+            if isinstance(node, MachineGroupNode):
+                if node.host_name == vbox.host_name and node.path in changed_groups:
+                    node.reload_children()
+            elif node.selection_id in changed_machines:
+                if node.name is not None and node.machine is not None:
+                    node.refresh()
+                    self.walker.update_node(node)
+                if node is focus_node:
+                    focus_changed = True
+
+        # If the focused node went away, fall back to its nearest remaining
+        # ancestor group
+        node = focus_node
+        while not node.is_root():
+            parent = node.get_parent()
+            if node.get_key() not in parent.get_child_keys():
+                focus_node = parent
+                focus_changed = True
+            node = parent
+
+        if refresh:
+            self.walker.refresh()
+            if self.walker.index(focus_node) is None:
+                focus_node = self.walker.focus
+                focus_changed = True
+        if focus_changed:
+            self.walker.set_focus(focus_node)
+        else:
+            self._invalidate()
@@ -0,0 +1,232 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import urwid
+
+from vbifc import vb_enum, vb_media, vb_text
+from . import VBCUIEventLoop
+
+class MediaWidget(urwid.TreeWidget):
+    """One row of the media tree.  Only the name is indented, so the size
+    and state columns line up at every depth."""
+
+    size_cols = 12
+    state_cols = 20
+
+    def __init__(self, node):
+        super(MediaWidget, self).__init__(node)
+        # Differencing images are only loaded once they're asked for
+        self.expanded = node.get_depth() == 0 or isinstance(node, MediaCategoryNode)
+        self.refresh()
+
+    def selectable(self):
+        return True
+
+    def keypress(self, size, key):
+        if self.is_leaf:
+            return key
+        return super(MediaWidget, self).keypress(size, key)
+
+    def get_indented_widget(self):
+        indent = self.get_indent_cols()
+        if self.is_leaf:
+            icon = urwid.Text(u' ')
+        else:
+            icon = [self.unexpanded_icon, self.expanded_icon][self.expanded]
+        name, size, logical_size, state = self.get_node().get_columns()
+        return urwid.Columns([
+            ('fixed', indent + 1, urwid.Padding(icon, left=indent)),
+            urwid.Text(name, wrap='clip'),
+            ('fixed', self.size_cols, urwid.Text(logical_size, align='right')),
+            ('fixed', self.size_cols, urwid.Text(size, align='right')),
+            ('fixed', self.state_cols, urwid.Text(state, wrap='clip'))
+        ], dividechars=1)
+
+    def update_expanded_icon(self):
+        self.refresh()
+
+    def refresh(self):
+        self.is_leaf = not self.get_node().may_have_children()
+        self._w = urwid.AttrMap(self.get_indented_widget(), None, 'focus')
+
+
+class MediaNode(urwid.ParentNode):
+    def __init__(self, medium, manager, key=None, parent=None):
+        depth = 0 if parent is None else parent.get_depth() + 1
+        super(MediaNode, self).__init__(medium, key=key, parent=parent, depth=depth)
+        self.manager = manager
+        self.medium_id = medium.id
+        self.name = medium.name
+        manager.nodes[self.medium_id] = self
+
+    def load_widget(self):
+        return MediaWidget(self)
+
+    @property
+    def info(self):
+        return self.manager.states.get(self.medium_id)
+
+    def may_have_children(self):
+        # A medium which couldn't be checked is shown as a leaf, since its
+        # children can't be listed either
+        info = self.info
+        if isinstance(info, Exception):
+            return False
+        return info is None or info.child_count > 0
+
+    def get_columns(self):
+        info = self.info
+        if info is None:
+            return self.name, u'', u'', _(u'Checking...')
+        if isinstance(info, Exception):
+            return self.name, u'', u'', _(u'Error')
+        logical_size = u''
+        if info.logical_size is not None:
+            logical_size = vb_text.format_size(info.logical_size)
+        state = vb_enum.MediumState_text(info.state)
+        if info.machine_count == 0:
+            state = _(u'{} (unused)').format(state)
+        return self.name, vb_text.format_size(info.size), logical_size, state
+
+    def load_child_keys(self):
+        self.children = vb_media.child_media(self.get_value())
+        self.manager.check_media(self.children)
+        return range(len(self.children))
+
+    def load_child_node(self, key):
+        return MediaNode(self.children[key], self.manager, key=key, parent=self)
+
+
+class MediaCategoryNode(urwid.ParentNode):
+    def __init__(self, category, manager, key=None, parent=None):
+        super(MediaCategoryNode, self).__init__(category, key=key, parent=parent,
+                                                depth=0 if parent is None else 1)
+        self.manager = manager
+        self.media = None
+
+    def load_widget(self):
+        return MediaWidget(self)
+
+    def may_have_children(self):
+        return True
+
+    def get_columns(self):
+        dev_type, attr = self.get_value()
+        if dev_type is None:
+            return _(u'Virtual Media'), _(u'Actual Size'), _(u'Virtual Size'), _(u'State')
+        name = {
+            'hardDisks': _(u'Hard Disks'),
+            'DVDImages': _(u'Optical Disks'),
+            'floppyImages': _(u'Floppy Disks')
+        }[attr]
+        if self.media is not None:
+            name = u'{} ({})'.format(name, len(self.media))
+        return name, u'', u'', u''
+
+    def load_child_keys(self):
+        dev_type, attr = self.get_value()
+        if dev_type is None:
+            self.categories = vb_media.media_categories()
+            return range(len(self.categories))
+        self.media = vb_media.registered_media(attr)
+        self.manager.check_media(self.media)
+        return range(len(self.media))
+
+    def load_child_node(self, key):
+        dev_type, attr = self.get_value()
+        if dev_type is None:
+            return MediaCategoryNode(self.categories[key], self.manager, key=key, parent=self)
+        return MediaNode(self.media[key], self.manager, key=key, parent=self)
+
+
+class MediaManager(urwid.LineBox):
+    """Lists registered media.  Checking a medium's state and size may need
+    to touch its file, so that's done on a worker, and each row is filled in
+    as its result arrives."""
+
+    signals = ['close']
+
+    def __init__(self):
+        # Medium id -> vb_media.MediumState, or the exception checking it
+        self.states = {}
+        # Medium id -> MediaNode, for each node created so far
+        self.nodes = {}
+        # Job -> the id of the medium it's checking, read up front so a
+        # failed check doesn't have to ask the (possibly gone) medium again
+        self.jobs = {}
+        self.worker = VBCUIEventLoop.instance.start_worker('media')
+        self.status = urwid.Text(u'')
+        self.root = MediaCategoryNode((None, None), self)
+        self.list_box = urwid.TreeListBox(urwid.TreeWalker(self.root))
+        frame = urwid.Frame(self.list_box, footer=urwid.AttrMap(self.status, 'statusbar'))
+        super(MediaManager, self).__init__(frame, title=_(u'Virtual Media Manager'))
+        self.update_status()
+
+    def check_media(self, media):
+        for medium in media:
+            job = self.worker.submit(vb_media.MediumState, (medium,), self._on_state)
+            self.jobs[job] = medium.id
+        self.update_status()
+
+    def _on_state(self, job, state, error):
+        if job.cancelled:
+            # Posted before a refresh, but delivered after it
+            return
+        medium_id = self.jobs.pop(job)
+        self.states[medium_id] = error if error is not None else state
+        node = self.nodes.get(medium_id)
+        if node is not None and node._widget is not None:
+            node._widget.refresh()
+            self.list_box._invalidate()
+        self.update_status()
+
+    def update_status(self):
+        if len(self.jobs) > 0:
+            self.status.set_text(_(u'Checking {} media...  r: Refresh  Esc: Close').format(
+                                 len(self.jobs)))
+        else:
+            self.status.set_text(_(u'r: Refresh  Esc: Close'))
+
+    def keypress(self, size, key):
+        key = super(MediaManager, self).keypress(size, key)
+        if key in {'esc', 'q'}:
+            self.close()
+        elif key == 'r':
+            self.refresh()
+        else:
+            return key
+
+    def cancel_jobs(self):
+        for job in self.jobs:
+            job.cancel()
+        self.jobs = {}
+
+    def refresh(self):
+        # Re-list everything, and check it all again
+        self.cancel_jobs()
+        self.states.clear()
+        self.nodes.clear()
+        self.root = MediaCategoryNode((None, None), self)
+        self.list_box.body = urwid.TreeWalker(self.root)
+        self.list_box._invalidate()
+        self.update_status()
+
+    def close(self):
+        self.cancel_jobs()
+        self.worker.stop()
+        VBCUIEventLoop.instance.workers.remove(self.worker)
+        urwid.emit_signal(self, 'close')
@@ -0,0 +1,149 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import time
+import socket
+
+from vbifc import get_host, vb_events, vb_metrics, vb_text
+from . import VBCUIEventLoop
+
+SPARK_CHARS = u' \u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588'
+
+def sparkline(values, width, maximum=None):
+    """Draw the last width values as a row of block characters, scaled to
+    maximum (or the largest value shown).  Missing samples are blank."""
+    values = values[-width:]
+    if maximum is None:
+        maximum = max([val for val in values if vb_metrics.has_value(val)] or [0])
+    chars = []
+    for val in values:
+        if not vb_metrics.has_value(val) or maximum <= 0:
+            chars.append(u' ')
+        else:
+            level = int(round(min(val, maximum) * (len(SPARK_CHARS) - 1) / maximum))
+            chars.append(SPARK_CHARS[max(level, 1) if val > 0 else 0])
+    return u' ' * (width - len(chars)) + u''.join(chars)
+
+def format_rate(rate):
+    return _(u'{}/s').format(vb_text.format_size(int(rate)))
+
+def format_percent(value):
+    if not vb_metrics.has_value(value):
+        return _(u'n/a')
+    return u'{:.0f}%'.format(value)
+
+
+class MetricsMonitor(object):
+    """Samples the performance metrics of running machines on a worker
+    every interval seconds, and calls updated() on the main loop as each
+    sample arrives"""
+
+    # Seconds between samples
+    interval = 2
+
+    # Samples of history kept for each machine
+    history_size = 60
+
+    def __init__(self, updated):
+        self.collector = vb_metrics.MetricsCollector(self.history_size, self.interval)
+        self.updated = updated
+        self.worker = None
+        self.pending = None
+        self.error = None
+        self.store = None
+
+    def start(self, store_path=None):
+        # The row and details widgets only need the drawing helpers here,
+        # so the history store isn't loaded until monitoring starts
+        from vbifc import vb_history
+        self.worker = VBCUIEventLoop.instance.start_worker('metrics')
+        if store_path is None:
+            # Named after the host the metrics are collected from
+            host = get_host()
+            store_path = vb_history.default_path(
+                    socket.gethostname() if host.is_local else host.name)
+        try:
+            store = vb_history.HistoryStore(store_path)
+            store.open()
+        except (IOError, OSError, ValueError):
+            # Live metrics still work without any saved history
+            store = None
+        if store is not None:
+            self.store = store
+            self.worker.submit(store.load, (), self._on_loaded)
+        VBCUIEventLoop.instance.metrics_monitors.append(self)
+        self._poll()
+
+    def stop(self):
+        # Save the window being recorded, so quitting doesn't lose it
+        if self.store is not None:
+            if self.store.loaded:
+                self.store.flush()
+            self.store.close()
+            self.store = None
+
+    def _on_loaded(self, job, result, error):
+        if error is not None:
+            self.store = None
+        else:
+            self.updated()
+
+    def _poll(self, loop=None, user_data=None):
+        # If the last query is still running, just skip this one
+        if self.pending is None:
+            running = self.collector.running
+            ids = list(running) if running is not None else None
+            self.pending = self.worker.submit(self.collector.query, (ids,),
+                                              self._on_samples)
+        if self.store is not None and self.store.readonly and self.store.loaded:
+            # Pick up what the vboxcli recording the history has written
+            self.worker.submit(self.store.refresh, (), self._on_refreshed, tag='history')
+        VBCUIEventLoop.instance.set_alarm_in(self.interval, self._poll)
+
+    def _on_refreshed(self, job, changed, error):
+        if changed:
+            self.updated()
+
+    def _on_samples(self, job, samples, error):
+        self.pending = None
+        self.error = error
+        if error is None:
+            self.collector.add_samples(samples, complete=job.args[0] is None)
+            if self.store is not None:
+                self.store.record(samples, time.time())
+            self.updated()
+
+    def handle_events(self, events):
+        for kind, machine_id, value in events:
+            if kind == vb_events.MACHINE_STATE:
+                self.collector.machine_state(machine_id, value)
+            elif kind == vb_events.MACHINE_REGISTERED and not value:
+                self.collector.machine_state(machine_id, None)
+
+    def get(self, mach_id, name):
+        return self.collector.get(mach_id, name)
+
+    def saved_history(self, mach_id, name, seconds, buckets):
+        """Averages of name over the last seconds from the history file,
+        or None if there's nothing saved for that time"""
+        if self.store is None or not self.store.loaded:
+            return None
+        now = time.time()
+        values = self.store.series(mach_id, name, now - seconds, now, buckets)
+        if not any(vb_metrics.has_value(val) for val in values):
+            return None
+        return values
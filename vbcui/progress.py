@@ -0,0 +1,113 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import urwid
+
+from vbifc import vb_progress
+from . import VBCUIEventLoop
+
+class StatusBar(urwid.ProgressBar):
+    text_align = urwid.LEFT
+
+    def __init__(self):
+        self.status_text = u''
+        # Shown after the completion, e.g. the key to cancel
+        self.hint_text = u''
+        super(StatusBar, self).__init__('statusbar', 'progress', 0, 100)
+
+    def set_text(self, text, hint=u''):
+        self.status_text = text
+        self.hint_text = hint
+        self.set_completion(0)
+
+    def get_text(self):
+        text = self.status_text
+        if self.current != 0:
+            text = u'{} ({} %)'.format(text, self.current)
+        if self.hint_text:
+            text = u'{}  {}'.format(text, self.hint_text)
+        return text
+
+
+class ProgressMonitor(object):
+    """Polls in-flight IProgress operations from main loop alarms, keeping
+    the status bar updated with their combined completion.  The owner
+    passes cancel_key presses on to cancel_all()."""
+
+    # Seconds between polls while any operation is active
+    poll_interval = 0.2
+
+    cancel_key = 'ctrl x'
+
+    def __init__(self, status_bar, idle_text=u''):
+        self.status_bar = status_bar
+        # Shown while nothing is in progress
+        self.idle_text = idle_text
+        self.tracker = vb_progress.ProgressTracker()
+        self._alarm = None
+        # Set once cancel_all() is called, until everything has finished
+        self.canceling = False
+
+    @property
+    def busy(self):
+        return self.tracker.busy
+
+    def add(self, progress, description, done=None):
+        return self.track(vb_progress.TrackedProgress(progress, description, done))
+
+    def track(self, op):
+        self.tracker.track(op)
+        self.update_status()
+        if self._alarm is None:
+            # Poll right away, so anything which completes immediately
+            # doesn't need to wait a full interval
+            self._alarm = VBCUIEventLoop.instance.set_alarm_in(0, self._poll)
+        return op
+
+    def cancel_all(self):
+        # Operations finish (with an error) once VirtualBox has stopped
+        # them, so they're still polled until then
+        if not self.tracker.busy:
+            return False
+        self.tracker.cancel_all()
+        self.canceling = True
+        self.update_status()
+        return True
+
+    def _poll(self, loop=None, user_data=None):
+        self._alarm = None
+        self.tracker.poll()
+        if not self.tracker.busy:
+            self.canceling = False
+        self.update_status()
+        if self.tracker.busy:
+            self._alarm = VBCUIEventLoop.instance.set_alarm_in(self.poll_interval, self._poll)
+
+    def update_status(self):
+        ops = self.tracker.operations
+        if len(ops) == 0:
+            self.status_bar.set_text(self.idle_text)
+            return
+        if len(ops) == 1:
+            text = ops[0].description
+        else:
+            text = _(u'{} operations in progress').format(len(ops))
+        if self.canceling:
+            self.status_bar.set_text(text, _(u'Canceling...'))
+        else:
+            self.status_bar.set_text(text, _(u'^x: Cancel'))
+        self.status_bar.set_completion(self.tracker.percent)
@@ -0,0 +1,313 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import urwid
+
+from vbifc import VBoxWrapper, vb_snapshots
+from progress import ProgressMonitor, StatusBar
+from . import VBCUIEventLoop
+
+class SnapshotWidget(urwid.TreeWidget):
+    """One row of the snapshot tree.  Only the name is indented, so the
+    times line up at every depth."""
+
+    time_cols = 19
+
+    def __init__(self, node):
+        super(SnapshotWidget, self).__init__(node)
+        self.refresh()
+
+    def selectable(self):
+        return True
+
+    def keypress(self, size, key):
+        if self.is_leaf:
+            return key
+        return super(SnapshotWidget, self).keypress(size, key)
+
+    def get_indented_widget(self):
+        indent = self.get_indent_cols()
+        if self.is_leaf:
+            icon = urwid.Text(u' ')
+        else:
+            icon = [self.unexpanded_icon, self.expanded_icon][self.expanded]
+        name, time_text, attr = self.get_node().get_columns()
+        return urwid.Columns([
+            ('fixed', indent + 1, urwid.Padding(icon, left=indent)),
+            urwid.Text((attr, name), wrap='clip'),
+            ('fixed', self.time_cols, urwid.Text(time_text))
+        ], dividechars=1)
+
+    def get_indent_cols(self):
+        # By branch level rather than depth
+        return self.indent_cols * self.get_node().indent
+
+    def update_expanded_icon(self):
+        self.refresh()
+
+    def refresh(self):
+        self.is_leaf = not self.get_node().may_have_children()
+        self._w = urwid.AttrMap(self.get_indented_widget(), None, 'focus')
+
+
+class SnapshotNode(urwid.ParentNode):
+    # The value is a vb_snapshots.SnapshotInfo, and the key its id
+    def __init__(self, info, manager, key=None, parent=None, indent=1):
+        super(SnapshotNode, self).__init__(info, key=key, parent=parent,
+                                           depth=parent.get_depth() + 1)
+        self.manager = manager
+        self.indent = indent
+
+    def load_widget(self):
+        return SnapshotWidget(self)
+
+    def may_have_children(self):
+        return self.get_value().child_count > 0
+
+    def get_columns(self):
+        info = self.get_value()
+        flags = []
+        if info.online:
+            flags.append(_(u'online'))
+        if info.id == self.manager.current_id:
+            flags.append(_(u'current'))
+        name = info.name
+        if len(flags) > 0:
+            name = u'{} ({})'.format(name, u', '.join(flags))
+        attr = 'info header' if info.id == self.manager.current_id else None
+        return name, info.format_time(), attr
+
+    def load_child_keys(self):
+        # Only called once this node's first child is about to be shown
+        try:
+            self.snapshots = self.get_value().children()
+        except Exception as ex:
+            self.snapshots = []
+            self.manager.show_error(ex)
+        return [info.id for info in self.snapshots]
+
+    def load_child_node(self, key):
+        info = [info for info in self.snapshots if info.id == key][0]
+        # A chain of only children isn't indented, so a long linear history
+        # reads as a list rather than marching off the screen
+        indent = self.indent
+        if len(self.snapshots) > 1:
+            indent += 1
+        return SnapshotNode(info, self.manager, key=key, parent=self, indent=indent)
+
+
+class SnapshotRootNode(urwid.ParentNode):
+    # The machine itself, whose only child is its first snapshot
+    def __init__(self, name, root_info, manager):
+        super(SnapshotRootNode, self).__init__(name, key=None, parent=None, depth=0)
+        self.root_info = root_info
+        self.manager = manager
+        self.indent = 0
+
+    def load_widget(self):
+        return SnapshotWidget(self)
+
+    def may_have_children(self):
+        return self.root_info is not None
+
+    def get_columns(self):
+        if self.root_info is None:
+            return _(u'{} (no snapshots)').format(self.get_value()), u'', None
+        return self.get_value(), _(u'Taken'), 'info header'
+
+    def load_child_keys(self):
+        if self.root_info is None:
+            return []
+        return [self.root_info.id]
+
+    def load_child_node(self, key):
+        return SnapshotNode(self.root_info, self.manager, key=key, parent=self)
+
+
+class SnapshotManager(urwid.LineBox):
+    """Snapshots of one machine.  Every snapshot starts out expanded, but
+    a snapshot's children are only fetched once the row below it comes into
+    view, so a chain hundreds of snapshots deep opens as quickly as a short
+    one.  Taking, restoring and deleting run as background operations,
+    tracked in the status bar."""
+
+    signals = ['close']
+
+    def __init__(self, machine):
+        self.machine = machine
+        self.machine_id = machine.id
+        self.host_name = VBoxWrapper.machine_host(self.machine_id)
+        self.name = machine.name
+        self.current_id = None
+        self.status = StatusBar()
+        self.progress = ProgressMonitor(self.status, _(
+                u't: Take  R: Restore  D: Delete  c: Current  r: Refresh  Esc: Close'))
+        # (widget, callback) while asking for a name or a confirmation
+        self.prompt = None
+        self.list_box = urwid.TreeListBox(urwid.TreeWalker(self.load_root()))
+        self.frame = urwid.Frame(self.list_box, footer=self.status)
+        super(SnapshotManager, self).__init__(self.frame, title=_(u'Snapshots: {}').format(
+                                              self.name))
+        self.progress.update_status()
+
+    def load_root(self):
+        current = self.machine.currentSnapshot
+        self.current_id = current.id if current is not None else None
+        root_info = vb_snapshots.root_snapshot(self.machine, self.host_name)
+        return SnapshotRootNode(self.name, root_info, self)
+
+    def show_error(self, error):
+        if isinstance(error, Exception):
+            error = VBoxWrapper(self.host_name).exceptMessage(error)
+        self.status.set_text(error)
+
+    def keypress(self, size, key):
+        if self.prompt is not None:
+            return self.prompt_keypress(size, key)
+        key = super(SnapshotManager, self).keypress(size, key)
+        if key in {'esc', 'q'}:
+            self.close()
+        elif key == 'r':
+            self.refresh()
+        elif key == 'c':
+            self.go_to_current()
+        elif key == self.progress.cancel_key:
+            self.progress.cancel_all()
+        elif key == 't':
+            self.ask_text(_(u'Snapshot name: '),
+                          _(u'Snapshot {}').format(self.machine.snapshotCount + 1),
+                          lambda name: self.run('take', name=name))
+        elif key in {'R', 'D'}:
+            info = self.focus_info()
+            if info is None:
+                return None
+            if key == 'R':
+                self.ask_confirm(_(u'Restore "{}"?  The current state will be lost.').format(
+                                 info.name), lambda: self.run('restore', info))
+            else:
+                self.ask_confirm(_(u'Delete "{}"?').format(info.name),
+                                 lambda: self.run('delete', info))
+        else:
+            return key
+
+    def ask_text(self, caption, text, callback):
+        edit = urwid.Edit(caption, text)
+        self.prompt = (edit, callback)
+        self.frame.footer = urwid.AttrMap(edit, 'statusbar')
+
+    def ask_confirm(self, question, callback):
+        self.prompt = (None, callback)
+        self.frame.footer = urwid.AttrMap(urwid.Text(_(u'{} (y/n)').format(question)),
+                                          'statusbar')
+
+    def prompt_keypress(self, size, key):
+        edit, callback = self.prompt
+        if edit is not None and key not in {'enter', 'esc'}:
+            edit.keypress((size[0],), key)
+            return None
+        self.prompt = None
+        self.frame.footer = self.status
+        if edit is not None and key == 'enter':
+            callback(edit.edit_text)
+        elif edit is None and key == 'y':
+            callback()
+        return None
+
+    def focus_info(self):
+        node = self.list_box.body.get_focus()[1]
+        if not isinstance(node, SnapshotNode):
+            return None
+        return node.get_value()
+
+    def run(self, command, info=None, name=u''):
+        if self.machine.state not in vb_snapshots.snapshot_states(command, self.host_name):
+            self.show_error(_(u'The machine is not in a suitable state'))
+            return
+        snapshot_id = info.id if info is not None else None
+        try:
+            progress, cleanup = vb_snapshots.begin_snapshot_command(
+                    self.machine, command, snapshot_id, name=name)
+        except Exception as ex:
+            self.show_error(ex)
+            return
+        VBCUIEventLoop.instance.poll_states_soon([self.machine_id])
+
+        def done(op):
+            try:
+                cleanup()
+            except Exception:
+                pass
+            self.refresh()
+            if op.error is not None:
+                self.show_error(op.error)
+
+        if command == 'take':
+            description = _(u'Taking snapshot "{}"').format(name)
+        elif command == 'restore':
+            description = _(u'Restoring snapshot "{}"').format(info.name)
+        else:
+            description = _(u'Deleting snapshot "{}"').format(info.name)
+        self.progress.add(progress, description, done)
+
+    def focus_path(self):
+        # Keys from the root down to the focused node
+        node = self.list_box.body.get_focus()[1]
+        path = []
+        while not node.is_root():
+            path.append(node.get_key())
+            node = node.get_parent()
+        path.reverse()
+        return path
+
+    def focus_snapshot(self, path):
+        # Follows path as far as it still exists.  Only the snapshots along
+        # the way have their children loaded.
+        node = self.list_box.body.get_focus()[1].get_root()
+        for key in path:
+            if not node.may_have_children() or key not in node.get_child_keys():
+                break
+            widget = node.get_widget()
+            if not widget.expanded:
+                widget.expanded = True
+                widget.update_expanded_icon()
+            node = node.get_child_node(key)
+        self.list_box.body.set_focus(node)
+        self.list_box.set_focus_valign('middle')
+
+    def go_to_current(self):
+        try:
+            path = vb_snapshots.current_snapshot_path(self.machine)
+        except Exception as ex:
+            self.show_error(ex)
+            return
+        self.focus_snapshot(path)
+
+    def refresh(self):
+        path = self.focus_path()
+        try:
+            root = self.load_root()
+        except Exception as ex:
+            self.show_error(ex)
+            return
+        self.list_box.body = urwid.TreeWalker(root)
+        self.focus_snapshot(path)
+        self.progress.update_status()
+
+    def close(self):
+        # Anything still in progress is left to finish, so its session
+        # still gets unlocked
+        urwid.emit_signal(self, 'close')
@@ -17,12 +17,17 @@
 
 import urwid
 
-from vbifc import VBoxWrapper, VBoxConstants
+from vbifc import VBoxWrapper, VBoxConstants, get_host, vb_details, vb_events, vb_jobs, \
+                  vb_session, vb_text
 from machine_list import MachineList, MachineNode
 from machine_info import MachineInfo
 from menus import MenuButton, PopupMenu, MenuBar
 from popups import MessagePopup, ConfirmPopup, HelpPopup
-from . import VBCUIEventLoop, popup_palette_map, VBOXCLI_VERSION
+from progress import ProgressMonitor, StatusBar
+# The log viewer, media and snapshot managers, cloning, the registry and
+# metrics are imported where they're first used, to keep them out of
+# startup
+from . import popup_palette_map, VBOXCLI_VERSION, VBCUIEventLoop
 
 
 def get_help_text():
@@ -38,6 +43,14 @@ Keyboard Commands:
     s:  Start/Stop Selected VM        e:  Edit settings for selected VM
     P:  Pause/Resume Selected VM      ^t: Reset selected VM
     ^l: Show logs for selected VM     ^d: Discard saved state
+    S:  Show snapshots of selected VM
+
+    /:     Search VMs by name, UUID, OS, group, state, description or
+           host (e.g. "web os:ubuntu"); Enter keeps the list filtered
+    Space: Mark/unmark VM or group for bulk Start/Stop and Pause
+    Esc:   Clear the search filter, then all marks
+    m:     Show/hide the CPU column for running VMs
+    ^x:    Cancel the operations shown in the status bar
 
     M:  Show Virtual Media Manager    ^p: Show global preferences
     ^a: Import appliance as VM        ^e: Export VM as appliance
@@ -48,26 +61,27 @@ Keyboard Commands:
     U:  Manage USB devices            G:  Insert Guest Additions CD''').format(version=VBOXCLI_VERSION)
 
 
-class StatusBar(urwid.ProgressBar):
-    text_align = urwid.LEFT
-
-    def __init__(self):
-        self.status_text = u''
-        super(StatusBar, self).__init__('statusbar', 'progress', 0, 100)
+class SearchBar(urwid.Edit):
+    signals = ['change', 'accept', 'cancel']
 
-    def set_text(self, text):
-        self.status_text = text
-        self.set_completion(0)
+    def __init__(self, text=u''):
+        super(SearchBar, self).__init__(u'/', text)
 
-    def get_text(self):
-        if self.current == 0:
-            return self.status_text
+    def keypress(self, size, key):
+        if key == 'enter':
+            urwid.emit_signal(self, 'accept', self)
+        elif key == 'esc':
+            urwid.emit_signal(self, 'cancel', self)
         else:
-            return u'{} ({} %)'.format(self.status_text, self.current)
+            return super(SearchBar, self).keypress(size, key)
 
 
 class TopUI(urwid.WidgetPlaceholder):
-    def __init__(self):
+    def __init__(self, max_jobs=4):
+        # Limit on how many machines a bulk operation acts on at once
+        self.max_jobs = max_jobs
+        self.connected = False
+        self.loop = None
         self.mach_list = MachineList()
         self.mach_info = MachineInfo()
         self.columns = urwid.Columns([
@@ -81,7 +95,7 @@ class TopUI(urwid.WidgetPlaceholder):
                 MenuButton(_(u'&Import Appliance')),
                 MenuButton(_(u'&Export Appliance')),
                 urwid.Divider(u'\u2500'),
-                MenuButton(_(u'&Virtual Media Manager')),
+                MenuButton(_(u'&Virtual Media Manager'), u'M', action=self.show_media_manager),
                 urwid.Divider(u'\u2500'),
                 MenuButton(_(u'E&xit'), u'q', action=self.quit)
             ]),
@@ -89,7 +103,7 @@ class TopUI(urwid.WidgetPlaceholder):
                 MenuButton(_(u'&New')),
                 MenuButton(_(u'&Add')),
                 MenuButton(_(u'&Settings')),
-                MenuButton(_(u'Cl&one')),
+                MenuButton(_(u'Cl&one...'), u'^o', action=self.show_clone),
                 MenuButton(_(u'Remo&ve')),
                 MenuButton(_(u'Gro&up')),
                 urwid.Divider(u'\u2500'),
@@ -99,7 +113,8 @@ class TopUI(urwid.WidgetPlaceholder):
                 MenuButton(_(u'Sto&p...')),
                 urwid.Divider(u'\u2500'),
                 MenuButton(_(u'D&iscard Saved State')),
-                MenuButton(_(u'Show &Log')),
+                MenuButton(_(u'Show &Log'), u'^l', action=self.show_log),
+                MenuButton(_(u'S&napshots'), u'S', action=self.show_snapshots),
                 MenuButton(_(u'Re&fresh'))
             ]),
             (_(u'&Devices'), [
@@ -117,19 +132,82 @@ class TopUI(urwid.WidgetPlaceholder):
         #self.menu_bar = MenuBar(top_menu)
         self.hint_bar = urwid.Text(_(u'?: Help  q: Quit  s: Start/Stop  e: Edit VM Settings'))
         self.status_bar = StatusBar()
+        self.search_bar = None
+        self.progress = ProgressMonitor(self.status_bar)
+        self.metrics = None
         self.top_frame = urwid.Frame(self.columns, urwid.AttrWrap(self.hint_bar, 'statusbar'), self.status_bar)
         super(TopUI, self).__init__(self.top_frame)
 
         #urwid.connect_signal(self.menu_bar, 'popup_closed', self.reset_focus)
         urwid.connect_signal(self.mach_list, 'selection_changed', self.set_selection)
+        urwid.connect_signal(self.mach_list, 'filter_changed', self.update_filter_status)
+        urwid.connect_signal(self.mach_list, 'host_refreshed', self.host_refreshed)
+        self.status_bar.set_text(_(u'Connecting to VirtualBox...'))
+
+    def connect(self, loop):
+        # Connecting to VirtualBox can take a while, so this is run after the
+        # UI is on screen (see VBCUIEventLoop.after_first_paint).  The local
+        # host can't move to a worker thread, since XPCOM ties the manager and
+        # its event queue to the thread which created it, but remote hosts are
+        # connected in the background, and show up as they arrive.  A host
+        # which can't be reached is just shown as not connected, unless none
+        # of them can be.
+        self.loop = loop
+        self.mach_list.reload()
+
+    def host_refreshed(self, host_name):
+        if self.connected:
+            # The host may have only just connected
+            self.loop.watch_host(host_name)
+            return
+        if get_host(host_name).error is None:
+            self.connected = True
+            self._connected()
+        elif len(self.mach_list.refreshing) == 0:
+            self.status_bar.set_text(_(u'Not connected'))
+            self.show_message(_(u'Could not connect to VirtualBox: {}').format(
+                              get_host().error), _(u'Error'))
+
+    def _connected(self):
+        # Once the first host is up
+        from vbifc import vb_registry
+        from metrics import MetricsMonitor
+        loop = self.loop
+        if loop.timings is not None:
+            loop.timings.mark(_(u'Manager creation'))
+
+        vb_registry.get_registry()
+        if loop.timings is not None:
+            loop.timings.mark(_(u'Registry load'))
+
+        self.mach_list.root.get_child_keys()
+        if loop.timings is not None:
+            loop.timings.mark(_(u'First machine fetch'))
+
+        loop.add_event_handler(self.handle_events)
+        self.metrics = MetricsMonitor(self.metrics_updated)
+        self.mach_info.metrics = self.metrics
+        self.metrics.start()
+        self.status_bar.set_text(u'')
 
     def keypress(self, size, key):
+        if not self.connected and self.original_widget is self.top_frame \
+                and key not in {'q', 'Q', '?'}:
+            # There's nothing to act on until VirtualBox is connected
+            return None
         key = super(TopUI, self).keypress(size, key)
         if self.original_widget is not self.top_frame:
             # Don't handle key events unless we're actually showing the main
             # UI as the top-level widget
             return key
 
+        if self.search_bar is not None:
+            # Typing goes to the search bar; up and down step through the
+            # matches in the list
+            if key in {'up', 'down'}:
+                self.mach_list.focus_match(key == 'down')
+            return None
+
         if key in {'q', 'Q'}:
             self.quit()
         elif key == '?':
@@ -137,11 +215,27 @@ class TopUI(urwid.WidgetPlaceholder):
         elif key == 'P':
             self.pause_resume()
         elif key == 'R':
+            vb_details.invalidate_machine_details()
+            vb_text.invalidate_medium_info()
             self.mach_list.reload()
         elif key == 'r':
             self.update_selected()
         elif key == 's':
             self.show_start()
+        elif key == '/':
+            self.start_search()
+        elif key == 'm':
+            self.toggle_metrics_column()
+        elif key == 'ctrl l':
+            self.show_log()
+        elif key == 'M':
+            self.show_media_manager()
+        elif key == 'S':
+            self.show_snapshots()
+        elif key == 'ctrl o':
+            self.show_clone()
+        elif key == self.progress.cancel_key:
+            self.progress.cancel_all()
         else:
             return key
 
@@ -157,8 +251,81 @@ class TopUI(urwid.WidgetPlaceholder):
         else:
             self.mach_info.show_machine(None)
 
+    def handle_events(self, events, host_name):
+        vbconst = VBoxConstants(host_name)
+        stopped = {vbconst.MachineState_PoweredOff, vbconst.MachineState_Saved,
+                   vbconst.MachineState_Aborted, vbconst.MachineState_Teleported}
+        for kind, machine_id, value in events:
+            if kind in {vb_events.MACHINE_DATA, vb_events.MACHINE_REGISTERED}:
+                vb_details.invalidate_machine_details(machine_id)
+            elif kind == vb_events.MACHINE_EXTRA_DATA:
+                if machine_id is not None:
+                    vb_details.invalidate_machine_details(machine_id)
+            elif kind in vb_events.MEDIUM_KINDS:
+                if value is not None:
+                    vb_text.invalidate_medium_info(value, host_name)
+                if machine_id is not None:
+                    vb_details.invalidate_machine_details(machine_id)
+            if (kind == vb_events.MACHINE_STATE and value in stopped) \
+                    or (kind == vb_events.MACHINE_REGISTERED and not value):
+                # Pooled console sessions are useless once the VM is gone
+                vb_session.release_session(machine_id)
+        self.mach_list.apply_events(events, host_name)
+        if host_name == VBoxWrapper().host_name:
+            # Metrics are only collected from the first host
+            self.metrics.handle_events(events)
+
+    def metrics_updated(self):
+        self.mach_info.update_metrics()
+        self.mach_list.update_metrics()
+
+    def toggle_metrics_column(self):
+        if self.mach_list.metrics is None:
+            self.mach_list.set_metrics(self.metrics)
+        else:
+            self.mach_list.set_metrics(None)
+
+    def start_search(self):
+        # Index the machines in the background while the query is typed
+        self.mach_list.prepare_search()
+        self.search_bar = SearchBar(self.mach_list.filter_text)
+        urwid.connect_signal(self.search_bar, 'change', self._search_changed)
+        urwid.connect_signal(self.search_bar, 'accept', self._search_done, True)
+        urwid.connect_signal(self.search_bar, 'cancel', self._search_done, False)
+        self.top_frame.footer = urwid.AttrMap(self.search_bar, 'statusbar')
+        self.top_frame.focus_position = 'footer'
+
+    def _search_changed(self, sender, text):
+        self.mach_list.set_filter(text)
+
+    def _search_done(self, sender, keep):
+        self.search_bar = None
+        self.top_frame.footer = self.status_bar
+        self.top_frame.focus_position = 'body'
+        if keep and (self.mach_list.match_count is not None or self.mach_list.indexing):
+            self.update_filter_status()
+        else:
+            self.mach_list.clear_filter()
+
+    def update_filter_status(self, sender=None):
+        if self.search_bar is not None or self.progress.busy:
+            return
+        if self.mach_list.match_count is not None:
+            self.status_bar.set_text(_(u'Filter: {} ({} matches, Esc to clear)').format(
+                                     self.mach_list.filter_text, self.mach_list.match_count))
+        elif self.mach_list.filter_text and self.mach_list.indexing:
+            self.status_bar.set_text(_(u'Filter: {} (indexing machines...)').format(
+                                     self.mach_list.filter_text))
+        else:
+            self.status_bar.set_text(u'')
+
     def update_selected(self):
         if self.mach_list.focus is not None:
+            sel_node = self.mach_list.focus.get_node()
+            if isinstance(sel_node, MachineNode):
+                # An explicit refresh shouldn't trust the cached details
+                vb_details.invalidate_machine_details(sel_node.selection_id)
+                vb_text.invalidate_medium_info()
             self.mach_list.focus.reload_text()
             self.set_selection(self.mach_list.focus.get_node())
 
@@ -171,133 +338,105 @@ class TopUI(urwid.WidgetPlaceholder):
             return
         self.original_widget = self.original_widget[0]
 
-    def progress_bar(self, progress):
-        vbox = VBoxWrapper()
-        try:
-            while not progress.completed:
-                progress.waitForCompletion(100)
-                vbox.mgr.waitForEvents(0)
-                self.status_bar.set_completion(progress.percent)
-                VBCUIEventLoop.instance.draw_screen()
-            if int(progress.resultCode) == 0:
-                return True
-            err = progress.errorInfo
-            self.show_message(
-                _(u"Error in module '{}': {}").format(err.component, err.text),
-                title=_(u'Error starting VM'))
-        except KeyboardInterrupt:
-            if progress.cancelable:
-                progress.cancel()
-            self.show_message(_(u'Operation aborted'), title=_(u'Error starting VM'))
-        return False
-
-    def start_machine(self, machine, vmtype):
-        vbox = VBoxWrapper()
-        vbconst = VBoxConstants()
-        session = vbox.getSession()
-        try:
-            progress = machine.launchVMProcess(session, vmtype, u'')
-            self.status_bar.set_text(_(u'Starting {}').format(machine.name))
-            self.progress_bar(progress)
-        except Exception as ex:
-            self.show_message(vbox.exceptMessage(ex), title=_(u'VirtualBox Exception'))
-        if session.state == vbconst.SessionState_Locked:
-            session.unlockMachine()
-        self.update_selected()
-        self.status_bar.set_text(u'')
-
-    def _on_start_machine(self, sender, params):
-        self.close_popup(sender)
-        machine, vmtype = params
-        self.start_machine(machine, vmtype)
-
-    def get_running_session(self, machine):
-        # Must unlock the session if one is returned
-        vbox = VBoxWrapper()
-        vbconst = VBoxConstants()
-        session = vbox.getSession()
-        machine.lockMachine(session, vbconst.LockType_Shared)
-        if session.state != vbconst.SessionState_Locked:
-            self.show_message(_(u'Could not lock session'), title=_(u'Error'))
-            return None
+    def command_description(self, command, target):
+        if command == 'start':
+            return _(u'Starting {}').format(target)
+        elif command == 'save_state':
+            return _(u'Saving {}').format(target)
+        elif command == 'acpi_button':
+            return _(u'Shutting down {}').format(target)
+        elif command == 'power_down':
+            return _(u'Powering off {}').format(target)
+        elif command == 'pause':
+            return _(u'Pausing {}').format(target)
+        elif command == 'resume':
+            return _(u'Resuming {}').format(target)
         else:
-            return session
-
-    def save_state(self, machine):
-        session = self.get_running_session(machine)
-        try:
-            progress = session.machine.saveState()
-            self.status_bar.set_text(_(u'Saving {}').format(machine.name))
-            self.progress_bar(progress)
-        except Exception as ex:
-            vbox = VBoxWrapper()
-            self.show_message(vbox.exceptMessage(ex), title=_(u'VirtualBox Exception'))
-        self.update_selected()
-        self.status_bar.set_text(u'')
+            return _(u'Pausing/Resuming {}').format(target)
 
-    def _on_save_state(self, sender, machine):
-        self.close_popup(sender)
-        self.save_state(machine)
+    def run_command(self, machines, command, vmtype=u'headless'):
+        if len(machines) == 1:
+            target = machines[0].name
+        else:
+            target = _(u'{} machines').format(len(machines))
 
-    def console_cmd(self, machine, command):
-        vbconst = VBoxConstants()
-        session = self.get_running_session(machine)
-        console = session.console
-        try:
-            if command == 'pause':
-                console.pause()
-            elif command == 'resume':
-                console.resume()
-            elif command == 'acpi_button':
-                console.powerButton()
-            elif command == 'power_down':
-                console.powerDown()
+        def finished(op):
+            if len(machines) == 1:
+                if len(op.errors) > 0:
+                    self.show_message(op.errors[0][1], title=_(u'VirtualBox Exception'))
             else:
-                self.show_message(_(u'Unsupported command: {}').format(command),
-                                  title=_(u'Internal Error'))
-        except Exception as ex:
-            vbox = VBoxWrapper()
-            self.show_message(vbox.exceptMessage(ex), title=_(u'VirtualBox Exception'))
+                self.show_summary(op.summary(), title=self.command_description(command, target))
+            self.update_selected()
 
-        if session.state == vbconst.SessionState_Locked:
-            session.unlockMachine()
-        self.update_selected()
+        # Watch these machines closely, in case their state change events
+        # don't arrive
+        VBCUIEventLoop.instance.poll_states_soon([machine.id for machine in machines])
+        self.progress.track(vb_jobs.BulkOperation(
+                machines, command, vmtype, max_jobs=self.max_jobs,
+                description=self.command_description(command, target), done=finished))
 
-    def _on_console_cmd(self, sender, params):
+    def _on_command(self, sender, params):
         self.close_popup(sender)
-        machine, command = params
-        self.console_cmd(machine, command)
-
-    def show_start(self, sender=None):
+        machines, command, vmtype = params
+        self.run_command(machines, command, vmtype)
+
+    def selected_machines(self):
+        # Marked machines take priority over the focused one
+        machines = self.mach_list.marked_machines()
+        if len(machines) > 0:
+            return machines
         if self.mach_list.focus is None:
-            return
+            return []
         sel_node = self.mach_list.focus.get_node()
         if not isinstance(sel_node, MachineNode):
+            return []
+        return [sel_node.machine]
+
+    def show_start(self, sender=None):
+        machines = self.selected_machines()
+        if len(machines) == 0:
             return
 
-        vbconst = VBoxConstants()
-        machine = sel_node.machine
-        if machine.state in {vbconst.MachineState_PoweredOff,
-                             vbconst.MachineState_Aborted,
-                             vbconst.MachineState_Saved}:
+        vbconst = VBoxConstants(VBoxWrapper.machine_host(machines[0].id))
+        if len(machines) > 1:
             menu_items = [
-                MenuButton(_(u'Start &GUI'), action=self._on_start_machine,
-                           user_data=(machine, u'gui')),
-                MenuButton(_(u'Start S&DL GUI'), action=self._on_start_machine,
-                           user_data=(machine, u'sdl')),
-                MenuButton(_(u'Start &Headless'), action=self._on_start_machine,
-                           user_data=(machine, u'headless'))
+                MenuButton(_(u'Start &GUI'), action=self._on_command,
+                           user_data=(machines, 'start', u'gui')),
+                MenuButton(_(u'Start &Headless'), action=self._on_command,
+                           user_data=(machines, 'start', u'headless')),
+                MenuButton(_(u'Sa&ve State'), action=self._on_command,
+                           user_data=(machines, 'save_state', None)),
+                MenuButton(_(u'ACPI Sh&utdown'), action=self._on_command,
+                           user_data=(machines, 'acpi_button', None)),
+                MenuButton(_(u'Po&wer Off'), action=self._on_command,
+                           user_data=(machines, 'power_down', None)),
+                MenuButton(_(u'&Pause'), action=self._on_command,
+                           user_data=(machines, 'pause', None)),
+                MenuButton(_(u'&Resume'), action=self._on_command,
+                           user_data=(machines, 'resume', None))
+            ]
+            title = _(u'{} Machines').format(len(machines))
+        elif machines[0].state in {vbconst.MachineState_PoweredOff,
+                                   vbconst.MachineState_Aborted,
+                                   vbconst.MachineState_Saved}:
+            menu_items = [
+                MenuButton(_(u'Start &GUI'), action=self._on_command,
+                           user_data=(machines, 'start', u'gui')),
+                MenuButton(_(u'Start S&DL GUI'), action=self._on_command,
+                           user_data=(machines, 'start', u'sdl')),
+                MenuButton(_(u'Start &Headless'), action=self._on_command,
+                           user_data=(machines, 'start', u'headless'))
             ]
             title = _(u'Start Machine')
-        elif machine.state in {vbconst.MachineState_Running,
-                               vbconst.MachineState_Paused}:
+        elif machines[0].state in {vbconst.MachineState_Running,
+                                   vbconst.MachineState_Paused}:
             menu_items = [
-                MenuButton(_(u'Sa&ve State'), action=self._on_save_state,
-                           user_data=machine),
-                MenuButton(_(u'ACPI Sh&utdown'), action=self._on_console_cmd,
-                           user_data=(machine, 'acpi_button')),
-                MenuButton(_(u'Po&wer Off'), action=self._on_console_cmd,
-                           user_data=(machine, 'power_down'))
+                MenuButton(_(u'Sa&ve State'), action=self._on_command,
+                           user_data=(machines, 'save_state', None)),
+                MenuButton(_(u'ACPI Sh&utdown'), action=self._on_command,
+                           user_data=(machines, 'acpi_button', None)),
+                MenuButton(_(u'Po&wer Off'), action=self._on_command,
+                           user_data=(machines, 'power_down', None))
             ]
             title = _(u'Stop Machine')
         else:
@@ -310,18 +449,86 @@ class TopUI(urwid.WidgetPlaceholder):
                         valign=urwid.MIDDLE, height=rows)
 
     def pause_resume(self, sender=None):
+        machines = self.selected_machines()
+        if len(machines) > 0:
+            self.run_command(machines, 'toggle_pause')
+
+    def show_clone(self, sender=None):
         if self.mach_list.focus is None:
             return
         sel_node = self.mach_list.focus.get_node()
         if not isinstance(sel_node, MachineNode):
             return
+        from clone_dialog import CloneDialog
+        try:
+            dialog = CloneDialog(sel_node.machine, self.max_jobs)
+        except Exception as ex:
+            self.show_message(VBoxWrapper().exceptMessage(ex), title=_(u'VirtualBox Exception'))
+            return
+        urwid.connect_signal(dialog, 'accepted', self._on_clone, dialog)
+        urwid.connect_signal(dialog, 'rejected', self.close_popup)
+        self.show_popup(dialog, align=urwid.CENTER, width=(urwid.RELATIVE, 80),
+                        valign=urwid.MIDDLE, height=urwid.PACK)
 
-        vbconst = VBoxConstants()
-        machine = sel_node.machine
-        if machine.state == vbconst.MachineState_Running:
-            self.console_cmd(machine, 'pause')
-        elif machine.state == vbconst.MachineState_Paused:
-            self.console_cmd(machine, 'resume')
+    def _on_clone(self, dialog):
+        from vbifc import vb_clone
+        self.close_popup()
+        machine = dialog.machine
+        if len(dialog.names) == 1:
+            description = _(u'Cloning {} as {}').format(machine.name, dialog.names[0])
+        else:
+            description = _(u'Making {} clones of {}').format(len(dialog.names), machine.name)
+
+        def finished(op):
+            if len(dialog.names) > 1 or len(op.errors) > 0:
+                self.show_summary(op.summary(), title=description)
+
+        self.progress.track(vb_clone.CloneOperation(
+                machine, dialog.names, dialog.group, dialog.linked, dialog.snapshot_id,
+                max_jobs=dialog.max_jobs, description=description, done=finished))
+
+    def show_log(self, sender=None):
+        if self.mach_list.focus is None:
+            return
+        sel_node = self.mach_list.focus.get_node()
+        if not isinstance(sel_node, MachineNode):
+            return
+        from log_viewer import LogViewer
+        try:
+            viewer = LogViewer(sel_node.machine)
+        except Exception as ex:
+            self.show_message(VBoxWrapper().exceptMessage(ex), title=_(u'VirtualBox Exception'))
+            return
+        urwid.connect_signal(viewer, 'close', self.close_popup)
+        # Not a regular popup, since logs read better in the normal colors
+        self.original_widget = urwid.Overlay(viewer, self.original_widget,
+                align=urwid.CENTER, width=(urwid.RELATIVE, 100),
+                valign=urwid.MIDDLE, height=(urwid.RELATIVE, 100))
+
+    def show_snapshots(self, sender=None):
+        if self.mach_list.focus is None:
+            return
+        sel_node = self.mach_list.focus.get_node()
+        if not isinstance(sel_node, MachineNode):
+            return
+        from snapshot_manager import SnapshotManager
+        try:
+            manager = SnapshotManager(sel_node.machine)
+        except Exception as ex:
+            self.show_message(VBoxWrapper().exceptMessage(ex), title=_(u'VirtualBox Exception'))
+            return
+        urwid.connect_signal(manager, 'close', self.close_popup)
+        self.original_widget = urwid.Overlay(manager, self.original_widget,
+                align=urwid.CENTER, width=(urwid.RELATIVE, 100),
+                valign=urwid.MIDDLE, height=(urwid.RELATIVE, 100))
+
+    def show_media_manager(self, sender=None):
+        from media_manager import MediaManager
+        manager = MediaManager()
+        urwid.connect_signal(manager, 'close', self.close_popup)
+        self.original_widget = urwid.Overlay(manager, self.original_widget,
+                align=urwid.CENTER, width=(urwid.RELATIVE, 100),
+                valign=urwid.MIDDLE, height=(urwid.RELATIVE, 100))
 
     def show_message(self, message, title=u''):
         popup = MessagePopup(message, title)
@@ -329,6 +536,12 @@ class TopUI(urwid.WidgetPlaceholder):
         self.show_popup(popup, align=urwid.CENTER, width=(urwid.RELATIVE, 80),
                         valign=urwid.MIDDLE, height=urwid.PACK)
 
+    def show_summary(self, lines, title=u''):
+        popup = HelpPopup(u'\n'.join(lines), title=title)
+        urwid.connect_signal(popup, 'close', self.close_popup)
+        self.show_popup(popup, align=urwid.CENTER, width=(urwid.RELATIVE, 80),
+                        valign=urwid.MIDDLE, height=min(popup.suggested_height, 24))
+
     def show_help(self, sender=None):
         popup = HelpPopup(get_help_text(), title=_(u'Help/About'))
         urwid.connect_signal(popup, 'close', self.close_popup)
@@ -15,69 +15,331 @@
 # along with vboxcli; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-import vboxapi
+import os
+import copy
+import threading
+from collections import OrderedDict
+
+def cache_path(filename):
+    """Where vboxcli keeps filename between runs"""
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or \
+                os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'vboxcli', filename)
+
+# Name of the local VirtualBox installation's host
+LOCAL_HOST = u'localhost'
+
+class Host(object):
+    """A VirtualBox to connect to.  style and params are passed on to
+    vboxapi.VirtualBoxManager: None for the local installation (over
+    XPCOM or COM), or 'WEBSERVICE' with {'url', 'user', 'password'} for a
+    vboxwebsrv endpoint."""
+
+    def __init__(self, name, style=None, params=None):
+        self.name = name
+        self.style = style
+        self.params = params
+        # Why connecting failed, if it did
+        self.error = None
+
+    @property
+    def is_local(self):
+        return self.style is None
+
+# Host name -> Host, in the order they're shown
+_hosts = OrderedDict()
+
+def add_host(name, style=None, params=None):
+    _hosts[name] = Host(name, style, params)
+    return _hosts[name]
+
+def get_host(name=None):
+    # Without a name, this is the first connected host which hasn't failed,
+    # or while none are connected yet, the first which hasn't failed
+    if len(_hosts) == 0:
+        add_host(LOCAL_HOST)
+    if name is None:
+        candidates = [host for host in _hosts.values() if host.error is None]
+        for host in candidates:
+            if host.name in VBoxWrapper._caches:
+                return host
+        if len(candidates) > 0:
+            return candidates[0]
+        return next(iter(_hosts.values()))
+    return _hosts[name]
+
+def host_names():
+    get_host()
+    return list(_hosts.keys())
 
 class _VBoxWrapper_Cache(object):
-    def __init__(self):
-        self.mgr = vboxapi.VirtualBoxManager()
+    # Everything fetched from the host, as opposed to the connection itself
+    FETCHED = ['machine_groups', 'machines', 'machines_by_id', 'groups_by_id',
+               'group_members', 'group_children', 'group_definitions']
+
+    def __init__(self, host):
+        # vboxapi pulls in the whole COM/XPCOM binding, so it's only imported
+        # once a connection is actually wanted
+        import vboxapi
+        self.host = host
+        self.mgr = vboxapi.VirtualBoxManager(host.style, host.params)
         self.vbox = self.mgr.getVirtualBox()
         self.machine_groups = None
         self.machines = None
+        self.machines_by_id = None
+        self.groups_by_id = None
+        self.group_members = None
+        self.group_children = None
+        self.group_definitions = None
 
 
 class VBoxWrapper(object):
-    _cache = None
+    """Access to one host's VirtualBox (the first reachable host, if
+    host_name isn't given).  Each host has its own manager and cache,
+    created on first use."""
+
+    _caches = {}
+    _lock = threading.Lock()
+    # Host name -> lock held while connecting to it
+    _connect_locks = {}
+
+    def __init__(self, host_name=None):
+        host = get_host(host_name)
+        self._cache = VBoxWrapper._caches.get(host.name)
+        if self._cache is None:
+            # Hosts may be connected from several threads at once, and a
+            # slow one mustn't hold up connecting to the others
+            with VBoxWrapper._lock:
+                lock = VBoxWrapper._connect_locks.setdefault(host.name, threading.Lock())
+            with lock:
+                if host.name not in VBoxWrapper._caches:
+                    VBoxWrapper._caches[host.name] = _VBoxWrapper_Cache(host)
+                self._cache = VBoxWrapper._caches[host.name]
+
+    @staticmethod
+    def connected(host_name=None):
+        # True once the host's VirtualBoxManager has been created
+        return get_host(host_name).name in VBoxWrapper._caches
+
+    @staticmethod
+    def machine_host(machine_id):
+        """Name of the connected host which has machine_id, or None"""
+        for name, cache in list(VBoxWrapper._caches.items()):
+            if cache.machines_by_id is not None and machine_id in cache.machines_by_id:
+                return name
+        return None
 
-    def __init__(self):
-        if VBoxWrapper._cache is None:
-            VBoxWrapper._cache = _VBoxWrapper_Cache()
+    @staticmethod
+    def for_machine(machine_id):
+        # The host owning machine_id, falling back to the default host
+        return VBoxWrapper(VBoxWrapper.machine_host(machine_id))
+
+    @property
+    def host_name(self):
+        return self._cache.host.name
 
     @property
     def mgr(self):
-        return VBoxWrapper._cache.mgr
+        return self._cache.mgr
 
     @property
     def vbox(self):
-        return VBoxWrapper._cache.vbox
+        return self._cache.vbox
 
     @property
     def constants(self):
-        return VBoxWrapper._cache.mgr.constants
+        return self._cache.mgr.constants
 
     @property
     def host(self):
-        return VBoxWrapper._cache.vbox.host
+        return self._cache.vbox.host
 
     @property
     def systemProperties(self):
-        return VBoxWrapper._cache.vbox.systemProperties
+        return self._cache.vbox.systemProperties
 
     @property
     def machine_groups(self):
-        if VBoxWrapper._cache.machine_groups is None:
-            VBoxWrapper._cache.machine_groups = self.mgr.getArray(self.vbox, 'machineGroups')
-        return VBoxWrapper._cache.machine_groups
+        if self._cache.machine_groups is None:
+            self._cache.machine_groups = self.mgr.getArray(self.vbox, 'machineGroups')
+        return self._cache.machine_groups
 
     @property
     def machines(self):
-        if VBoxWrapper._cache.machines is None:
-            VBoxWrapper._cache.machines = self.mgr.getArray(self.vbox, 'machines')
-        return VBoxWrapper._cache.machines
+        if self._cache.machines is None:
+            self._cache.machines = self.mgr.getArray(self.vbox, 'machines')
+        return self._cache.machines
+
+    def _index_machines(self):
+        # Fetch each machine's id and groups once, building the group
+        # path -> machines index and the per-machine lookups in one pass
+        by_id = {}
+        groups_by_id = {}
+        group_members = {}
+        for mach in self.machines:
+            mach_id = mach.id
+            groups = self.mgr.getArray(mach, 'groups')
+            by_id[mach_id] = mach
+            groups_by_id[mach_id] = groups
+            for group in groups:
+                group_members.setdefault(group, []).append(mach_id)
+        self._cache.machines_by_id = by_id
+        self._cache.groups_by_id = groups_by_id
+        self._cache.group_members = group_members
+
+    @property
+    def machines_by_id(self):
+        if self._cache.machines_by_id is None:
+            self._index_machines()
+        return self._cache.machines_by_id
+
+    @property
+    def groups_by_id(self):
+        if self._cache.groups_by_id is None:
+            self._index_machines()
+        return self._cache.groups_by_id
+
+    @property
+    def group_members(self):
+        # Group path -> ids of the machines directly in that group
+        if self._cache.group_members is None:
+            self._index_machines()
+        return self._cache.group_members
+
+    @property
+    def group_children(self):
+        # Group path -> paths of its immediate subgroups, in the order
+        # VirtualBox lists them.  Intermediate groups with no machines of
+        # their own are filled in, so every group is reachable from '/'.
+        if self._cache.group_children is None:
+            children = {}
+            known = {u'/'}
+            paths = list(self.machine_groups)
+            for groups in self.groups_by_id.values():
+                paths.extend(groups)
+            for path in paths:
+                while path not in known:
+                    known.add(path)
+                    parent = path[:path.rfind(u'/')] or u'/'
+                    children.setdefault(parent, []).append(path)
+                    path = parent
+            self._cache.group_children = children
+        return self._cache.group_children
+
+    @property
+    def group_definitions(self):
+        # Group path -> the Qt GUI's ordering entries for it ('go=', 'gc='
+        # and 'm=' items), read for all groups at once
+        if self._cache.group_definitions is None:
+            prefix = u'GUI/GroupDefinitions'
+            definitions = {}
+            for key in self.vbox.getExtraDataKeys():
+                if not key.startswith(prefix + u'/'):
+                    continue
+                value = self.vbox.getExtraData(key)
+                if value:
+                    definitions[key[len(prefix):]] = value.split(u',')
+            self._cache.group_definitions = definitions
+        return self._cache.group_definitions
+
+    def group_machine_ids(self, path):
+        # Ids of machines in the group at path or any of its subgroups
+        group_members = self.group_members
+        group_children = self.group_children
+        ids = set()
+        pending = [path]
+        while len(pending) > 0:
+            group = pending.pop()
+            ids.update(group_members.get(group, []))
+            pending.extend(group_children.get(group, []))
+        return ids
+
+    def update_machine(self, machine_id, registered=True):
+        """Re-read a single machine's registration and groups, patching the
+        cached machine list and indexes in place.  Returns the set of group
+        paths whose membership changed."""
+        cache = self._cache
+        if cache.group_members is None:
+            # Nothing has been indexed yet, so a full fetch will pick it up
+            cache.machines = None
+            cache.machine_groups = None
+            cache.group_children = None
+            return set()
+
+        old_mach = cache.machines_by_id.pop(machine_id, None)
+        old_groups = cache.groups_by_id.pop(machine_id, [])
+        new_mach = None
+        new_groups = []
+        if registered:
+            new_mach = old_mach
+            try:
+                if new_mach is None:
+                    new_mach = self.vbox.findMachine(machine_id)
+                new_groups = self.mgr.getArray(new_mach, 'groups')
+            except Exception:
+                new_mach = None
+                new_groups = []
+
+        if old_mach is new_mach:
+            removed = set(old_groups) - set(new_groups)
+            added = [group for group in new_groups if group not in old_groups]
+        else:
+            removed = set(old_groups)
+            added = new_groups
+            if old_mach is not None:
+                cache.machines = [mach for mach in cache.machines
+                                  if mach is not old_mach]
+            if new_mach is not None:
+                cache.machines.append(new_mach)
+
+        for group in removed:
+            members = cache.group_members.get(group, [])
+            cache.group_members[group] = [mach_id for mach_id in members
+                                          if mach_id != machine_id]
+        if new_mach is not None:
+            cache.machines_by_id[machine_id] = new_mach
+            cache.groups_by_id[machine_id] = new_groups
+            for group in added:
+                cache.group_members.setdefault(group, []).append(machine_id)
+
+        changed = removed | set(added)
+        if len(changed) > 0:
+            # The group list may have gained or lost entries
+            cache.machine_groups = None
+            cache.group_children = None
+        return changed
+
+    def prefetch(self):
+        # Everything the machine tree needs, so it can be fetched ahead of
+        # time (e.g. on another thread, see vb_hosts.refresh_hosts)
+        self.machines_by_id
+        self.group_children
+        self.group_definitions
 
     def drop_cache(self):
-        VBoxWrapper._cache.machine_groups = None
-        VBoxWrapper._cache.machines = None
+        for field in _VBoxWrapper_Cache.FETCHED:
+            setattr(self._cache, field, None)
+
+    def refetch(self):
+        """Fetch everything prefetch() does from scratch, and only then
+        replace the cached copy, so that other threads using this host
+        meanwhile keep seeing the old data instead of an empty cache"""
+        fresh = VBoxWrapper.__new__(VBoxWrapper)
+        fresh._cache = copy.copy(self._cache)
+        fresh.drop_cache()
+        fresh.prefetch()
+        for field in _VBoxWrapper_Cache.FETCHED:
+            setattr(self._cache, field, getattr(fresh._cache, field))
 
     def getSession(self):
-        return VBoxWrapper._cache.mgr.getSessionObject(VBoxWrapper._cache.vbox)
+        return self._cache.mgr.getSessionObject(self._cache.vbox)
 
     def exceptMessage(self, ex):
-        if VBoxWrapper._cache.mgr.errIsOurXcptKind(ex):
-            return VBoxWrapper._cache.mgr.xcptGetMessage(ex)
+        if self._cache.mgr.errIsOurXcptKind(ex):
+            return self._cache.mgr.xcptGetMessage(ex)
         else:
             return unicode(ex)
 
 
-def VBoxConstants():
-    vbox = VBoxWrapper()
-    return vbox.constants
+def VBoxConstants(host_name=None):
+    return VBoxWrapper(host_name).constants
@@ -0,0 +1,195 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from . import VBoxWrapper
+from vb_progress import TrackedProgress
+import vb_snapshots
+
+def clone_names(name, count):
+    if count == 1:
+        return [name]
+    return [u'{} {}'.format(name, idx + 1) for idx in range(count)]
+
+
+class CloneOperation(object):
+    """Clones a machine once for each of names through IMachine.cloneTo, with
+    at most max_jobs clones in flight at once.  A linked clone of the current
+    state needs a snapshot to link to, so one is taken first and shared by
+    every clone.  Each new machine is registered as soon as its clone
+    finishes, so quitting part way through doesn't leave finished clones
+    unregistered on disk, and a clone which fails or is canceled has its
+    settings and disk images deleted.  This is polled like a
+    vb_jobs.BulkOperation."""
+
+    def __init__(self, machine, names, group=u'/', linked=False, snapshot_id=None,
+                 max_jobs=4, description=u'', done=None):
+        self.machine = machine
+        self.vbox = VBoxWrapper.for_machine(machine.id)
+        self.pending = list(names)
+        self.total = len(self.pending)
+        self.group = group
+        self.linked = linked
+        self.snapshot_id = snapshot_id
+        self.max_jobs = max(1, max_jobs)
+        self.description = description
+        self.done = done
+        # The machine (or snapshot's machine) the clones are taken from,
+        # once it's known
+        self.source = None
+        # (TrackedProgress, cleanup) while the linked base snapshot is taken
+        self.base = None
+        self.active = []
+        self.succeeded = []
+        self.errors = []
+        self.percent = 0
+        self.completed = False
+        self.error = None
+
+    def _fail_all(self, message):
+        self.errors.extend((name, message) for name in self.pending)
+        self.pending = []
+
+    def _find_source(self):
+        if self.snapshot_id is None and self.linked:
+            # Nothing to link to yet
+            progress, cleanup = vb_snapshots.begin_snapshot_command(
+                    self.machine, 'take', name=_(u'Linked Base for {}').format(self.machine.name))
+            self.base = (TrackedProgress(progress, self.description), cleanup)
+        elif self.snapshot_id is not None:
+            self.source = self.machine.findSnapshot(self.snapshot_id).machine
+        else:
+            self.source = self.machine
+
+    def _update_base(self):
+        op, cleanup = self.base
+        if not op.update():
+            return
+        self.base = None
+        try:
+            cleanup()
+        except Exception:
+            pass
+        if op.error is not None:
+            self._fail_all(op.error)
+        else:
+            # Taking a snapshot makes it the current one
+            self.source = self.machine.currentSnapshot.machine
+
+    def _start_jobs(self):
+        vbconst = self.vbox.constants
+        options = [vbconst.CloneOptions_Link] if self.linked else []
+        started = 0
+        while len(self.pending) > 0 and len(self.active) < self.max_jobs \
+                and started < self.max_jobs:
+            name = self.pending.pop(0)
+            started += 1
+            target = None
+            try:
+                target = self.vbox.vbox.createMachine(u'', name, [self.group],
+                                                      self.source.OSTypeId, u'')
+                progress = self.source.cloneTo(target, vbconst.CloneMode_MachineState,
+                                               options)
+            except Exception as ex:
+                self._fail(name, self.vbox.exceptMessage(ex), target)
+                continue
+            self.active.append((name, TrackedProgress(progress, name), target))
+
+    def _fail(self, name, message, target):
+        self.errors.append((name, message))
+        if target is None:
+            return
+        try:
+            # Whatever the clone got as far as writing, disk images included.
+            # This runs on in the background; there's nothing more to do with
+            # its progress.
+            target.deleteConfig(self._target_media(target))
+        except Exception:
+            pass
+
+    def _target_media(self, target):
+        vbconst = self.vbox.constants
+        try:
+            # Only works if the clone got as far as being registered
+            return target.unregister(vbconst.CleanupMode_DetachAllReturnHardDisksOnly)
+        except Exception:
+            pass
+        return [att.medium for att in self.vbox.mgr.getArray(target, 'mediumAttachments')
+                if att.medium is not None and att.type == vbconst.DeviceType_HardDisk]
+
+    def _register(self, name, target):
+        try:
+            self.vbox.vbox.registerMachine(target)
+        except Exception as ex:
+            self._fail(name, self.vbox.exceptMessage(ex), target)
+            return
+        self.succeeded.append(name)
+
+    def update(self):
+        # Returns True once every clone has been registered or has failed
+        try:
+            if self.source is None and self.base is None and len(self.pending) > 0:
+                self._find_source()
+            if self.base is not None:
+                self._update_base()
+        except Exception as ex:
+            self.base = None
+            self._fail_all(self.vbox.exceptMessage(ex))
+
+        still_active = []
+        for name, op, target in self.active:
+            try:
+                finished = op.update()
+            except Exception as ex:
+                op.error = self.vbox.exceptMessage(ex)
+                finished = True
+            if not finished:
+                still_active.append((name, op, target))
+            elif op.error is not None:
+                self._fail(name, op.error, target)
+            else:
+                self._register(name, target)
+        self.active = still_active
+        if self.source is not None:
+            self._start_jobs()
+
+        if len(self.pending) == 0 and len(self.active) == 0 and self.base is None:
+            self.completed = True
+        if self.total > 0:
+            handled = len(self.succeeded) + len(self.errors)
+            partial = sum(op.percent for name, op, target in self.active)
+            self.percent = min(100, (handled * 100 + partial) // self.total)
+        else:
+            self.percent = 100
+        if self.completed and len(self.errors) > 0:
+            self.error = _(u'{} of {} clones failed').format(len(self.errors), self.total)
+        return self.completed
+
+    def cancel(self):
+        self._fail_all(_(u'Canceled'))
+        if self.base is not None:
+            self.base[0].cancel()
+        for name, op, target in self.active:
+            op.cancel()
+
+    def summary(self):
+        """Returns a list of lines describing the outcome"""
+        lines = [_(u'{} cloned, {} failed').format(len(self.succeeded), len(self.errors))]
+        if len(self.errors) > 0:
+            lines.append(u'')
+            for name, message in self.errors:
+                lines.append(u'{}: {}'.format(name, message))
+        return lines
@@ -0,0 +1,207 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import threading
+from collections import OrderedDict
+
+from . import VBoxWrapper, get_host
+import vb_text
+
+class MachineDetails(object):
+    """Snapshot of everything the details pane shows for a machine, collected
+    in one pass so rendering doesn't need to go back out to VBoxSVC"""
+
+    __slots__ = ['stamp', 'host_name', 'accessible', 'state', 'name', 'id', 'os_type',
+                 'memory_size', 'cpu_count', 'cpu_cap', 'boot_order', 'accel',
+                 'vram_size', 'monitor_count', 'vrde_ports', 'video_capture_file',
+                 'storage', 'audio', 'network', 'serial_ports', 'parallel_ports',
+                 'usb', 'shared_folders', 'description']
+
+    def __init__(self, machine, stamp=None, host_name=None):
+        self.stamp = stamp
+        self.host_name = host_name
+        self.accessible = machine.accessible
+        if not self.accessible:
+            return
+
+        vbox = VBoxWrapper(host_name)
+        vbconst = vbox.constants
+        self.state = machine.state
+        self.name = machine.name
+        self.id = machine.id
+        self.os_type = vb_text.get_os_type(machine, host_name)
+
+        self.memory_size = machine.memorySize
+        self.cpu_count = machine.CPUCount
+        self.cpu_cap = machine.CPUExecutionCap
+        self.boot_order = vb_text.get_boot_order(machine, host_name)
+        self.accel = vb_text.get_accel_summary(machine, host_name)
+
+        self.vram_size = machine.VRAMSize
+        self.monitor_count = machine.monitorCount
+        vrde = machine.VRDEServer
+        self.vrde_ports = vrde.getVRDEProperty(u'TCP/Ports') if vrde.enabled else None
+        if machine.videoCaptureEnabled:
+            self.video_capture_file = os.path.basename(machine.videoCaptureFile)
+        else:
+            self.video_capture_file = None
+
+        # List of (controller name, [(slot name, attachment description)])
+        self.storage = []
+        for scon in vbox.mgr.getArray(machine, 'storageControllers'):
+            bus = scon.bus
+            attachments = machine.getMediumAttachmentsOfController(scon.name)
+            self.storage.append((scon.name, [
+                (vb_text.get_storage_slot_name(bus, att.port, att.device, host_name),
+                 vb_text.get_attachment_desc(att, host_name))
+                for att in attachments]))
+
+        audio = machine.audioAdapter
+        if audio.enabled:
+            self.audio = (audio.audioDriver, audio.audioController)
+        else:
+            self.audio = None
+
+        # List of (slot, description)
+        self.network = []
+        maxAdapters = vbox.systemProperties.getMaxNetworkAdapters(machine.chipsetType)
+        for ad in range(maxAdapters):
+            adapter = machine.getNetworkAdapter(ad)
+            if not adapter.enabled:
+                continue
+            desc = vb_text.get_network_adapter_desc(adapter, host_name)
+            if desc != u'':
+                self.network.append((adapter.slot, desc))
+
+        # Lists of (slot, port name, host mode, path)
+        self.serial_ports = []
+        for sp in range(vbox.systemProperties.serialPortCount):
+            port = machine.getSerialPort(sp)
+            if not port.enabled:
+                continue
+            host_mode = port.hostMode
+            if host_mode in {vbconst.PortMode_HostPipe, vbconst.PortMode_HostDevice,
+                             vbconst.PortMode_RawFile, vbconst.PortMode_TCP}:
+                path = port.path
+            else:
+                path = None
+            self.serial_ports.append((port.slot, vb_text.serial_port_name(port),
+                                      host_mode, path))
+        self.parallel_ports = []
+        for pp in range(vbox.systemProperties.parallelPortCount):
+            port = machine.getParallelPort(pp)
+            if not port.enabled:
+                continue
+            self.parallel_ports.append((port.slot, vb_text.parallel_port_name(port),
+                                        None, port.path))
+
+        # (controller names, filter count, active filter count)
+        usb_filters = machine.USBDeviceFilters
+        if usb_filters is not None and machine.USBProxyAvailable:
+            controllers = [c.name for c in vbox.mgr.getArray(machine, 'USBControllers')]
+            filters = vbox.mgr.getArray(usb_filters, 'deviceFilters')
+            active = len([df for df in filters if df.active])
+            self.usb = (controllers, len(filters), active)
+        else:
+            self.usb = None
+
+        # List of (name, host path, writable, auto-mount)
+        self.shared_folders = [(sf.name, sf.hostPath, sf.writable, sf.autoMount)
+                               for sf in vbox.mgr.getArray(machine, 'sharedFolders')]
+
+        self.description = machine.description
+
+
+def get_details_stamp(machine, host_name=None):
+    # Cheap check for whether a cached snapshot is still current.  Saved
+    # settings changes touch the .vbox file.  (settingsModified would catch
+    # unsaved ones too, but only a session's machine may be asked for it.)
+    # A remote machine's settings file isn't ours to stat, so it relies on
+    # the data and extra data changed events invalidating its entry.
+    mtime = None
+    if get_host(host_name).is_local:
+        try:
+            mtime = os.stat(machine.settingsFilePath).st_mtime
+        except (OSError, TypeError):
+            pass
+    return (machine.lastStateChange, mtime)
+
+
+class MachineDetailsCache(object):
+    # Shared between the UI thread and the details worker, so the entries
+    # are only touched with the lock held.  Snapshots themselves are built
+    # without it, so one built before an invalidation (of its machine, or
+    # of everything) isn't stored after it.
+    def __init__(self, max_size=64):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        # Machine id -> times invalidated, since the global count was last
+        # bumped
+        self._generation = {}
+        self._cache_generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, machine):
+        mach_id = machine.id
+        host_name = VBoxWrapper.machine_host(mach_id)
+        if not machine.accessible:
+            self.invalidate(mach_id)
+            return MachineDetails(machine, host_name=host_name)
+        stamp = get_details_stamp(machine, host_name)
+        with self._lock:
+            details = self._entries.get(mach_id)
+            generation = (self._cache_generation, self._generation.get(mach_id, 0))
+        if details is None or details.stamp != stamp:
+            details = MachineDetails(machine, stamp, host_name)
+        with self._lock:
+            if generation == (self._cache_generation, self._generation.get(mach_id, 0)):
+                self._entries.pop(mach_id, None)
+                self._entries[mach_id] = details
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return details
+
+    def invalidate(self, machine_id):
+        with self._lock:
+            self._entries.pop(machine_id, None)
+            self._generation[machine_id] = self._generation.get(machine_id, 0) + 1
+            if len(self._generation) > self.max_size * 4:
+                # Events touch machines which were never looked at, so
+                # start counting over rather than let this grow.  Bumping
+                # the global count still stops any snapshot in progress
+                # from being stored.
+                self._generation.clear()
+                self._cache_generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation.clear()
+            self._cache_generation += 1
+
+
+_details_cache = MachineDetailsCache()
+
+def get_machine_details(machine):
+    return _details_cache.get(machine)
+
+def invalidate_machine_details(machine_id=None):
+    if machine_id is None:
+        _details_cache.clear()
+    else:
+        _details_cache.invalidate(machine_id)
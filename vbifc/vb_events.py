@@ -0,0 +1,258 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import time
+import heapq
+import threading
+
+from . import VBoxWrapper
+
+# Event kinds reported by MachineEventListener.poll()
+MACHINE_STATE = 'state'
+MACHINE_REGISTERED = 'registered'
+MACHINE_DATA = 'data'
+# Value is the changed key; the machine id is None for global extra data
+MACHINE_EXTRA_DATA = 'extra_data'
+SESSION_STATE = 'session'
+
+# Medium events are reported as (kind, machine_id, medium_id).  The machine
+# id is None for registrations, which aren't tied to any one machine.
+MEDIUM_REGISTERED = 'medium_registered'
+MEDIUM_CHANGED = 'medium_changed'
+MEDIUM_KINDS = {MEDIUM_REGISTERED, MEDIUM_CHANGED}
+
+def _medium_changed(event):
+    attachment = event.mediumAttachment
+    medium = attachment.medium
+    return attachment.machine.id, medium.id if medium is not None else None
+
+class MachineEventListener(object):
+    """Passive listener on the VirtualBox event source.  Nothing is delivered
+    until poll() is called, so the caller decides when (and on which thread)
+    events get processed."""
+
+    def __init__(self, host_name=None):
+        self.vbox = VBoxWrapper(host_name)
+        vbconst = self.vbox.constants
+        # Event type -> (kind, interface, (machine id, value) getter)
+        self._types = {
+            vbconst.VBoxEventType_OnMachineStateChanged:
+                (MACHINE_STATE, 'IMachineStateChangedEvent',
+                 lambda event: (event.machineId, event.state)),
+            vbconst.VBoxEventType_OnMachineRegistered:
+                (MACHINE_REGISTERED, 'IMachineRegisteredEvent',
+                 lambda event: (event.machineId, event.registered)),
+            vbconst.VBoxEventType_OnMachineDataChanged:
+                (MACHINE_DATA, 'IMachineDataChangedEvent',
+                 lambda event: (event.machineId, event.temporary)),
+            vbconst.VBoxEventType_OnExtraDataChanged:
+                (MACHINE_EXTRA_DATA, 'IExtraDataChangedEvent',
+                 lambda event: (event.machineId or None, event.key)),
+            vbconst.VBoxEventType_OnSessionStateChanged:
+                (SESSION_STATE, 'ISessionStateChangedEvent',
+                 lambda event: (event.machineId, event.state)),
+            vbconst.VBoxEventType_OnMediumRegistered:
+                (MEDIUM_REGISTERED, 'IMediumRegisteredEvent',
+                 lambda event: (None, event.mediumId)),
+            vbconst.VBoxEventType_OnMediumChanged:
+                (MEDIUM_CHANGED, 'IMediumChangedEvent', _medium_changed)
+        }
+        self.source = self.vbox.vbox.eventSource
+        self.listener = self.source.createListener()
+        self.source.registerListener(self.listener, list(self._types.keys()), False)
+
+    def poll(self):
+        """Drain all pending events, returning a list of
+        (kind, machine_id, value) tuples in delivery order."""
+        if self.listener is None:
+            return []
+
+        vbox = self.vbox
+        events = []
+        while True:
+            event = self.source.getEvent(self.listener, 0)
+            if event is None:
+                break
+            try:
+                ev_type = event.type
+                if ev_type in self._types:
+                    kind, iface, getter = self._types[ev_type]
+                    detail = vbox.mgr.queryInterface(event, iface)
+                    machine_id, value = getter(detail)
+                    events.append((kind, machine_id, value))
+            finally:
+                self.source.eventProcessed(self.listener, event)
+        return events
+
+    def close(self):
+        if self.listener is not None:
+            self.source.unregisterListener(self.listener)
+            self.listener = None
+
+
+class StatePoller(object):
+    """Reads machine.state directly, as a fallback for VirtualBox versions
+    or remote connections where state change events can go missing.
+    Machines in the middle of a state change are read every second or so,
+    running ones less often and powered off ones rarely, and each poll()
+    reads at most budget machines, so this stays cheap with many VMs."""
+
+    # Seconds between reads of a machine, by its last known state
+    transient_interval = 1.0
+    running_interval = 5.0
+    idle_interval = 60.0
+
+    # Seconds a machine is read as often as a transient one after wake()
+    watch_time = 30.0
+
+    def __init__(self, host_name=None, budget=8):
+        self.vbox = VBoxWrapper(host_name)
+        self.budget = budget
+        vbconst = self.vbox.constants
+        self._running = {vbconst.MachineState_Running, vbconst.MachineState_Paused,
+                         vbconst.MachineState_Stuck}
+        self._idle = {vbconst.MachineState_PoweredOff, vbconst.MachineState_Saved,
+                      vbconst.MachineState_Teleported, vbconst.MachineState_Aborted,
+                      None}
+        # Machine id -> (last known state, when it's next due to be read)
+        self._known = {}
+        self._wake = set()
+        # Machine id -> when to stop watching it closely
+        self._watch = {}
+        # wake() may be called from any thread, so _wake and _watch are
+        # only touched with this held
+        self._lock = threading.Lock()
+
+    def interval(self, state):
+        if state in self._idle:
+            return self.idle_interval
+        elif state in self._running:
+            return self.running_interval
+        return self.transient_interval
+
+    def note_events(self, events):
+        # States reported by events don't need to be found again by polling
+        now = time.time()
+        for kind, machine_id, value in events:
+            if kind == MACHINE_STATE:
+                self._known[machine_id] = (value, now + self.interval(value))
+                with self._lock:
+                    self._watch.pop(machine_id, None)
+
+    def wake(self, machine_id):
+        """Read machine_id on the next poll, and then as often as a machine
+        in a transient state until its state changes, e.g. because it was
+        just asked to start or stop.  Safe to call from any thread."""
+        with self._lock:
+            self._watch[machine_id] = time.time() + self.watch_time
+            self._wake.add(machine_id)
+
+    def poll(self, now=None):
+        """Reads the states of the machines which are due, returning a
+        (MACHINE_STATE, machine_id, state) event for each that changed"""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            woken, self._wake = self._wake, set()
+        # items() copies, so the cache may change on another thread meanwhile
+        machines = self.vbox.machines_by_id.items()
+        due = []
+        for machine_id, machine in machines:
+            known = self._known.get(machine_id)
+            if machine_id in woken:
+                due.append((-1, machine_id, machine))
+            elif known is None:
+                due.append((0, machine_id, machine))
+            elif known[1] <= now:
+                due.append((known[1], machine_id, machine))
+
+        events = []
+        for next_due, machine_id, machine in heapq.nsmallest(self.budget, due):
+            woken.discard(machine_id)
+            try:
+                state = machine.state
+            except Exception:
+                state = None
+            known = self._known.get(machine_id)
+            changed = known is not None and state is not None and state != known[0]
+            if changed:
+                events.append((MACHINE_STATE, machine_id, state))
+            interval = self.interval(state)
+            with self._lock:
+                watch = self._watch.get(machine_id)
+                if watch is not None:
+                    if changed or watch <= now:
+                        del self._watch[machine_id]
+                    else:
+                        interval = min(interval, self.transient_interval)
+            self._known[machine_id] = (state, now + interval)
+        # Any left over go first next time
+        with self._lock:
+            self._wake.update(machine_id for next_due, machine_id, machine in due
+                              if machine_id in woken)
+
+        if len(self._known) > len(machines):
+            # Forget machines which have been unregistered
+            registered = set(machine_id for machine_id, machine in machines)
+            for machine_id in list(self._known.keys()):
+                if machine_id not in registered:
+                    del self._known[machine_id]
+        return events
+
+
+class EventPoller(threading.Thread):
+    """Polls a remote host's events on a thread of its own, so a slow host
+    doesn't hold up the UI or the other hosts.  Each batch of events is
+    handed to post(callback, events, host_name).  (The local host is
+    polled from the main loop instead, since XPCOM only delivers events to
+    the thread which created the manager.)  If a StatePoller is given, it
+    is polled along with the events."""
+
+    def __init__(self, host_name, post, callback, interval=0.5, state_poller=None):
+        super(EventPoller, self).__init__(name=u'events-{}'.format(host_name))
+        self.daemon = True
+        self.host_name = host_name
+        self.post = post
+        self.callback = callback
+        self.interval = interval
+        self.state_poller = state_poller
+        self._stopping = threading.Event()
+
+    def run(self):
+        listener = None
+        while not self._stopping.is_set():
+            try:
+                if listener is None:
+                    listener = MachineEventListener(self.host_name)
+                events = listener.poll()
+                if self.state_poller is not None:
+                    self.state_poller.note_events(events)
+                    events.extend(self.state_poller.poll())
+                if len(events) > 0:
+                    self.post(self.callback, events, self.host_name)
+            except Exception:
+                # Probably lost the connection -- listen again next time
+                listener = None
+            self._stopping.wait(self.interval)
+        if listener is not None:
+            try:
+                listener.close()
+            except Exception:
+                pass
+
+    def stop(self):
+        self._stopping.set()
@@ -0,0 +1,232 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import re
+import mmap
+import errno
+import fcntl
+import struct
+import uuid
+from collections import deque
+
+from . import cache_path
+from vb_metrics import SERIES, NO_VALUE, has_value
+
+# File layout: a fixed size header, followed by a ring of fixed size
+# records.  Each record is one machine's averages over one time window.
+MAGIC = b'VBCHIST\0'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIII')      # magic, version, record size, slots, head, count
+HEADER_SIZE = 64
+RECORD = struct.Struct('<16sd' + 'f' * len(SERIES))  # machine UUID, time, series...
+
+def default_path(host):
+    return cache_path(u'history-{}.dat'.format(re.sub(r'[^\w.-]', '_', host)))
+
+def machine_key(mach_id):
+    return uuid.UUID(mach_id).bytes
+
+
+class HistoryStore(object):
+    """Metrics history kept in a memory-mapped ring file, so it survives
+    restarts.  The file never grows: once all slots are used, each new
+    record replaces the oldest one.  Only one process records into a file
+    at a time; any others open it read-only, and refresh() to pick up what
+    it has written since."""
+
+    # Seconds of samples averaged into each record
+    resolution = 30
+
+    def __init__(self, path, slots=262144):
+        self.path = path
+        self.slots = slots
+        self.readonly = False
+        self.loaded = False
+        self._file = None
+        self._map = None
+        # Machine UUID bytes -> deque of its slots, oldest first
+        self._index = {}
+        self._keys = {}
+        # Header (head, count) as of the last load()
+        self._loaded_at = None
+        # Machine id -> ([sums], [counts]) for the window being recorded
+        self._pending = {}
+        self._window = None
+
+    def open(self):
+        try:
+            os.makedirs(os.path.dirname(self.path))
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+
+        size = HEADER_SIZE + RECORD.size * self.slots
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._file = os.fdopen(fd, 'r+b')
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            # Another vboxcli is recording -- just show what it writes
+            self.readonly = True
+
+        if not self._header_valid(size):
+            if self.readonly:
+                self.close()
+                raise ValueError(u'{} is not a usable history file'.format(self.path))
+            self._file.truncate(0)
+            self._file.truncate(size)
+            self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, self.slots, 0, 0))
+            self._file.flush()
+
+        access = mmap.ACCESS_READ if self.readonly else mmap.ACCESS_WRITE
+        self._map = mmap.mmap(fd, size, access=access)
+
+    def _header_valid(self, size):
+        self._file.seek(0, os.SEEK_END)
+        if self._file.tell() != size:
+            return False
+        self._file.seek(0)
+        magic, version, rec_size, slots, head, count = \
+                HEADER.unpack(self._file.read(HEADER.size))
+        return magic == MAGIC and version == VERSION and rec_size == RECORD.size \
+               and slots == self.slots and head < slots and count <= slots
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _offset(self, slot):
+        return HEADER_SIZE + slot * RECORD.size
+
+    def load(self):
+        """Index the records already in the file.  Nothing is read from
+        VirtualBox, so this can run before it's even connected."""
+        magic, version, rec_size, slots, head, count = HEADER.unpack_from(self._map, 0)
+        index = {}
+        data = self._map
+        slot = (head - count) % slots
+        for idx in xrange(count):
+            offset = self._offset(slot)
+            key = data[offset:offset + 16]
+            if key in index:
+                index[key].append(slot)
+            else:
+                index[key] = deque([slot])
+            slot += 1
+            if slot == slots:
+                slot = 0
+        self._index = index
+        self._loaded_at = (head, count)
+        self.loaded = True
+
+    def refresh(self):
+        """Re-index a read-only store if the recording process has written
+        to it since it was loaded.  Returns True if anything changed."""
+        if not self.readonly or not self.loaded:
+            return False
+        magic, version, rec_size, slots, head, count = HEADER.unpack_from(self._map, 0)
+        if (head, count) == self._loaded_at:
+            return False
+        self.load()
+        return True
+
+    def _key(self, mach_id):
+        key = self._keys.get(mach_id)
+        if key is None:
+            key = machine_key(mach_id)
+            self._keys[mach_id] = key
+        return key
+
+    def append(self, mach_id, timestamp, values):
+        magic, version, rec_size, slots, head, count = HEADER.unpack_from(self._map, 0)
+        offset = self._offset(head)
+        if count == slots:
+            # The oldest record is always first in its machine's slot list
+            old_key = self._map[offset:offset + 16]
+            old_slots = self._index.get(old_key)
+            if old_slots and old_slots[0] == head:
+                old_slots.popleft()
+                if len(old_slots) == 0:
+                    del self._index[old_key]
+        key = self._key(mach_id)
+        RECORD.pack_into(self._map, offset, key, timestamp, *values)
+        self._index.setdefault(key, deque()).append(head)
+        HEADER.pack_into(self._map, 0, magic, version, rec_size, slots,
+                         (head + 1) % slots, min(count + 1, slots))
+
+    def record(self, samples, now):
+        """Fold samples ({machine id: {series: value}}, as returned from
+        MetricsCollector.query) into the current window, writing out the
+        averages once the window has passed"""
+        if self.readonly or not self.loaded:
+            return
+        if self._window is None:
+            self._window = now - now % self.resolution
+        elif now >= self._window + self.resolution:
+            self.flush()
+            self._window = now - now % self.resolution
+
+        for mach_id, values in samples.items():
+            pending = self._pending.get(mach_id)
+            if pending is None:
+                pending = ([0.0] * len(SERIES), [0] * len(SERIES))
+                self._pending[mach_id] = pending
+            sums, counts = pending
+            for col, name in enumerate(SERIES):
+                value = values.get(name, NO_VALUE)
+                if has_value(value):
+                    sums[col] += value
+                    counts[col] += 1
+
+    def flush(self):
+        for mach_id, (sums, counts) in self._pending.items():
+            averages = [sums[col] / counts[col] if counts[col] > 0 else NO_VALUE
+                        for col in range(len(SERIES))]
+            self.append(mach_id, self._window, averages)
+        self._pending = {}
+
+    def series(self, mach_id, name, since, until, buckets):
+        """Averages of one series over each of buckets equal slices of the
+        time from since to until, oldest first.  Empty slices are NaN."""
+        if not self.loaded:
+            return [NO_VALUE] * buckets
+        key = self._key(mach_id)
+        col = SERIES.index(name) + 2
+        sums = [0.0] * buckets
+        counts = [0] * buckets
+        span = float(until - since)
+        for slot in reversed(self._index.get(key, ())):
+            record = RECORD.unpack_from(self._map, self._offset(slot))
+            if record[0] != key:
+                # Overwritten by another process recording into this file
+                continue
+            timestamp = record[1]
+            if timestamp < since:
+                break
+            value = record[col]
+            if timestamp >= until or not has_value(value):
+                continue
+            bucket = int((timestamp - since) * buckets / span)
+            sums[bucket] += value
+            counts[bucket] += 1
+        return [sums[idx] / counts[idx] if counts[idx] > 0 else NO_VALUE
+                for idx in range(buckets)]
@@ -0,0 +1,94 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import json
+import errno
+import threading
+
+from . import VBoxWrapper, LOCAL_HOST, add_host, get_host, host_names
+from vb_registry import get_registry
+
+def default_config_path():
+    config_dir = os.environ.get('XDG_CONFIG_HOME') or \
+                 os.path.join(os.path.expanduser('~'), '.config')
+    return os.path.join(config_dir, 'vboxcli', 'hosts.json')
+
+def load_hosts(path, local=True):
+    """Register the local VirtualBox (unless local is False), followed by
+    each vboxwebsrv endpoint listed in the JSON file at path:
+
+        [{"name": "build1", "url": "http://build1:18083/",
+          "user": "vbox", "password": "secret"}, ...]
+
+    A missing file just means there are no remote hosts."""
+    if local:
+        add_host(LOCAL_HOST)
+    try:
+        with open(path, 'rb') as hosts_file:
+            entries = json.load(hosts_file)
+    except IOError as ex:
+        if ex.errno == errno.ENOENT:
+            return
+        raise
+    for entry in entries:
+        add_host(entry['name'], 'WEBSERVICE', {
+            'url': entry['url'],
+            'user': entry.get('user', u''),
+            'password': entry.get('password', u'')
+        })
+
+def _refresh_host(name, done=None):
+    host = get_host(name)
+    try:
+        VBoxWrapper(name).refetch()
+        # The machine list describes states from the host's own registry,
+        # so have it ready before the main loop gets to draw them
+        get_registry(name)
+        host.error = None
+    except Exception as ex:
+        host.error = ex
+    if done is not None:
+        done(name)
+
+def refresh_hosts(names=None, done=None):
+    """Connect to each host if needed, and re-fetch its machines and groups.
+    A host which fails is left with its error set.  Remote hosts are each
+    fetched on their own thread.  If done is given, this only waits for the
+    local host, and done(name) is called as each host finishes -- from the
+    host's thread for remote hosts, so it should just post the result back
+    to the main loop.  Otherwise, this returns once every host is done,
+    which takes about as long as the slowest one."""
+    if names is None:
+        names = host_names()
+    threads = []
+    local = []
+    for name in names:
+        if get_host(name).is_local:
+            local.append(name)
+        else:
+            thread = threading.Thread(target=_refresh_host, args=(name, done),
+                                      name=u'refresh-{}'.format(name))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+    # XPCOM ties the local manager to the thread which created it
+    for name in local:
+        _refresh_host(name, done)
+    if done is None:
+        for thread in threads:
+            thread.join()
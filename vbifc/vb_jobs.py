@@ -0,0 +1,210 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from . import VBoxWrapper, VBoxConstants
+from vb_progress import TrackedProgress
+import vb_session
+
+def command_states(command, host_name=None):
+    """Returns the set of machine states in which command may be run on
+    host_name"""
+    vbconst = VBoxConstants(host_name)
+    stopped = {vbconst.MachineState_PoweredOff,
+               vbconst.MachineState_Aborted,
+               vbconst.MachineState_Saved}
+    running = {vbconst.MachineState_Running,
+               vbconst.MachineState_Paused}
+    if command == 'start':
+        return stopped
+    elif command in {'save_state', 'acpi_button', 'power_down', 'toggle_pause'}:
+        return running
+    elif command == 'pause':
+        return {vbconst.MachineState_Running}
+    elif command == 'resume':
+        return {vbconst.MachineState_Paused}
+    raise ValueError(u'Unsupported command: {}'.format(command))
+
+def unlock_session(session):
+    vbconst = VBoxConstants()
+    if session.state == vbconst.SessionState_Locked:
+        session.unlockMachine()
+
+def begin_command(machine, command, vmtype=u'headless'):
+    """Start command on machine.  Returns (progress, cleanup), where progress
+    is None if the command has already completed, and cleanup must be
+    called once it is finished."""
+    vbox = VBoxWrapper.for_machine(machine.id)
+    vbconst = vbox.constants
+    if command == 'start':
+        # The session must come from the machine's own host
+        session = vbox.getSession()
+        cleanup = lambda: unlock_session(session)
+    else:
+        # Console commands reuse a pooled shared session.  Once the machine
+        # is being stopped, there's no point in keeping it around.
+        mach_id = machine.id
+        session = vb_session.shared_session(machine)
+        if command in {'save_state', 'power_down'}:
+            cleanup = lambda: vb_session.release_session(mach_id)
+        else:
+            cleanup = lambda: None
+
+    try:
+        progress = None
+        if command == 'start':
+            progress = machine.launchVMProcess(session, vmtype, u'')
+        elif command == 'save_state':
+            progress = session.machine.saveState()
+        elif command == 'power_down':
+            progress = session.console.powerDown()
+        elif command == 'acpi_button':
+            session.console.powerButton()
+        elif command == 'pause':
+            session.console.pause()
+        elif command == 'resume':
+            session.console.resume()
+        elif command == 'toggle_pause':
+            if machine.state == vbconst.MachineState_Paused:
+                session.console.resume()
+            else:
+                session.console.pause()
+        else:
+            raise ValueError(u'Unsupported command: {}'.format(command))
+    except:
+        if command == 'start':
+            cleanup()
+        else:
+            # Don't hang on to a session that may have gone bad
+            vb_session.release_session(mach_id)
+        raise
+    return progress, cleanup
+
+
+class BulkOperation(object):
+    """Runs a command across many machines, with at most max_jobs of them
+    in flight at once.  This is polled like a TrackedProgress (and can be
+    added to a ProgressTracker), and collects per-machine errors instead of
+    stopping at the first one."""
+
+    def __init__(self, machines, command, vmtype=u'headless', max_jobs=4,
+                 description=u'', done=None):
+        self.pending = list(machines)
+        self.total = len(self.pending)
+        self.command = command
+        self.vmtype = vmtype
+        self.max_jobs = max(1, max_jobs)
+        self.description = description
+        self.done = done
+        # Host name -> states the command may be run in there
+        self.states = {}
+        self.active = []
+        self.succeeded = []
+        self.skipped = []
+        self.errors = []
+        # Machines which hadn't been started yet when the operation was
+        # canceled
+        self.canceled = 0
+        self.percent = 0
+        self.completed = False
+        self.error = None
+
+    def _finish_job(self, name, op, cleanup):
+        try:
+            cleanup()
+        except Exception:
+            pass
+        if op is not None and op.error is not None:
+            self.errors.append((name, op.error))
+        else:
+            self.succeeded.append(name)
+
+    def _start_jobs(self):
+        vbox = VBoxWrapper()
+        started = 0
+        while len(self.pending) > 0 and len(self.active) < self.max_jobs \
+                and started < self.max_jobs:
+            machine = self.pending.pop(0)
+            started += 1
+            name = _(u'<unknown>')
+            try:
+                name = machine.name
+                host_name = VBoxWrapper.machine_host(machine.id)
+                if host_name not in self.states:
+                    self.states[host_name] = command_states(self.command, host_name)
+                if machine.state not in self.states[host_name]:
+                    self.skipped.append(name)
+                    continue
+                progress, cleanup = begin_command(machine, self.command, self.vmtype)
+            except Exception as ex:
+                self.errors.append((name, vbox.exceptMessage(ex)))
+                continue
+            if progress is None:
+                self._finish_job(name, None, cleanup)
+            else:
+                self.active.append((name, TrackedProgress(progress, name), cleanup))
+
+    def update(self):
+        # Returns True once every machine has been handled
+        vbox = VBoxWrapper()
+        still_active = []
+        for name, op, cleanup in self.active:
+            try:
+                finished = op.update()
+            except Exception as ex:
+                op.error = vbox.exceptMessage(ex)
+                finished = True
+            if finished:
+                self._finish_job(name, op, cleanup)
+            else:
+                still_active.append((name, op, cleanup))
+        self.active = still_active
+        self._start_jobs()
+
+        if self.total > 0:
+            handled = len(self.succeeded) + len(self.skipped) + len(self.errors) \
+                    + self.canceled
+            partial = sum(op.percent for name, op, cleanup in self.active)
+            self.percent = (handled * 100 + partial) // self.total
+        else:
+            self.percent = 100
+        self.completed = len(self.pending) == 0 and len(self.active) == 0
+        if self.completed and len(self.errors) > 0:
+            self.error = _(u'{} of {} machines failed').format(len(self.errors), self.total)
+        return self.completed
+
+    def cancel(self):
+        self.canceled += len(self.pending)
+        self.pending = []
+        for name, op, cleanup in self.active:
+            op.cancel()
+
+    def summary(self):
+        """Returns a list of lines describing the outcome"""
+        lines = [_(u'{} succeeded, {} failed, {} skipped').format(
+                    len(self.succeeded), len(self.errors), len(self.skipped))]
+        if len(self.errors) > 0:
+            lines.append(u'')
+            for name, message in self.errors:
+                lines.append(u'{}: {}'.format(name, message))
+        if len(self.skipped) > 0:
+            lines.append(u'')
+            lines.append(_(u'Skipped (not in a suitable state): {}').format(
+                         u', '.join(self.skipped)))
+        if self.canceled > 0:
+            lines.append(u'')
+            lines.append(_(u'Canceled before starting: {}').format(self.canceled))
+        return lines
@@ -0,0 +1,192 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from collections import OrderedDict
+
+class LogReader(object):
+    """Random access to a machine's log file through IMachine.readLog.
+    Lines are addressed by the byte offset they start at, and only the
+    chunks around what's being looked at are kept in memory, so the size
+    of the log doesn't matter."""
+
+    chunk_size = 64 * 1024
+
+    # Chunks kept in memory at once
+    cache_chunks = 16
+
+    # Longer lines are split, so finding a line never reads without bound
+    max_line = 16 * 1024
+
+    # Bytes from the start of the log compared to spot a new log.  This
+    # takes in the "Log opened" line with its timestamp.
+    head_size = 512
+
+    def __init__(self, machine, log_idx=0):
+        self.machine = machine
+        self.log_idx = log_idx
+        self.filename = machine.queryLogFilename(log_idx)
+        self._cache = OrderedDict()
+        self.size = self.find_size()
+        self._head = self._read(0, self.head_size)
+
+    def _read(self, offset, size):
+        data = self.machine.readLog(self.log_idx, offset, size)
+        # Octet arrays come back as str or bytearray depending on the binding
+        return bytes(bytearray(data))
+
+    def find_size(self):
+        # There's no way to ask for the size, so probe for the end: double
+        # the offset until reading past the end, then bisect
+        if len(self._read(0, 1)) == 0:
+            return 0
+        low = 0
+        high = self.chunk_size
+        while len(self._read(high, 1)) > 0:
+            low = high
+            high *= 2
+        # The byte at low exists, the byte at high doesn't
+        while high - low > 1:
+            mid = (low + high) // 2
+            if len(self._read(mid, 1)) > 0:
+                low = mid
+            else:
+                high = mid
+        return high
+
+    def _chunk(self, chunk_no):
+        data = self._cache.pop(chunk_no, None)
+        if data is None:
+            data = self._read(chunk_no * self.chunk_size, self.chunk_size)
+        self._cache[chunk_no] = data
+        if len(self._cache) > self.cache_chunks:
+            self._cache.popitem(last=False)
+        return data
+
+    def read(self, offset, size):
+        """Returns up to size bytes from offset, within the known size"""
+        end = min(offset + size, self.size)
+        parts = []
+        while offset < end:
+            chunk_no, chunk_offset = divmod(offset, self.chunk_size)
+            data = self._chunk(chunk_no)[chunk_offset:chunk_offset + end - offset]
+            if len(data) == 0:
+                break
+            parts.append(data)
+            offset += len(data)
+        return b''.join(parts)
+
+    def line_at(self, offset):
+        """Returns (text, next_offset) for the line starting at offset"""
+        data = b''
+        pos = offset
+        while pos < self.size and len(data) < self.max_line:
+            block = self.read(pos, min(self.chunk_size - pos % self.chunk_size,
+                                       self.max_line - len(data)))
+            if len(block) == 0:
+                break
+            newline = block.find(b'\n')
+            if newline >= 0:
+                data += block[:newline + 1]
+                break
+            data += block
+            pos += len(block)
+        return data.rstrip(b'\r\n').decode('utf-8', 'replace'), offset + len(data)
+
+    def line_start(self, offset):
+        """Returns the offset of the start of the line containing offset"""
+        limit = max(0, offset - self.max_line)
+        pos = offset
+        while pos > limit:
+            block_start = max(limit, pos - (pos - 1) % self.chunk_size - 1)
+            block = self.read(block_start, pos - block_start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return block_start + newline + 1
+            pos = block_start
+        return limit
+
+    def prev_line(self, offset):
+        if offset <= 0:
+            return None
+        return self.line_start(offset - 1)
+
+    def last_line(self):
+        if self.size == 0:
+            return None
+        return self.line_start(self.size - 1)
+
+    def refresh(self):
+        """Pick up anything written to the log since it was last read.  Only
+        the new bytes are read.  Returns True if the log grew, or was
+        replaced by a new one (in which case offsets start over)."""
+        if self._rotated():
+            self.filename = self.machine.queryLogFilename(self.log_idx)
+            self._cache.clear()
+            self.size = self.find_size()
+            self._head = self._read(0, self.head_size)
+            return True
+
+        grew = False
+        while True:
+            chunk_no, chunk_offset = divmod(self.size, self.chunk_size)
+            data = self._read(self.size, self.chunk_size - chunk_offset)
+            if len(data) == 0:
+                break
+            # Extend the cached copy of the last chunk, rather than leaving
+            # it short
+            cached = self._cache.get(chunk_no)
+            if cached is not None and len(cached) == chunk_offset:
+                self._cache[chunk_no] = cached + data
+            else:
+                self._cache.pop(chunk_no, None)
+            self.size += len(data)
+            grew = True
+        if grew and len(self._head) < self.head_size:
+            self._head = self._read(0, self.head_size)
+        return grew
+
+    def _rotated(self):
+        # Logs are rotated when the machine is restarted
+        if self.machine.queryLogFilename(self.log_idx) != self.filename:
+            return True
+        if self.size > 0 and len(self._read(self.size - 1, 1)) == 0:
+            return True
+        # The new log may already be longer than the old one was
+        return self._read(0, len(self._head)) != self._head
+
+    def search(self, text, start, end=None, cancelled=None):
+        """Returns the offset of the first case-insensitive match of text
+        between start and end (default: the end of the log), or None.
+        Only one chunk (plus a little overlap) is held at a time."""
+        needle = text.encode('utf-8').lower()
+        if end is None:
+            end = self.size
+        overlap = b''
+        offset = start
+        while offset < end:
+            if cancelled is not None and cancelled():
+                return None
+            data = self._read(offset, min(self.chunk_size, end - offset))
+            if len(data) == 0:
+                break
+            block = overlap + data.lower()
+            found = block.find(needle)
+            if found >= 0:
+                return offset - len(overlap) + found
+            overlap = block[-(len(needle) - 1):] if len(needle) > 1 else b''
+            offset += len(data)
+        return None
@@ -0,0 +1,57 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from . import VBoxWrapper, VBoxConstants
+
+def media_categories():
+    """Returns [(device type, attribute of IVirtualBox)] for each kind of
+    registered medium"""
+    vbconst = VBoxConstants()
+    return [(vbconst.DeviceType_HardDisk, 'hardDisks'),
+            (vbconst.DeviceType_DVD, 'DVDImages'),
+            (vbconst.DeviceType_Floppy, 'floppyImages')]
+
+def registered_media(attr):
+    # For hard disks, this is only the base media -- differencing images
+    # are found through each one's children
+    vbox = VBoxWrapper()
+    return vbox.mgr.getArray(vbox.vbox, attr)
+
+def child_media(medium):
+    return VBoxWrapper().mgr.getArray(medium, 'children')
+
+
+class MediumState(object):
+    """The parts of a medium that may need to touch its file to find out.
+    refreshState() stats (or opens) the image, which can be slow on network
+    storage, so these are collected on a worker."""
+
+    __slots__ = ['id', 'state', 'size', 'logical_size', 'child_count', 'machine_count',
+                 'location']
+
+    def __init__(self, medium):
+        vbconst = VBoxConstants()
+        self.id = medium.id
+        self.location = medium.location
+        self.state = medium.refreshState()
+        self.size = medium.size
+        if medium.deviceType == vbconst.DeviceType_HardDisk:
+            self.logical_size = medium.logicalSize
+        else:
+            self.logical_size = None
+        self.child_count = len(child_media(medium))
+        self.machine_count = len(VBoxWrapper().mgr.getArray(medium, 'machineIds'))
@@ -0,0 +1,196 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import array
+
+from . import VBoxWrapper, VBoxConstants
+
+# The guest metrics need the Guest Additions; the network rates don't
+METRIC_NAMES = [
+    u'Guest/CPU/Load/User',
+    u'Guest/CPU/Load/Kernel',
+    u'Guest/RAM/Usage/Total',
+    u'Guest/RAM/Usage/Free',
+    u'Net/Rate/Rx',
+    u'Net/Rate/Tx'
+]
+
+# Series kept for each machine.  CPU is in percent, RAM in KiB and the
+# network rates in bytes/sec.
+SERIES = ['cpu', 'ram_used', 'ram_total', 'net_rx', 'net_tx']
+
+NO_VALUE = float('nan')
+
+def has_value(value):
+    # Missing samples are NaN, which is the only value not equal to itself
+    return value == value
+
+_running_states = None
+def running_states():
+    """Machine states in which a VM process (and so its metrics) exists"""
+    global _running_states
+    if _running_states is None:
+        vbconst = VBoxConstants()
+        _running_states = {vbconst.MachineState_Running,
+                           vbconst.MachineState_Paused,
+                           vbconst.MachineState_Stuck}
+    return _running_states
+
+class RingBuffer(object):
+    """A fixed number of samples in a preallocated array.  Once it's full,
+    each new sample overwrites the oldest one."""
+
+    def __init__(self, size):
+        self.size = size
+        self._data = array.array('d', [NO_VALUE]) * size
+        self._next = 0
+        self._count = 0
+
+    def append(self, value):
+        self._data[self._next] = value
+        self._next = (self._next + 1) % self.size
+        if self._count < self.size:
+            self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def last(self):
+        if self._count == 0:
+            return NO_VALUE
+        return self._data[self._next - 1]
+
+    def values(self, count=None):
+        """Returns up to count of the most recent samples, oldest first"""
+        if count is None or count > self._count:
+            count = self._count
+        start = self._next - count
+        if start >= 0:
+            return self._data[start:self._next].tolist()
+        return self._data[start:].tolist() + self._data[:self._next].tolist()
+
+
+class MetricsCollector(object):
+    """Keeps a history of performance samples for every running machine.
+    query() does the blocking COM work and is meant for a worker thread;
+    everything else is only touched from the thread that owns the history."""
+
+    def __init__(self, history_size=60, period=1):
+        self.history_size = history_size
+        self.period = period
+        # Ids of running machines, or None until the first query finds them
+        self.running = None
+        self.history = {}
+        # Only used from the thread calling query()
+        self._setup_ids = None
+        # Metric object -> machine id, from the last query
+        self._object_ids = {}
+
+    def machine_state(self, mach_id, state):
+        if self.running is None:
+            return
+        if state in running_states():
+            self.running.add(mach_id)
+        else:
+            self.running.discard(mach_id)
+            self.history.pop(mach_id, None)
+
+    def query(self, machine_ids=None):
+        """Fetch one sample of each series for the running machines in
+        machine_ids (all running machines, if None) with a single
+        queryMetricsData call.  Returns {machine id: {series: value}}."""
+        vbox = VBoxWrapper()
+        by_id = vbox.machines_by_id
+        if machine_ids is None:
+            online = running_states()
+            machine_ids = [mach_id for mach_id, machine in by_id.items()
+                           if machine.accessible and machine.state in online]
+        pairs = [(mach_id, by_id[mach_id]) for mach_id in machine_ids if mach_id in by_id]
+        samples = dict((mach_id, {}) for mach_id, machine in pairs)
+        if len(pairs) == 0:
+            return samples
+
+        # Set up collection for everything once, and then only for machines
+        # started since, whose metrics don't exist until their VM process does
+        perf = vbox.vbox.performanceCollector
+        if self._setup_ids is None:
+            perf.setupMetrics(METRIC_NAMES, [], self.period, 1)
+            self._setup_ids = set(samples.keys())
+        else:
+            new = [machine for mach_id, machine in pairs if mach_id not in self._setup_ids]
+            if len(new) > 0:
+                perf.setupMetrics(METRIC_NAMES, new, self.period, 1)
+                self._setup_ids.update(samples.keys())
+
+        data, names, objects, units, scales, seqs, indices, lengths = \
+                perf.queryMetricsData(METRIC_NAMES, [machine for mach_id, machine in pairs])
+        # Each machine has a row per metric, and asking a row's object for
+        # its id is a round trip, so ids are looked up once per object.
+        # Only this query's objects are kept, in case the binding hands out
+        # new ones every time.
+        known = self._object_ids
+        object_ids = {}
+        raw = {}
+        for idx in range(len(names)):
+            if lengths[idx] == 0:
+                continue
+            obj = objects[idx]
+            mach_id = object_ids.get(obj) or known.get(obj)
+            if mach_id is None:
+                mach_id = vbox.mgr.queryInterface(obj, 'IMachine').id
+            object_ids[obj] = mach_id
+            value = data[indices[idx] + lengths[idx] - 1] / float(scales[idx])
+            raw.setdefault(mach_id, {})[names[idx]] = value
+        self._object_ids = object_ids
+
+        for mach_id, values in raw.items():
+            get = lambda name: values.get(name, NO_VALUE)
+            total = get(u'Guest/RAM/Usage/Total')
+            samples[mach_id] = {
+                'cpu': get(u'Guest/CPU/Load/User') + get(u'Guest/CPU/Load/Kernel'),
+                'ram_used': total - get(u'Guest/RAM/Usage/Free'),
+                'ram_total': total,
+                'net_rx': get(u'Net/Rate/Rx'),
+                'net_tx': get(u'Net/Rate/Tx')
+            }
+        return samples
+
+    def add_samples(self, samples, complete=False):
+        """Append the result of a query().  If complete is set, samples
+        covers every running machine."""
+        if complete or self.running is None:
+            self.running = set(samples.keys())
+        for mach_id, values in samples.items():
+            if mach_id not in self.running:
+                continue
+            series = self.history.get(mach_id)
+            if series is None:
+                series = dict((name, RingBuffer(self.history_size)) for name in SERIES)
+                self.history[mach_id] = series
+            for name in SERIES:
+                series[name].append(values.get(name, NO_VALUE))
+        for mach_id in list(self.history.keys()):
+            if mach_id not in self.running:
+                del self.history[mach_id]
+
+    def get(self, mach_id, name):
+        """Returns the RingBuffer for one series, or None if the machine
+        isn't running"""
+        series = self.history.get(mach_id)
+        if series is None:
+            return None
+        return series[name]
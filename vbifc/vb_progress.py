@@ -0,0 +1,96 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from . import VBoxWrapper
+
+class TrackedProgress(object):
+    def __init__(self, progress, description, done=None):
+        self.progress = progress
+        self.description = description
+        self.done = done
+        self.percent = 0
+        self.completed = False
+        self.error = None
+
+    def update(self):
+        # Returns True once the operation has finished
+        if self.progress.completed:
+            self.completed = True
+            self.percent = 100
+            if int(self.progress.resultCode) != 0:
+                err = self.progress.errorInfo
+                if err is not None:
+                    self.error = _(u"Error in module '{}': {}").format(err.component, err.text)
+                else:
+                    self.error = _(u'Operation failed')
+        else:
+            self.percent = self.progress.percent
+        return self.completed
+
+    def cancel(self):
+        if self.progress.cancelable:
+            self.progress.cancel()
+
+
+class ProgressTracker(object):
+    """Tracks any number of in-flight IProgress objects without blocking.
+    The owner is expected to call poll() periodically."""
+
+    def __init__(self):
+        self.operations = []
+
+    def add(self, progress, description, done=None):
+        """Track progress; done(op) is called from poll() once it finishes,
+        with op.error set to a message if it failed."""
+        return self.track(TrackedProgress(progress, description, done))
+
+    def track(self, op):
+        # Anything with the same update()/percent/done/error interface as
+        # TrackedProgress can be tracked, e.g. a vb_jobs.BulkOperation
+        self.operations.append(op)
+        return op
+
+    @property
+    def busy(self):
+        return len(self.operations) > 0
+
+    @property
+    def percent(self):
+        if len(self.operations) == 0:
+            return 0
+        return sum(op.percent for op in self.operations) // len(self.operations)
+
+    def poll(self):
+        finished = []
+        for op in self.operations:
+            try:
+                if op.update():
+                    finished.append(op)
+            except Exception as ex:
+                op.completed = True
+                op.error = VBoxWrapper().exceptMessage(ex)
+                finished.append(op)
+        for op in finished:
+            self.operations.remove(op)
+        for op in finished:
+            if op.done is not None:
+                op.done(op)
+        return finished
+
+    def cancel_all(self):
+        for op in self.operations:
+            op.cancel()
@@ -0,0 +1,136 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import re
+import json
+import errno
+import threading
+
+from . import VBoxWrapper, get_host, cache_path
+
+# Enums whose values vb_enum describes
+ENUMS = ['AudioControllerType', 'AudioDriverType', 'DeviceType', 'MachineState',
+         'MediumState', 'MediumType', 'NetworkAdapterType', 'NetworkAttachmentType',
+         'ParavirtProvider', 'PortMode', 'StorageBus']
+
+FORMAT = 1
+
+def default_path(version):
+    return cache_path('registry-{}.json'.format(re.sub(r'[^\w.-]', '_', version)))
+
+
+class Registry(object):
+    """Metadata which is fixed for a given VirtualBox version: the values of
+    the enums we describe, and the guest OS type descriptions.  This is
+    saved to a file, so later runs load it in one read instead of asking
+    VirtualBox again."""
+
+    def __init__(self, version, enums, os_types):
+        self.version = version
+        # Enum name -> {value name: value}
+        self.enums = enums
+        # Guest OS type id -> description
+        self.os_types = os_types
+
+    @staticmethod
+    def build(version, host_name=None):
+        vbox = VBoxWrapper(host_name)
+        vbconst = vbox.constants
+        enums = dict((enum, dict(vbconst.all_values(enum))) for enum in ENUMS)
+        os_types = dict((os_type.id, os_type.description)
+                        for os_type in vbox.mgr.getArray(vbox.vbox, 'guestOSTypes'))
+        return Registry(version, enums, os_types)
+
+    @staticmethod
+    def load(path, version):
+        # Returns None if there's no usable registry for this version
+        try:
+            with open(path, 'rb') as reg_file:
+                data = json.load(reg_file)
+        except (IOError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get('format') != FORMAT \
+                or data.get('version') != version:
+            return None
+        return Registry(version, data['enums'], data['os_types'])
+
+    def save(self, path):
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+        # Written to the side and renamed, so another vboxcli starting up
+        # never reads half of it
+        temp_path = u'{}.{}'.format(path, os.getpid())
+        with open(temp_path, 'wb') as reg_file:
+            json.dump({'format': FORMAT, 'version': self.version, 'enums': self.enums,
+                       'os_types': self.os_types}, reg_file)
+        os.rename(temp_path, path)
+
+    def map_names(self, enum, entries):
+        """Turns {value name: item} into {value: item}.  Names this version
+        of VirtualBox doesn't have are left out."""
+        values = self.enums.get(enum, {})
+        return dict((values[name], item) for name, item in entries.items()
+                    if name in values)
+
+    def value_name(self, enum, value):
+        """The name of one of enum's values (e.g. 'PoweredOff'), or None if
+        this version of VirtualBox doesn't have it"""
+        for name, item in self.enums.get(enum, {}).items():
+            if item == value:
+                return name
+        return None
+
+    def os_type(self, type_id):
+        return self.os_types.get(type_id)
+
+
+# Version -> registry, so hosts running the same VirtualBox share one
+_registries = {}
+# Host name -> its registry
+_host_registries = {}
+_registry_lock = threading.Lock()
+
+def get_registry(host_name=None):
+    """The registry for host_name's VirtualBox (the default host's, if it
+    isn't given), loaded from the cache file if there is one, or else built
+    and saved for next time"""
+    name = get_host(host_name).name
+    registry = _host_registries.get(name)
+    if registry is not None:
+        return registry
+    with _registry_lock:
+        if name not in _host_registries:
+            vbox = VBoxWrapper(name)
+            version = u'{}-r{}'.format(vbox.vbox.version, vbox.vbox.revision)
+            registry = _registries.get(version)
+            if registry is None:
+                path = default_path(version)
+                registry = Registry.load(path, version)
+                if registry is None:
+                    registry = Registry.build(version, name)
+                    try:
+                        registry.save(path)
+                    except (IOError, OSError):
+                        # Just build it again next time
+                        pass
+                _registries[version] = registry
+            _host_registries[name] = registry
+        return _host_registries[name]
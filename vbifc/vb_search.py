@@ -0,0 +1,171 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from collections import OrderedDict
+
+from . import VBoxWrapper, host_names
+import vb_enum
+import vb_text
+
+# Field names usable as "name:foo" in a query, in index order
+SEARCH_FIELDS = ['name', 'id', 'os', 'group', 'state', 'desc', 'host']
+
+class MachineSearchIndex(object):
+    """In-memory text index over every registered machine, so searching
+    doesn't need to go back out to VBoxSVC.  The index can be built on a
+    worker thread, and is then updated one machine at a time as machines
+    change."""
+
+    # Number of recent query results kept, so deleting a character (or
+    # retyping one) doesn't search again
+    CACHED_RESULTS = 16
+
+    def __init__(self):
+        self._fields = {}
+        self._text = {}
+        self._results = OrderedDict()
+
+    def build(self):
+        self._fields = {}
+        self._text = {}
+        for vbox in self._connected():
+            for mach_id, machine in vbox.machines_by_id.items():
+                self._add(vbox, mach_id, machine)
+        self._results.clear()
+
+    def sync(self):
+        """Add machines that were registered and drop those that went away
+        since the index was built, e.g. after the machine list is reloaded"""
+        known = set(self._fields)
+        for vbox in self._connected():
+            machines = vbox.machines_by_id
+            for mach_id in set(machines) - known:
+                self._add(vbox, mach_id, machines[mach_id])
+            known -= set(machines)
+        for mach_id in known:
+            self.remove(mach_id)
+        self._results.clear()
+
+    @staticmethod
+    def _connected():
+        return [VBoxWrapper(name) for name in host_names() if VBoxWrapper.connected(name)]
+
+    def _add(self, vbox, mach_id, machine):
+        groups = u' '.join(vbox.groups_by_id.get(mach_id, []))
+        try:
+            if not machine.accessible:
+                fields = [u'', mach_id, u'', groups, u'', u'', vbox.host_name]
+            else:
+                fields = [machine.name, mach_id, vb_text.get_os_type(machine, vbox.host_name),
+                          groups, vb_enum.MachineState_text(machine.state, vbox.host_name),
+                          machine.description, vbox.host_name]
+        except Exception:
+            # Probably unregistered while we were looking at it
+            self.remove(mach_id)
+            return
+        fields = [field.lower() for field in fields]
+        self._fields[mach_id] = fields
+        self._text[mach_id] = u'\n'.join(fields)
+
+    def update(self, mach_id):
+        vbox = VBoxWrapper.for_machine(mach_id)
+        machine = vbox.machines_by_id.get(mach_id)
+        if machine is None:
+            self.remove(mach_id)
+        else:
+            self._add(vbox, mach_id, machine)
+        self._results.clear()
+
+    def update_state(self, mach_id, state):
+        fields = self._fields.get(mach_id)
+        if fields is not None:
+            fields[4] = vb_enum.MachineState_text(
+                state, VBoxWrapper.machine_host(mach_id)).lower()
+            self._text[mach_id] = u'\n'.join(fields)
+            self._results.clear()
+
+    def remove(self, mach_id):
+        self._fields.pop(mach_id, None)
+        self._text.pop(mach_id, None)
+        self._results.clear()
+
+    def __len__(self):
+        return len(self._fields)
+
+    @staticmethod
+    def parse_query(query):
+        """Split query into (field index or None, term) pairs.  Terms are
+        matched case-insensitively, and all of them must match."""
+        terms = []
+        for word in query.lower().split():
+            field, sep, term = word.partition(u':')
+            if sep and field in SEARCH_FIELDS:
+                if term:
+                    terms.append((SEARCH_FIELDS.index(field), term))
+            else:
+                terms.append((None, word))
+        return terms
+
+    def search(self, query):
+        """Returns the set of ids of machines matching query.  The set is
+        shared with later searches for the same query, so don't modify it."""
+        terms = tuple(self.parse_query(query))
+        result = self._results.get(terms)
+        if result is None:
+            result = self._search(terms)
+            if len(self._results) >= self.CACHED_RESULTS:
+                self._results.popitem(last=False)
+            self._results[terms] = result
+        return result
+
+    def _search(self, terms):
+        if len(terms) == 0:
+            return set(self._fields)
+
+        # While typing, each query usually just narrows an earlier one, so
+        # only that one's matches need to be checked again
+        candidates = None
+        for old_terms, old_result in self._results.items():
+            if self._narrows(old_terms, terms) \
+                    and (candidates is None or len(old_result) < len(candidates)):
+                candidates = old_result
+        if candidates is None:
+            candidates = self._text.keys()
+
+        text = self._text
+        fields = self._fields
+        for field, term in terms:
+            if field is None:
+                candidates = [mach_id for mach_id in candidates if term in text[mach_id]]
+            else:
+                candidates = [mach_id for mach_id in candidates
+                              if term in fields[mach_id][field]]
+        return set(candidates)
+
+    @staticmethod
+    def _narrows(old_terms, terms):
+        # True if everything matching terms must also match old_terms
+        return len(old_terms) <= len(terms) \
+            and all(new[0] == old[0] and old[1] in new[1]
+                    for old, new in zip(old_terms, terms))
+
+
+def build_index():
+    """Returns a MachineSearchIndex of every machine, e.g. for a worker"""
+    index = MachineSearchIndex()
+    index.build()
+    return index
@@ -0,0 +1,92 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import threading
+from collections import OrderedDict
+
+from . import VBoxWrapper, VBoxConstants
+
+class SessionManager(object):
+    """Bounded pool of shared sessions on running machines, so repeated
+    console operations don't need to lock the machine from scratch each
+    time.  Sessions are unlocked when evicted, released or closed."""
+
+    def __init__(self, max_sessions=16):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, machine):
+        """Returns a shared session locked on machine.  The session stays
+        owned by the manager, so callers must not unlock it themselves."""
+        mach_id = machine.id
+        vbox = VBoxWrapper.for_machine(mach_id)
+        vbconst = vbox.constants
+        with self._lock:
+            session = self._sessions.pop(mach_id, None)
+        if session is not None and session.state != vbconst.SessionState_Locked:
+            session = None
+
+        if session is None:
+            session = vbox.getSession()
+            machine.lockMachine(session, vbconst.LockType_Shared)
+            if session.state != vbconst.SessionState_Locked:
+                raise RuntimeError(_(u'Could not lock session'))
+
+        with self._lock:
+            self._sessions[mach_id] = session
+            evicted = []
+            while len(self._sessions) > self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[1])
+        for old_session in evicted:
+            self._unlock(old_session)
+        return session
+
+    def release(self, machine_id):
+        with self._lock:
+            session = self._sessions.pop(machine_id, None)
+        if session is not None:
+            self._unlock(session)
+
+    def release_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            self._unlock(session)
+
+    def _unlock(self, session):
+        vbconst = VBoxConstants()
+        try:
+            if session.state == vbconst.SessionState_Locked:
+                session.unlockMachine()
+        except Exception:
+            # The machine or VBoxSVC may already be gone; either way the
+            # session is no longer ours to worry about
+            pass
+
+
+_session_manager = SessionManager()
+
+def shared_session(machine):
+    return _session_manager.acquire(machine)
+
+def release_session(machine_id):
+    _session_manager.release(machine_id)
+
+def release_all_sessions():
+    _session_manager.release_all()
@@ -0,0 +1,103 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import time
+
+from . import VBoxWrapper, VBoxConstants
+import vb_jobs
+
+class SnapshotInfo(object):
+    """The parts of a snapshot the tree shows, read once when the snapshot's
+    parent is expanded, so redrawing never goes back to VBoxSVC"""
+
+    __slots__ = ['snapshot', 'host_name', 'id', 'name', 'time_stamp', 'online',
+                 'child_count']
+
+    def __init__(self, snapshot, host_name=None):
+        self.snapshot = snapshot
+        self.host_name = host_name
+        self.id = snapshot.id
+        self.name = snapshot.name
+        # Milliseconds since the epoch
+        self.time_stamp = snapshot.timeStamp
+        # Taken while the machine was running, so it includes a saved state
+        self.online = snapshot.online
+        self.child_count = snapshot.getChildrenCount()
+
+    def children(self):
+        if self.child_count == 0:
+            return []
+        snapshots = VBoxWrapper(self.host_name).mgr.getArray(self.snapshot, 'children')
+        return [SnapshotInfo(snapshot, self.host_name) for snapshot in snapshots]
+
+    def format_time(self):
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.time_stamp / 1000.0))
+
+
+def root_snapshot(machine, host_name=None):
+    # Returns None if the machine has no snapshots
+    if machine.snapshotCount == 0:
+        return None
+    return SnapshotInfo(machine.findSnapshot(u''), host_name)
+
+def current_snapshot_path(machine):
+    """Ids of the snapshots from the root down to the current one.  This
+    walks up the whole chain, so it's only done when asked for."""
+    path = []
+    snapshot = machine.currentSnapshot
+    while snapshot is not None:
+        path.append(snapshot.id)
+        snapshot = snapshot.parent
+    path.reverse()
+    return path
+
+def snapshot_states(command, host_name=None):
+    """Returns the set of machine states in which command may be run on
+    host_name"""
+    vbconst = VBoxConstants(host_name)
+    stopped = {vbconst.MachineState_PoweredOff, vbconst.MachineState_Aborted,
+               vbconst.MachineState_Saved}
+    if command == 'restore':
+        return stopped
+    elif command in {'take', 'delete'}:
+        return stopped | {vbconst.MachineState_Running, vbconst.MachineState_Paused}
+    raise ValueError(u'Unsupported command: {}'.format(command))
+
+def begin_snapshot_command(machine, command, snapshot_id=None, name=u'', description=u''):
+    """Start taking, restoring or deleting a snapshot.  Like
+    vb_jobs.begin_command, returns (progress, cleanup), and cleanup must be
+    called once progress has completed."""
+    vbox = VBoxWrapper.for_machine(machine.id)
+    vbconst = vbox.constants
+    session = vbox.getSession()
+    machine.lockMachine(session, vbconst.LockType_Shared)
+    cleanup = lambda: vb_jobs.unlock_session(session)
+    try:
+        # Snapshots are changed through the session's mutable machine
+        mutable = session.machine
+        if command == 'take':
+            progress, snapshot_id = mutable.takeSnapshot(name, description, False)
+        elif command == 'restore':
+            progress = mutable.restoreSnapshot(mutable.findSnapshot(snapshot_id))
+        elif command == 'delete':
+            progress = mutable.deleteSnapshot(snapshot_id)
+        else:
+            raise ValueError(u'Unsupported command: {}'.format(command))
+    except:
+        cleanup()
+        raise
+    return progress, cleanup
@@ -15,8 +15,12 @@
 # along with vboxcli; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-from . import VBoxWrapper, VBoxConstants
+import time
+import threading
+
+from . import VBoxWrapper, VBoxConstants, get_host
 import vb_enum
+from vb_registry import get_registry
 
 def format_size(size):
     if size < 1024:
@@ -32,26 +36,27 @@ def format_size(size):
     else:
         return u'{:.2f} PiB'.format(size / float(1024**5))
 
-def get_os_type(machine):
-    vbox = VBoxWrapper()
-    os_type = vbox.vbox.getGuestOSType(machine.OSTypeId)
-    if os_type is None:
+def get_os_type(machine, host_name=None):
+    # Guest OS types are looked up in the machine's own host's registry, as
+    # another host's VirtualBox may not know them
+    description = get_registry(host_name).os_type(machine.OSTypeId)
+    if description is None:
         return _(u'Unknown')
-    return os_type.description
+    return description
 
-def get_boot_order(machine):
-    vbox = VBoxWrapper()
+def get_boot_order(machine, host_name=None):
+    vbox = VBoxWrapper(host_name)
     maxBootOrder = vbox.systemProperties.maxBootPosition
     text = []
     for i in range(maxBootOrder):
-        devname = vb_enum.DeviceType_text(machine.getBootOrder(i + 1))
+        devname = vb_enum.DeviceType_text(machine.getBootOrder(i + 1), host_name)
         if devname != u'':
             text.append(devname)
     return u', '.join(text)
 
-def get_accel_summary(machine):
-    vbox = VBoxWrapper()
-    vbconst = VBoxConstants()
+def get_accel_summary(machine, host_name=None):
+    vbox = VBoxWrapper(host_name)
+    vbconst = vbox.constants
     desc = []
     if vbox.host.getProcessorFeature(vbconst.ProcessorFeature_HWVirtEx):
         if machine.getHWVirtExProperty(vbconst.HWVirtExPropertyType_Enabled):
@@ -60,14 +65,14 @@ def get_accel_summary(machine):
                 desc.append(_(u'Nested Paging'))
     if machine.getCPUProperty(vbconst.CPUPropertyType_PAE):
         desc.append(_(u'PAE/NX'))
-    pvirt = vb_enum.ParavirtProvider_text(machine.getEffectiveParavirtProvider())
+    pvirt = vb_enum.ParavirtProvider_text(machine.getEffectiveParavirtProvider(), host_name)
     if pvirt != u'':
         desc.append(_(u'{} Paravirtualization').format(pvirt))
     return u', '.join(desc)
 
-def get_storage_slot_name(bus, port, device):
-    vbconst = VBoxConstants()
-    text = [vb_enum.StorageBus_text(bus)]
+def get_storage_slot_name(bus, port, device, host_name=None):
+    vbconst = VBoxConstants(host_name)
+    text = [vb_enum.StorageBus_text(bus, host_name)]
     if bus == vbconst.StorageBus_IDE:
         if port == 0:
             text.append(_(u'Primary'))
@@ -87,8 +92,98 @@ def get_storage_slot_name(bus, port, device):
         text.append(_(u'Port {}').format(port))
     return u' '.join(text)
 
-def get_attachment_desc(attachment):
-    vbconst = VBoxConstants()
+class MediumInfo(object):
+    """The properties of a medium that storage descriptions need.  Media are
+    shared between machines (e.g. an install ISO), and rarely change, so
+    these are cached rather than read again for every attachment."""
+
+    __slots__ = ['stamp', 'name', 'description', 'location', 'host_drive',
+                 'device_type', 'type', 'state', 'size', 'logical_size', 'encrypted']
+
+    def __init__(self, medium, stamp, host_name=None):
+        vbconst = VBoxConstants(host_name)
+        self.stamp = stamp
+        self.name = medium.name
+        self.host_drive = medium.hostDrive
+        if self.host_drive:
+            self.description = medium.description
+            self.location = medium.location
+            return
+
+        self.device_type = medium.deviceType
+        self.state = medium.state
+        if self.device_type == vbconst.DeviceType_HardDisk:
+            self.type = medium.type
+            self.logical_size = medium.logicalSize
+            # Encrypted media carry a key id property.  Asking for the list
+            # of properties avoids getEncryptionSettings(), which fails (at
+            # the cost of a round trip for the error) on every other disk.
+            names, values = medium.getProperties(None)
+            self.encrypted = u'CRYPT/KeyId' in names
+        else:
+            self.size = medium.size
+
+
+# (host name, medium id) -> MediumInfo.  Entries are dropped on medium
+# events, and in case one is missed, they also expire.  Workers fill the
+# cache while the main loop invalidates it, so an info fetched before an
+# invalidation (per medium, or of everything) isn't stored after it.
+_medium_cache = {}
+_medium_generation = {}
+_medium_cache_generation = 0
+_medium_lock = threading.Lock()
+MEDIUM_CACHE_TTL = 30
+# Past this many entries, expired ones are pruned
+MEDIUM_CACHE_SIZE = 4096
+
+def _prune_medium_cache(now):
+    # Called with _medium_lock held
+    global _medium_cache_generation
+    if len(_medium_cache) > MEDIUM_CACHE_SIZE:
+        for key, info in list(_medium_cache.items()):
+            if now - info.stamp > MEDIUM_CACHE_TTL:
+                del _medium_cache[key]
+    if len(_medium_generation) > MEDIUM_CACHE_SIZE:
+        # Dropping single counts could let a fetch from before their
+        # invalidation match again, so start them all over instead.
+        # Bumping the global count keeps any fetch in progress from being
+        # stored.
+        _medium_generation.clear()
+        _medium_cache_generation += 1
+
+def get_medium_info(medium, host_name=None):
+    vbconst = VBoxConstants(host_name)
+    now = time.time()
+    key = (get_host(host_name).name, medium.id)
+    with _medium_lock:
+        info = _medium_cache.get(key)
+        generation = (_medium_cache_generation, _medium_generation.get(key, 0))
+    if info is None or now - info.stamp > MEDIUM_CACHE_TTL:
+        info = MediumInfo(medium, now, host_name)
+        # Media still being checked will have news soon
+        if info.host_drive or info.state != vbconst.MediumState_NotCreated:
+            with _medium_lock:
+                if generation == (_medium_cache_generation,
+                                  _medium_generation.get(key, 0)):
+                    _medium_cache[key] = info
+                    _prune_medium_cache(now)
+    return info
+
+def invalidate_medium_info(medium_id=None, host_name=None):
+    global _medium_cache_generation
+    with _medium_lock:
+        if medium_id is None:
+            _medium_cache.clear()
+            _medium_generation.clear()
+            _medium_cache_generation += 1
+        else:
+            key = (get_host(host_name).name, medium_id)
+            _medium_cache.pop(key, None)
+            _medium_generation[key] = _medium_generation.get(key, 0) + 1
+            _prune_medium_cache(time.time())
+
+def get_attachment_desc(attachment, host_name=None):
+    vbconst = VBoxConstants(host_name)
     if attachment.type == vbconst.DeviceType_DVD:
         text = _(u'[Optical Drive]') + u' '
     else:
@@ -101,45 +196,40 @@ def get_attachment_desc(attachment):
     if medium is None:
         return text + _(u'Empty')
 
-    if medium.hostDrive:
-        if medium.description == u'':
-            text += _(u"Host Drive '{}'").format(medium.location)
+    info = get_medium_info(medium, host_name)
+    if info.host_drive:
+        if info.description == u'':
+            text += _(u"Host Drive '{}'").format(info.location)
         else:
-            text += _(u'Host Drive {} ({})').format(medium.description, medium.name)
+            text += _(u'Host Drive {} ({})').format(info.description, info.name)
         return text
 
-    text += medium.name
+    text += info.name
     details = []
-    devType = medium.deviceType
-    if devType == vbconst.DeviceType_HardDisk:
-        details.append(vb_enum.MediumType_text(medium.type))
-        try:
-            medium.getEncryptionSettings()
-            encrypted = True
-        except:
-            encrypted = False
-        if encrypted:
+    is_hard_disk = info.device_type == vbconst.DeviceType_HardDisk
+    if is_hard_disk:
+        details.append(vb_enum.MediumType_text(info.type, host_name))
+        if info.encrypted:
             details.append(_(u'Encrypted'))
 
-    mstate = medium.state
-    if mstate == vbconst.MediumState_NotCreated:
+    if info.state == vbconst.MediumState_NotCreated:
         details.append(_(u'Checking...'))
-    elif mstate == vbconst.MediumState_Inaccessible:
+    elif info.state == vbconst.MediumState_Inaccessible:
         details.append(_(u'Inaccessible'))
-    elif devType == vbconst.DeviceType_HardDisk:
-        details.append(format_size(medium.logicalSize))
+    elif is_hard_disk:
+        details.append(format_size(info.logical_size))
     else:
-        details.append(format_size(medium.size))
+        details.append(format_size(info.size))
     return u'{} ({})'.format(text, u', '.join(details))
 
-def get_network_adapter_desc(adapter):
+def get_network_adapter_desc(adapter, host_name=None):
     if not adapter.enabled:
         return u''
 
-    vbconst = VBoxConstants()
-    text = vb_enum.NetworkAdapterType_text(adapter.adapterType)
+    vbconst = VBoxConstants(host_name)
+    text = vb_enum.NetworkAdapterType_text(adapter.adapterType, host_name)
     at_type = adapter.attachmentType
-    details = [vb_enum.NetworkAttachmentType_text(at_type)]
+    details = [vb_enum.NetworkAttachmentType_text(at_type, host_name)]
     if at_type == vbconst.NetworkAttachmentType_Bridged:
         details.append(adapter.bridgedInterface)
     elif at_type == vbconst.NetworkAttachmentType_Internal:
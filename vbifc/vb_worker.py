@@ -0,0 +1,102 @@
+# This file is part of vboxcli
+# Copyright (C) 2016  Michael Hansen
+#
+# vboxcli is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# vboxcli is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with vboxcli; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import threading
+from collections import deque
+
+from . import VBoxWrapper
+
+class WorkerJob(object):
+    def __init__(self, func, args, done, tag):
+        self.func = func
+        self.args = args
+        self.done = done
+        self.tag = tag
+        self.cancelled = False
+
+    def cancel(self):
+        # A job which is already running can't be interrupted, but its
+        # result will be thrown away instead of being delivered
+        self.cancelled = True
+
+
+class Worker(threading.Thread):
+    """Runs VirtualBox calls on a background thread.  Results are handed to
+    the post function (which must be safe to call from any thread) as
+    done(job, result, error), so they can be delivered on the UI thread."""
+
+    def __init__(self, post, name=None):
+        super(Worker, self).__init__(name=name)
+        self.daemon = True
+        self.post = post
+        self._jobs = deque()
+        self._cond = threading.Condition()
+        self._current = None
+        self._stopping = False
+
+    def submit(self, func, args=(), done=None, tag=None):
+        """Queue func(*args) to run on the worker.  If a tag is given, any
+        earlier jobs with the same tag are cancelled, so only the most recent
+        request for that tag produces a result."""
+        job = WorkerJob(func, args, done, tag)
+        with self._cond:
+            if tag is not None:
+                for old_job in self._jobs:
+                    if old_job.tag == tag:
+                        old_job.cancel()
+                if self._current is not None and self._current.tag == tag:
+                    self._current.cancel()
+                self._jobs = deque(old_job for old_job in self._jobs
+                                   if not old_job.cancelled)
+            self._jobs.append(job)
+            self._cond.notify()
+        return job
+
+    def run(self):
+        vbox = VBoxWrapper()
+        vbox.mgr.initPerThread()
+        try:
+            while True:
+                with self._cond:
+                    while len(self._jobs) == 0 and not self._stopping:
+                        self._cond.wait()
+                    if self._stopping:
+                        break
+                    job = self._jobs.popleft()
+                    self._current = job
+
+                result = None
+                error = None
+                try:
+                    result = job.func(*job.args)
+                except Exception as ex:
+                    error = ex
+
+                with self._cond:
+                    self._current = None
+                if job.done is not None and not job.cancelled:
+                    self.post(job.done, job, result, error)
+        finally:
+            vbox.mgr.deinitPerThread()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            for job in self._jobs:
+                job.cancel()
+            self._jobs.clear()
+            self._cond.notify()
@@ -17,22 +17,60 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import sys
+import time
+import argparse
 import gettext
-import urwid
-
-from vbcui import top_ui, VBCUIEventLoop
-from vbifc import VBoxWrapper
 
 def main(argv):
+    start = time.time()
     gettext.install('vboxcli', unicode=True)
 
-    # Ensure this gets set up before we start doing curses stuff that might
-    # mess with the initial output
-    vbox = VBoxWrapper()
+    # Batch subcommands must work without urwid, so dispatch them before
+    # anything from the UI gets imported
+    import vbcmd
+    if len(argv) > 1 and argv[1] in vbcmd.COMMANDS:
+        return vbcmd.main(argv[1:])
+
+    parser = argparse.ArgumentParser(description=_(u'Curses UI for VirtualBox'),
+                                     epilog=_(u'Batch commands: {} (see vboxcli.py <command> -h)')
+                                            .format(u', '.join(vbcmd.COMMANDS)))
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help=_(u'Number of machines to act on at once in bulk operations'))
+    parser.add_argument('--startup-timings', action='store_true',
+                        help=_(u'Report how long each startup phase took on exit'))
+    parser.add_argument('--hosts', metavar='FILE',
+                        help=_(u'JSON list of vboxwebsrv hosts to show alongside the '
+                               u'local machines (default: ~/.config/vboxcli/hosts.json)'))
+    parser.add_argument('--no-local', action='store_true',
+                        help=_(u'Only show the hosts from the hosts file'))
+    args = parser.parse_args(argv[1:])
+
+    from vbifc import vb_hosts
+    try:
+        vb_hosts.load_hosts(args.hosts or vb_hosts.default_config_path(),
+                            local=not args.no_local)
+    except (IOError, ValueError, KeyError) as ex:
+        sys.stderr.write((_(u'Could not read the hosts file: {}').format(ex) + u'\n')
+                         .encode('utf-8'))
+        return 1
 
-    ui = top_ui.TopUI()
+    import urwid
+    from vbcui import top_ui, VBCUIEventLoop, StartupTimings
+    timings = StartupTimings(start) if args.startup_timings else None
+    if timings is not None:
+        timings.mark(_(u'Imports'))
+
+    # The VirtualBox connection is only made once the UI has been painted,
+    # so that a slow VBoxSVC doesn't leave a blank terminal
+    ui = top_ui.TopUI(max_jobs=args.jobs)
     loop = VBCUIEventLoop(urwid.AttrMap(ui, 'default'))
+    loop.timings = timings
+    loop.after_first_paint(ui.connect)
     loop.run()
+
+    if timings is not None:
+        for line in timings.report():
+            sys.stderr.write((line + u'\n').encode('utf-8'))
     return 0
 
 if __name__ == '__main__':